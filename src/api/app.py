@@ -1,14 +1,18 @@
 from api.model import NotFoundException
 from core import str_to_bool
+from core.metrics import Metrics
 from core.settings import ENABLE_LLM_PATH, ROOT_PATH
 from config.config_loader import ConfigLoader
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 
 from application_startup import Application
 from api.routes.v1.conversations import (
     ConversationAPI,
     ConvesationAPIConfig,
 )
+from api.routes.v1.courses import CourseAPI, CourseAPIConfig
+from api.routes.v1.ingestion import IngestionAPI
 
 Application.Instance().startup()
 config_loader = ConfigLoader.get_instance()
@@ -34,26 +38,51 @@ app = FastAPI(
 
 # PUBLISHED version 1 of the API
 v1 = FastAPI()
+start_llm_path = str_to_bool(config_loader.get_value(ENABLE_LLM_PATH))
 conversationAPI = ConversationAPI(
-    config=ConvesationAPIConfig(
-        start_llm_path=str_to_bool(config_loader.get_value(ENABLE_LLM_PATH))
-    )
+    config=ConvesationAPIConfig(start_llm_path=start_llm_path)
 )
 
 v1.include_router(
     conversationAPI.get_rounter(), tags=["Conversation"], prefix="/conversations"
 )
+v1.include_router(
+    CourseAPI(config=CourseAPIConfig(start_llm_path=start_llm_path)).get_rounter(),
+    tags=["Course"],
+    prefix="/courses",
+)
+if start_llm_path:
+    v1.include_router(
+        IngestionAPI().get_rounter(), tags=["Ingestion"], prefix="/ingestion"
+    )
 # v1.include_router(MoodleRouter, tags=["Moodle"], prefix="/moodle")
 
 # mount the playground and v1 routers
 app.mount("/v1", v1)
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await Application.Instance().shutdown()
+
+
 @app.get("/", tags=["Root"])
 async def read_root():
     return {"message": "Welcome to this fantastic app!"}
 
 
+@app.get("/metrics", tags=["Root"])
+async def read_metrics():
+    return Metrics.snapshot()
+
+
+@app.get("/ready", tags=["Root"])
+async def read_ready():
+    if not Application.Instance().is_ready():
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
+
+
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
     try:
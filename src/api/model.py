@@ -51,6 +51,7 @@ class ResponseMessage(BaseModel):
     response: str
     timestamp: float
     nodes: list[Node]
+    pendingJobs: list[PyObjectId] = Field(default=[])
 
 
 class Conversation(BaseModel):
@@ -77,3 +78,80 @@ class Conversation(BaseModel):
 class MessageRequest(BaseModel):
     message: str = Field(...)
     model: str = Field(...)
+
+
+class IngestionJobStatus(Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class IngestionJobPriority(Enum):
+    low = 0
+    high = 1
+
+
+class IngestionJob(BaseModel):
+    """
+    Persistent job to download, convert and embed a single moodle file.
+    """
+
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    fileId: str = Field(...)
+    courseId: str | None = Field(default=None)
+    status: str = Field(default=IngestionJobStatus.queued.value)
+    error: str | None = Field(default=None)
+    attempts: int = Field(default=0)
+    priority: int = Field(default=IngestionJobPriority.high.value)
+    timestamp: float = Field(...)
+    updated: float | None = Field(default=None)
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "fileId": "2",
+                    "courseId": "1",
+                    "status": "queued",
+                    "timestamp": 1712547200.0,
+                }
+            ]
+        }
+    }
+
+
+class IngestionProgress(BaseModel):
+    """
+    Ingestion state of all files of a course.
+    Files without any job are counted as missing.
+    """
+
+    courseId: str
+    total: int = Field(default=0)
+    queued: int = Field(default=0)
+    running: int = Field(default=0)
+    done: int = Field(default=0)
+    failed: int = Field(default=0)
+    missing: int = Field(default=0)
+    failedFileIds: list[str] = Field(default=[])
+
+
+class FileState(BaseModel):
+    """
+    Last known version of a moodle file.
+    Used for conditional downloads and to detect files that changed or were never indexed.
+    """
+
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    fileId: str = Field(...)
+    filename: str | None = Field(default=None)
+    etag: str | None = Field(default=None)
+    lastModified: str | None = Field(default=None)
+    size: int | None = Field(default=None)
+    sha256: str | None = Field(default=None)
+    pageFingerprints: list[str] = Field(default=[])
+    indexed: bool = Field(default=False)
+    courseIds: list[str] = Field(default=[])
+    checked: float | None = Field(default=None)
+    updated: float | None = Field(default=None)
@@ -13,12 +13,10 @@ from fastapi import APIRouter
 from llama_index.core.llms import ChatMessage, MessageRole
 from pydantic import BaseModel
 from usecases.conversation_usecases import ConversationUsecases
-from usecases.convert_pdf_to_markdown import PdfConverterUsecase
 from usecases.download_file_from_moodle import MoodleUsecase
 from usecases.ask_llm import AskLLMUsecase
+from usecases.ingestion_usecases import IngestionUsecases
 from usecases.llm import LLMResponse
-from usecases.model.dto import Document
-from usecases.vector_db import VectorDBUsecases
 
 logger = logging.getLogger(__name__)
 
@@ -161,7 +159,7 @@ class ConversationAPI:
                 logging.info(
                     "Getting files for course: ", conversation.context.courseId
                 )
-                file_ids = MoodleUsecase.Instance().get_file_ids_to_course(
+                file_ids = await MoodleUsecase.Instance().get_file_ids_to_course(
                     course_id=conversation.context.courseId
                 )
 
@@ -174,24 +172,20 @@ class ConversationAPI:
             # appand the user message to the conversation
             conversation.messages.append(user_message)
 
-            # download the files and convert them to markdown and store them in the vector db
-            for file_id in file_ids:
-                file = MoodleUsecase.Instance().download_file(file_id=file_id)
-                if file.has_been_downloaded:
-                    metadata = {
-                        "course_id": conversation.context.courseId,
-                        "file_id": file_id,
-                        "filename": file.org_filename,
-                    }
-                    pages = PdfConverterUsecase.Instance().run(file=file.local_filename)
-
-                    VectorDBUsecases.Instance().store_doc(
-                        doc=Document(id=file_id, content=pages, metadata=metadata)
-                    )
+            # the files are downloaded, converted and stored by the ingestion workers
+            # the answer is based on the files that are already indexed
+            result = await IngestionUsecases.Instance().enqueue(
+                file_ids=file_ids, course_id=conversation.context.courseId
+            )
+            if result.is_error():
+                raise result.get_error()
+            pending_jobs = result.get_ok()
 
             # RAG part, consider only relevant to the conversation
+            # the current files of a course, nodes keep the ids of courses
+            # a file was removed from
             filters = {"file_id": file_ids}
-            response = AskLLMUsecase.Instance().run(
+            response = await AskLLMUsecase.Instance().run_async(
                 messages=conversation.messages, filters=filters, model=message.model
             )
 
@@ -222,4 +216,5 @@ class ConversationAPI:
                 response=response_message.response,
                 timestamp=get_posix_timestamp(),
                 nodes=response_message.nodes,
+                pendingJobs=pending_jobs,
             )
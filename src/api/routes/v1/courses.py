@@ -0,0 +1,61 @@
+import logging
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+from usecases.download_file_from_moodle import MoodleUsecase
+from usecases.ingestion_usecases import IngestionUsecases
+
+logger = logging.getLogger(__name__)
+
+
+class CourseAPIConfig(BaseModel):
+    start_llm_path: bool
+
+
+class CourseAPI:
+    """
+    API for course wide operations.
+    Allows to ingest all files of a course ahead of time,
+    so the first question in a course does not wait for the ingestion.
+    The prefetch is only available if the start_llm_path is set to True.
+    """
+
+    _config: CourseAPIConfig
+    _router: APIRouter
+
+    def __init__(self, config: CourseAPIConfig) -> None:
+        self._config = config
+        self._router = APIRouter()
+        if config.start_llm_path:
+            self.register_prefetch_api()
+        self.register_cache_api()
+
+    def get_rounter(self) -> APIRouter:
+        return self._router
+
+    def register_cache_api(self):
+        @self._router.delete("/{course_id}/files/cache")
+        async def invalidate_course_files(course_id: str):
+            invalidated = MoodleUsecase.Instance().invalidate_course(
+                course_id=course_id
+            )
+            return {"courseId": course_id, "invalidated": invalidated}
+
+    def register_prefetch_api(self):
+        @self._router.post("/{course_id}/prefetch")
+        async def prefetch_course(course_id: str):
+            result = await IngestionUsecases.Instance().prefetch_course(
+                course_id=course_id
+            )
+            if result.is_error():
+                raise result.get_error()
+            return result.get_ok()
+
+        @self._router.get("/{course_id}/prefetch")
+        async def prefetch_progress(course_id: str):
+            result = await IngestionUsecases.Instance().course_progress(
+                course_id=course_id
+            )
+            if result.is_error():
+                raise result.get_error()
+            return result.get_ok()
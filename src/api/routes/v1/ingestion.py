@@ -0,0 +1,50 @@
+import logging
+
+from fastapi import APIRouter
+from usecases.ingestion_usecases import IngestionUsecases
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionAPI:
+    """
+    API for observing the ingestion of moodle files into the vector database.
+    Jobs are created by the message endpoint and processed in the background.
+    """
+
+    _router: APIRouter
+
+    def __init__(self) -> None:
+        self._router = APIRouter()
+        self.register_job_api()
+
+    def get_rounter(self) -> APIRouter:
+        return self._router
+
+    def register_job_api(self):
+        @self._router.post("/reindex")
+        async def reindex():
+            result = await IngestionUsecases.Instance().reindex()
+            if result.is_error():
+                raise result.get_error()
+            return {"files": result.get_ok()}
+
+        @self._router.get("/jobs")
+        async def find_jobs(
+            file_id: str | None = None,
+            course_id: str | None = None,
+            status: str | None = None,
+        ):
+            result = await IngestionUsecases.Instance().find_jobs(
+                file_id=file_id, course_id=course_id, status=status
+            )
+            if result.is_error():
+                raise result.get_error()
+            return result.get_ok()
+
+        @self._router.get("/jobs/{job_id}")
+        async def get_job(job_id: str):
+            result = await IngestionUsecases.Instance().find_job(job_id=job_id)
+            if result.is_error():
+                raise result.get_error()
+            return result.get_ok()
@@ -1,50 +1,105 @@
 import asyncio
+import logging
 import os
 import threading
+from typing import Optional
 
 from core import str_to_bool
-from database.implementation import ConversationDatabase
+from database.implementation import (
+    ConversationDatabase,
+    FileStateDatabase,
+    IngestionJobDatabase,
+)
 from database.session import DatabaseConfig, MongoDatabaseSession
-from pdf_converter.pdf_converter import MarkerPDFConverter, MarkerPDFConverterConfig
+from core.metrics import Metrics
+from pdf_converter.markdown_cache import CachedPDFConverter, MarkdownCache
+from pdf_converter.process_pool_converter import (
+    ProcessPoolPDFConverter,
+    ProcessPoolPDFConverterConfig,
+)
+from pdf_converter.tiered_converter import TieredPDFConverter, TieredPDFConverterConfig
 from usecases.conversation_usecases import ConversationUsecases
 from usecases.convert_pdf_to_markdown import PdfConverterUsecase
-from usecases.llm.init_index import LLamaIndexHolder, LlamaIndexRAGConfig
-from vector_database.vectore_store import LlamaIndexVectorStore
+from usecases.ingestion_usecases import IngestionConfig, IngestionUsecases
 
 from config.config_loader import ConfigLoader
 from core.request_timer import RequestTimer
 from core.settings import (
+    AUTO_MERGE_RATIO,
     CHUNKE_OVERLAP,
     CHUNKE_SIZE,
     CONTEXT_LENGTH,
+    COURSE_CACHE_SIZE,
+    COURSE_CACHE_STALE_TTL,
+    COURSE_CACHE_TTL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MAX_MB,
     EMBEDDING_DEVICE,
+    EMBEDDING_MAX_LATENCY,
     EMBEDDING_MODEL,
     ENABLE_LLM_PATH,
     ENV_VARS,
+    INGESTION_JOB_TIMEOUT,
+    INGESTION_PAGE_BATCH_SIZE,
+    INGESTION_POLL_INTERVAL,
+    INGESTION_RECHECK_INTERVAL,
+    INGESTION_WORKER,
     MONGODB_COLLECTION,
     MONGODB_PASSWORD,
     MONGODB_SERVER,
     MONGODB_SERVER_PORT,
     MONGODB_USER,
     OLLAMA_HOST,
+    PARENT_CHUNK_SIZE,
+    PDF_CACHE_ENABLED,
+    PDF_CACHE_MAX_MB,
+    PDF_CONVERTER_MAX_RSS_MB,
+    PDF_CONVERTER_TIMEOUT,
+    PDF_CONVERTER_WORKER,
+    PDF_PAGE_BATCH_SIZE,
+    PDF_TEXT_LAYER_ENABLED,
+    PDF_TEXT_LAYER_MIN_CHARS,
+    PDF_TEXT_LAYER_MIN_QUALITY,
     QDRANT_COLLECTION,
+    QDRANT_FULL_SCAN_THRESHOLD,
+    QDRANT_HNSW_EF_CONSTRUCT,
+    QDRANT_HNSW_M,
     QDRANT_HOST,
+    QDRANT_INDEXING_THRESHOLD,
+    QDRANT_ON_DISK,
+    QDRANT_ON_DISK_PAYLOAD,
+    QDRANT_OVERSAMPLING,
     QDRANT_PORT,
+    QDRANT_QUANTIZATION,
+    QDRANT_RESCORE,
     TOP_N_COUNT_DENS,
     TOP_N_COUNT_RERANKER,
     TOP_N_COUNT_SPARSE,
     LOG_LEVEL,
     MODEL,
+    MODEL_WARMUP,
     MOODLE_API_KEY,
     MOODLE_HOST,
+    MOODLE_MAX_CONNECTIONS,
+    MOODLE_MAX_FILE_SIZE_MB,
+    MOODLE_PARALLEL_DOWNLOADS,
+    NEIGHBOR_WINDOW,
     REQUST_TIMEOUT,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL,
+    WORKER,
     init_logging,
 )
 from definitions import DATA_DIR
 from moodle.downloads import MoodleClientImplementation, MoodleConfig
-from usecases.download_file_from_moodle import MoodleUsecase
+from usecases.download_file_from_moodle import CourseCacheConfig, MoodleUsecase
 from usecases.vector_db import VectorDBUsecases
 
+logger = logging.getLogger(__name__)
+
+MODELS_READY_METRIC = "models_ready"
+
 
 class Application:
     """
@@ -58,9 +113,15 @@ class Application:
     This is a workaround to load the config before the server starts, allowing access to the config.
 
     The application itself will be started inside of fastapi.
+
+    The AI models are loaded on first use, modules that import torch only on the LLM path.
+    With MODEL_WARMUP they are loaded by a background task after the start,
+    the application is ready once the task finished.
     """
     _instance = None
     _lock = threading.Lock()
+    _ready = threading.Event()
+    _warmup_task: Optional[asyncio.Task] = None
 
     def __new__(cls):
         with cls._lock:
@@ -76,6 +137,34 @@ class Application:
     def __init__(self) -> None:
         ...
 
+    def is_ready(self) -> bool:
+        """
+        False while the models are loaded in the background.
+        """
+        return self._ready.is_set()
+
+    def _warm_up_models(self):
+        from usecases.llm.init_index import LLamaIndexHolder
+        from vector_database.vectore_store import LlamaIndexVectorStoreSession
+
+        timer = RequestTimer()
+        timer.start("Model warm-up")
+        try:
+            LLamaIndexHolder.Instance().warm_up()
+            timer.checkpoint("Load Embedding and Reranker")
+            LlamaIndexVectorStoreSession.get_instance().warm_up()
+            timer.checkpoint("Load Sparse Encoders")
+            PdfConverterUsecase.Instance().warm_up()
+            timer.checkpoint("Load PDF Converter")
+            self._set_ready()
+        except Exception as e:
+            logger.error(f"Model warm-up failed, models are loaded on first use: {e}")
+        timer.end()
+
+    def _set_ready(self):
+        self._ready.set()
+        Metrics.set(MODELS_READY_METRIC, 1)
+
     def startup_light(self):
         """
         Will only load the config and not start the application.
@@ -99,15 +188,56 @@ class Application:
         conversation_database = ConversationDatabase()
         await conversation_database.start()
         ConversationUsecases.create(database=conversation_database)
+        timer.checkpoint("Init Conversation Database")
+
+        if str_to_bool(config_loader.get_value(ENABLE_LLM_PATH)):
+            ingestion_database = IngestionJobDatabase()
+            await ingestion_database.start()
+            file_state_database = FileStateDatabase()
+            await file_state_database.start()
+            IngestionUsecases.create(
+                database=ingestion_database,
+                file_states=file_state_database,
+                config=IngestionConfig(
+                    worker=int(config_loader.get_value(INGESTION_WORKER)),
+                    poll_interval=float(
+                        config_loader.get_value(INGESTION_POLL_INTERVAL)
+                    ),
+                    job_timeout=float(config_loader.get_value(INGESTION_JOB_TIMEOUT)),
+                    recheck_interval=float(
+                        config_loader.get_value(INGESTION_RECHECK_INTERVAL)
+                    ),
+                    page_batch_size=int(
+                        config_loader.get_value(INGESTION_PAGE_BATCH_SIZE)
+                    ),
+                ),
+            )
+            await IngestionUsecases.Instance().start()
+            timer.checkpoint("Start Ingestion Workers")
+
+            if str_to_bool(config_loader.get_value(MODEL_WARMUP)):
+                self._warmup_task = asyncio.create_task(
+                    asyncio.to_thread(self._warm_up_models)
+                )
+            else:
+                self._set_ready()
+        else:
+            self._set_ready()
         timer.end()
 
+    async def shutdown(self):
+        """
+        Stops the background tasks started by the application.
+        """
+        if str_to_bool(ConfigLoader.get_instance().get_value(ENABLE_LLM_PATH)):
+            from vector_database.vectore_store import LlamaIndexVectorStoreSession
+
+            await IngestionUsecases.Instance().stop()
+            PdfConverterUsecase.Instance().close()
+            await LlamaIndexVectorStoreSession.get_instance().close()
+        await MoodleUsecase.Instance().close()
+
     def startup(self):
-        from vector_database.vectore_store import LlamaIndexVectorStoreSession
-        from usecases.ask_llm import AskLLMUsecase
-        from vector_database.vectore_store import LlamaIndexVectorStoreConfig
-        from usecases.llm.llama_index_rag_llm import (
-            LLamaIndexRAGLLM,
-        )
 
         ConfigLoader.load_config(ENV_VARS)
         config_loader = ConfigLoader.get_instance()
@@ -115,8 +245,71 @@ class Application:
         timer = RequestTimer()
         timer.start("Application startup")
 
+        if not os.path.exists(DATA_DIR):
+            os.makedirs(DATA_DIR)
+        timer.checkpoint("Created Data Dir")
+
         timer.checkpoint("MongoDB Startup")
+        Metrics.set(MODELS_READY_METRIC, 0)
         if str_to_bool(config_loader.get_value(ENABLE_LLM_PATH)):
+            # imports torch and transformers, the models themselves are loaded lazily
+            from pdf_converter.pdf_converter import (
+                MarkerPDFConverter,
+                MarkerPDFConverterConfig,
+            )
+            from usecases.ask_llm import AskLLMUsecase
+            from usecases.llm.embedding_cache import EmbeddingCache
+            from usecases.llm.init_index import (
+                LLamaIndexHolder,
+                LlamaIndexRAGConfig,
+                create_embedding,
+                embedding_dimension,
+            )
+            from usecases.llm.llama_index_rag_llm import LLamaIndexRAGLLM
+            from usecases.llm.retrieval_cache import (
+                RetrievalCache,
+                RetrievalCacheConfig,
+            )
+            from vector_database.vectore_store import (
+                LlamaIndexVectorStore,
+                LlamaIndexVectorStoreConfig,
+                LlamaIndexVectorStoreSession,
+                QdrantCollectionConfig,
+                QdrantQuantization,
+            )
+
+            embedding_cache = None
+            if str_to_bool(config_loader.get_value(EMBEDDING_CACHE_ENABLED)):
+                embedding_cache = EmbeddingCache(
+                    path=os.path.join(DATA_DIR, "embedding_cache.sqlite3"),
+                    max_bytes=int(config_loader.get_value(EMBEDDING_CACHE_MAX_MB))
+                    * 1024
+                    * 1024,
+                )
+
+            llm_config = LlamaIndexRAGConfig(
+                embedding_mode=config_loader.get_value(EMBEDDING_MODEL),
+                top_n_count_dens=int(config_loader.get_value(TOP_N_COUNT_DENS)),
+                top_n_count_sparse=int(config_loader.get_value(TOP_N_COUNT_SPARSE)),
+                top_n_count_reranker=int(config_loader.get_value(TOP_N_COUNT_RERANKER)),
+                auto_merge_ratio=float(config_loader.get_value(AUTO_MERGE_RATIO)),
+                neighbor_window=int(config_loader.get_value(NEIGHBOR_WINDOW)),
+                device=config_loader.get_value(EMBEDDING_DEVICE),
+                embedding_batch_size=int(config_loader.get_value(EMBEDDING_BATCH_SIZE)),
+                embedding_max_latency=float(
+                    config_loader.get_value(EMBEDDING_MAX_LATENCY)
+                ),
+                ollama_url=config_loader.get_value(OLLAMA_HOST),
+                llm_model=config_loader.get_value(MODEL),
+                timeout=float(config_loader.get_value(REQUST_TIMEOUT)),
+                context_window=int(config_loader.get_value(CONTEXT_LENGTH)),
+            )
+
+            # the collection is created with the dimensions of the model
+            embedding = create_embedding(llm_config)
+            vector_size = embedding_dimension(embedding, embedding_cache)
+            timer.checkpoint("Read Embedding Dimension")
+
             LlamaIndexVectorStoreSession.init_database(
                 config=LlamaIndexVectorStoreConfig(
                     qdrant_host=config_loader.get_value(QDRANT_HOST),
@@ -130,31 +323,58 @@ class Application:
                     ),
                     chunk_size=int(config_loader.get_value(CHUNKE_SIZE)),
                     chunk_overlap=int(config_loader.get_value(CHUNKE_OVERLAP)),
+                    parent_chunk_size=int(config_loader.get_value(PARENT_CHUNK_SIZE)),
                     device=config_loader.get_value(EMBEDDING_DEVICE),
-                )
+                ),
+                embedding_cache=embedding_cache,
+                collection_config=QdrantCollectionConfig(
+                    vector_size=vector_size,
+                    hnsw_m=int(config_loader.get_value(QDRANT_HNSW_M)),
+                    hnsw_ef_construct=int(
+                        config_loader.get_value(QDRANT_HNSW_EF_CONSTRUCT)
+                    ),
+                    full_scan_threshold=int(
+                        config_loader.get_value(QDRANT_FULL_SCAN_THRESHOLD)
+                    ),
+                    indexing_threshold=int(
+                        config_loader.get_value(QDRANT_INDEXING_THRESHOLD)
+                    ),
+                    quantization=QdrantQuantization(
+                        config_loader.get_value(QDRANT_QUANTIZATION)
+                    ),
+                    oversampling=float(config_loader.get_value(QDRANT_OVERSAMPLING)),
+                    rescore=str_to_bool(config_loader.get_value(QDRANT_RESCORE)),
+                    on_disk=str_to_bool(config_loader.get_value(QDRANT_ON_DISK)),
+                    on_disk_payload=str_to_bool(
+                        config_loader.get_value(QDRANT_ON_DISK_PAYLOAD)
+                    ),
+                ),
             )
             timer.checkpoint("Init VektorDB Connection")
 
-            llm_config = LlamaIndexRAGConfig(
-                embedding_mode=config_loader.get_value(EMBEDDING_MODEL),
-                top_n_count_dens=int(config_loader.get_value(TOP_N_COUNT_DENS)),
-                top_n_count_sparse=int(config_loader.get_value(TOP_N_COUNT_SPARSE)),
-                top_n_count_reranker=int(config_loader.get_value(TOP_N_COUNT_RERANKER)),
-                device=config_loader.get_value(EMBEDDING_DEVICE),
-                ollama_url=config_loader.get_value(OLLAMA_HOST),
-                llm_model=config_loader.get_value(MODEL),
-                timeout=float(config_loader.get_value(REQUST_TIMEOUT)),
-                context_window=int(config_loader.get_value(CONTEXT_LENGTH)),
-            )
-
             LLamaIndexHolder.create(
                 vector_store=LlamaIndexVectorStoreSession.get_instance().get_database(),
                 config=llm_config,
+                embedding_cache=embedding_cache,
+                embedding=embedding,
             )
 
+            retrieval_cache = None
+            if int(config_loader.get_value(WORKER)) > 1:
+                # the index versions only count the writes of this process
+                logger.warning("Retrieval cache is disabled with more than one WORKER")
+            elif int(config_loader.get_value(RETRIEVAL_CACHE_SIZE)) > 0:
+                retrieval_cache = RetrievalCache(
+                    config=RetrievalCacheConfig(
+                        ttl=float(config_loader.get_value(RETRIEVAL_CACHE_TTL)),
+                        max_entries=int(config_loader.get_value(RETRIEVAL_CACHE_SIZE)),
+                    )
+                )
+
             AskLLMUsecase.create(
                 llm=LLamaIndexRAGLLM(
                     config=llm_config,
+                    retrieval_cache=retrieval_cache,
                 )
             )
 
@@ -175,18 +395,58 @@ class Application:
                         device=config_loader.get_value(EMBEDDING_DEVICE),
                         chunk_size=int(config_loader.get_value(CHUNKE_SIZE)),
                         chunk_overlap=int(config_loader.get_value(CHUNKE_OVERLAP)),
+                        parent_chunk_size=int(
+                            config_loader.get_value(PARENT_CHUNK_SIZE)
+                        ),
                     ),
                     vector_store=LlamaIndexVectorStoreSession.get_instance().get_database(),
-                )
+                ),
+                retrieval_cache=retrieval_cache,
             )
 
-            PdfConverterUsecase.create(
-                pdf_converter=MarkerPDFConverter(
-                    config=MarkerPDFConverterConfig(
-                        ollama_host=None, model=None, use_llm=False
+            marker_config = MarkerPDFConverterConfig(
+                ollama_host=None,
+                model=None,
+                use_llm=False,
+                page_batch_size=int(config_loader.get_value(PDF_PAGE_BATCH_SIZE)),
+            )
+            pdf_converter_worker = int(config_loader.get_value(PDF_CONVERTER_WORKER))
+            if pdf_converter_worker > 0:
+                pdf_converter = ProcessPoolPDFConverter(
+                    config=ProcessPoolPDFConverterConfig(
+                        worker=pdf_converter_worker,
+                        timeout=float(config_loader.get_value(PDF_CONVERTER_TIMEOUT)),
+                        max_rss_mb=int(
+                            config_loader.get_value(PDF_CONVERTER_MAX_RSS_MB)
+                        ),
+                        converter_config=marker_config.model_dump(),
                     )
                 )
-            )
+            else:
+                pdf_converter = MarkerPDFConverter(config=marker_config)
+            if str_to_bool(config_loader.get_value(PDF_TEXT_LAYER_ENABLED)):
+                pdf_converter = TieredPDFConverter(
+                    fallback=pdf_converter,
+                    config=TieredPDFConverterConfig(
+                        min_chars=int(
+                            config_loader.get_value(PDF_TEXT_LAYER_MIN_CHARS)
+                        ),
+                        min_quality=float(
+                            config_loader.get_value(PDF_TEXT_LAYER_MIN_QUALITY)
+                        ),
+                    ),
+                )
+            if str_to_bool(config_loader.get_value(PDF_CACHE_ENABLED)):
+                pdf_converter = CachedPDFConverter(
+                    converter=pdf_converter,
+                    cache=MarkdownCache(
+                        path=os.path.join(DATA_DIR, "markdown_cache.sqlite3"),
+                        max_bytes=int(config_loader.get_value(PDF_CACHE_MAX_MB))
+                        * 1024
+                        * 1024,
+                    ),
+                )
+            PdfConverterUsecase.create(pdf_converter=pdf_converter)
 
         MoodleUsecase.create(
             MoodleClientImplementation(
@@ -195,17 +455,26 @@ class Application:
                     file_store_location=DATA_DIR,
                     moodle_host=config_loader.get_value(MOODLE_HOST),
                     api_key=config_loader.get_value(MOODLE_API_KEY),
+                    max_connections=int(
+                        config_loader.get_value(MOODLE_MAX_CONNECTIONS)
+                    ),
+                    max_parallel_downloads=int(
+                        config_loader.get_value(MOODLE_PARALLEL_DOWNLOADS)
+                    ),
+                    max_file_size=int(config_loader.get_value(MOODLE_MAX_FILE_SIZE_MB))
+                    * 1024
+                    * 1024,
                 )
-            )
+            ),
+            cache_config=CourseCacheConfig(
+                ttl=float(config_loader.get_value(COURSE_CACHE_TTL)),
+                stale_ttl=float(config_loader.get_value(COURSE_CACHE_STALE_TTL)),
+                max_courses=int(config_loader.get_value(COURSE_CACHE_SIZE)),
+            ),
         )
 
         timer.checkpoint("Init Usecase")
 
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-
         loop = asyncio.get_event_loop()
         loop.create_task(self._async_startup())
-
-        timer.checkpoint("Created Data Dir")
         timer.end()
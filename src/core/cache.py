@@ -0,0 +1,64 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CacheEntry(Generic[V]):
+    value: V
+    created: float
+
+    def __init__(self, value: V) -> None:
+        self.value = value
+        self.created = time.monotonic()
+
+    def age(self) -> float:
+        """Seconds since the entry has been stored."""
+        return time.monotonic() - self.created
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Size bounded cache, the least recently used entry is evicted first.
+    Entries remember when they were stored, the caller decides how old is too old.
+    Safe to use from several threads.
+    """
+
+    _max_size: int
+    _entries: "OrderedDict[K, CacheEntry[V]]"
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[CacheEntry[V]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: K, value: V):
+        with self._lock:
+            self._entries[key] = CacheEntry(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> bool:
+        """Removes the entry, returns False if there was none."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
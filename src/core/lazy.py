@@ -0,0 +1,44 @@
+import logging
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class Lazy(Generic[T]):
+    """
+    Value that is created on first use, e.g. a model that takes long to load.
+    Concurrent callers wait for the same load, the factory runs only once.
+    Safe to use from several threads.
+    """
+
+    _factory: Callable[[], T]
+    _name: str
+    _value: Optional[T]
+    _loaded: bool
+    _lock: threading.Lock
+
+    def __init__(self, factory: Callable[[], T], name: str) -> None:
+        self._factory = factory
+        self._name = name
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.monotonic()
+                    self._value = self._factory()
+                    self._loaded = True
+                    logger.info(
+                        f"Loaded {self._name} in {time.monotonic() - start:.2f} sec"
+                    )
+        return self._value  # type: ignore
+
+    def is_loaded(self) -> bool:
+        return self._loaded
@@ -0,0 +1,36 @@
+import threading
+from typing import Dict
+
+
+class Metrics:
+    """
+    Process wide counters and gauges, e.g. throughput of downloads.
+    The values are kept in memory and exposed by the metrics endpoint.
+    They are reset when the process restarts.
+    """
+
+    _lock = threading.Lock()
+    _values: Dict[str, float] = {}
+
+    @staticmethod
+    def increment(name: str, value: float = 1.0):
+        """Adds the value to the counter with the given name."""
+        with Metrics._lock:
+            Metrics._values[name] = Metrics._values.get(name, 0.0) + value
+
+    @staticmethod
+    def set(name: str, value: float):
+        """Sets the gauge with the given name."""
+        with Metrics._lock:
+            Metrics._values[name] = value
+
+    @staticmethod
+    def get(name: str) -> float:
+        with Metrics._lock:
+            return Metrics._values.get(name, 0.0)
+
+    @staticmethod
+    def snapshot() -> Dict[str, float]:
+        """Returns a copy of all values."""
+        with Metrics._lock:
+            return dict(Metrics._values)
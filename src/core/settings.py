@@ -42,6 +42,10 @@ def init_logging(log_level: str):
 OLLAMA_HOST = "OLLAMA_HOST"
 MODEL = "MODEL"
 EMBEDDING_MODEL = "EMBEDDING_MODEL"
+EMBEDDING_BATCH_SIZE = "EMBEDDING_BATCH_SIZE"
+EMBEDDING_MAX_LATENCY = "EMBEDDING_MAX_LATENCY"
+EMBEDDING_CACHE_ENABLED = "EMBEDDING_CACHE_ENABLED"
+EMBEDDING_CACHE_MAX_MB = "EMBEDDING_CACHE_MAX_MB"
 EMBEDDING_DEVICE = "EMBEDDING_DEVICE"
 CONTEXT_LENGTH = "CONTEXT_LENGTH"
 
@@ -50,6 +54,15 @@ QDRANT_HOST = "QDRANT_HOST"
 QDRANT_PORT = "QDRANT_PORT"
 QDRANT_API_KEY = "QDRANT_API_KEY"
 QDRANT_COLLECTION = "QDRANT_COLLECTION"
+QDRANT_HNSW_M = "QDRANT_HNSW_M"
+QDRANT_HNSW_EF_CONSTRUCT = "QDRANT_HNSW_EF_CONSTRUCT"
+QDRANT_FULL_SCAN_THRESHOLD = "QDRANT_FULL_SCAN_THRESHOLD"
+QDRANT_INDEXING_THRESHOLD = "QDRANT_INDEXING_THRESHOLD"
+QDRANT_QUANTIZATION = "QDRANT_QUANTIZATION"
+QDRANT_OVERSAMPLING = "QDRANT_OVERSAMPLING"
+QDRANT_RESCORE = "QDRANT_RESCORE"
+QDRANT_ON_DISK = "QDRANT_ON_DISK"
+QDRANT_ON_DISK_PAYLOAD = "QDRANT_ON_DISK_PAYLOAD"
 
 # mongo
 MONGODB_USER = "MONGODB_USER"
@@ -63,11 +76,18 @@ LOG_LEVEL = "LOG_LEVEL"
 PORT = "PORT"
 ROOT_PATH = "ROOT_PATH"
 ENABLE_LLM_PATH = "ENABLE_LLM_PATH"
+MODEL_WARMUP = "MODEL_WARMUP"
 
 # moodle
 MOODLE_HOST = "MOODLE_HOST"
 MOODLE_API_KEY = "MOODLE_API_KEY"
 REQUST_TIMEOUT = "REQUST_TIMEOUT"
+MOODLE_MAX_CONNECTIONS = "MOODLE_MAX_CONNECTIONS"
+MOODLE_PARALLEL_DOWNLOADS = "MOODLE_PARALLEL_DOWNLOADS"
+MOODLE_MAX_FILE_SIZE_MB = "MOODLE_MAX_FILE_SIZE_MB"
+COURSE_CACHE_TTL = "COURSE_CACHE_TTL"
+COURSE_CACHE_STALE_TTL = "COURSE_CACHE_STALE_TTL"
+COURSE_CACHE_SIZE = "COURSE_CACHE_SIZE"
 
 # retrival
 TOP_N_COUNT_RERANKER = "TOP_N_COUNT_RERANKER"
@@ -75,8 +95,30 @@ TOP_N_COUNT_DENS = "TOP_N_COUNT_DENS"
 TOP_N_COUNT_SPARSE = "TOP_N_COUNT_SPARSE"
 CHUNKE_SIZE = "CHUNKE_SIZE"
 CHUNKE_OVERLAP = "CHUNKE_OVERLAP"
+PARENT_CHUNK_SIZE = "PARENT_CHUNK_SIZE"
+AUTO_MERGE_RATIO = "AUTO_MERGE_RATIO"
+NEIGHBOR_WINDOW = "NEIGHBOR_WINDOW"
+RETRIEVAL_CACHE_TTL = "RETRIEVAL_CACHE_TTL"
+RETRIEVAL_CACHE_SIZE = "RETRIEVAL_CACHE_SIZE"
 WORKER = "WORKER"
 
+# ingestion
+INGESTION_WORKER = "INGESTION_WORKER"
+INGESTION_POLL_INTERVAL = "INGESTION_POLL_INTERVAL"
+INGESTION_JOB_TIMEOUT = "INGESTION_JOB_TIMEOUT"
+INGESTION_RECHECK_INTERVAL = "INGESTION_RECHECK_INTERVAL"
+INGESTION_PAGE_BATCH_SIZE = "INGESTION_PAGE_BATCH_SIZE"
+
+# pdf conversion
+PDF_PAGE_BATCH_SIZE = "PDF_PAGE_BATCH_SIZE"
+PDF_CONVERTER_WORKER = "PDF_CONVERTER_WORKER"
+PDF_CONVERTER_TIMEOUT = "PDF_CONVERTER_TIMEOUT"
+PDF_CONVERTER_MAX_RSS_MB = "PDF_CONVERTER_MAX_RSS_MB"
+PDF_TEXT_LAYER_ENABLED = "PDF_TEXT_LAYER_ENABLED"
+PDF_TEXT_LAYER_MIN_CHARS = "PDF_TEXT_LAYER_MIN_CHARS"
+PDF_TEXT_LAYER_MIN_QUALITY = "PDF_TEXT_LAYER_MIN_QUALITY"
+PDF_CACHE_ENABLED = "PDF_CACHE_ENABLED"
+PDF_CACHE_MAX_MB = "PDF_CACHE_MAX_MB"
 
 ENV_VARS: dict[str, Optional[str]] = {
     # mongo
@@ -90,26 +132,67 @@ ENV_VARS: dict[str, Optional[str]] = {
     MODEL: "llama3.1",
     EMBEDDING_DEVICE: "cpu",
     EMBEDDING_MODEL: "nomic-ai/nomic-embed-text-v2-moe",
+    EMBEDDING_BATCH_SIZE: "32",
+    EMBEDDING_MAX_LATENCY: "0.01",
+    EMBEDDING_CACHE_ENABLED: "True",
+    EMBEDDING_CACHE_MAX_MB: "1024",
     CONTEXT_LENGTH: "8192",
     # qdrant
     QDRANT_HOST: None,
     QDRANT_PORT: "6333",
     QDRANT_API_KEY: "",
     QDRANT_COLLECTION: "mokitul_ai",
+    QDRANT_HNSW_M: "16",
+    QDRANT_HNSW_EF_CONSTRUCT: "100",
+    QDRANT_FULL_SCAN_THRESHOLD: "10000",
+    QDRANT_INDEXING_THRESHOLD: "20000",
+    QDRANT_QUANTIZATION: "none",
+    QDRANT_OVERSAMPLING: "2.0",
+    QDRANT_RESCORE: "True",
+    QDRANT_ON_DISK: "False",
+    QDRANT_ON_DISK_PAYLOAD: "False",
     # retrival
     TOP_N_COUNT_RERANKER: "10",
     TOP_N_COUNT_DENS: "10",
     TOP_N_COUNT_SPARSE: "10",
     CHUNKE_SIZE: "128",
     CHUNKE_OVERLAP: "20",
+    PARENT_CHUNK_SIZE: "0",
+    AUTO_MERGE_RATIO: "0.5",
+    NEIGHBOR_WINDOW: "0",
+    RETRIEVAL_CACHE_TTL: "600.0",
+    RETRIEVAL_CACHE_SIZE: "256",
     # moodle
     MOODLE_HOST: None,
     MOODLE_API_KEY: None,
     REQUST_TIMEOUT: "60.0",
+    MOODLE_MAX_CONNECTIONS: "20",
+    MOODLE_PARALLEL_DOWNLOADS: "8",
+    MOODLE_MAX_FILE_SIZE_MB: "500",
+    COURSE_CACHE_TTL: "300.0",
+    COURSE_CACHE_STALE_TTL: "3600.0",
+    COURSE_CACHE_SIZE: "1000",
+    # ingestion
+    INGESTION_WORKER: "2",
+    INGESTION_POLL_INTERVAL: "5.0",
+    INGESTION_JOB_TIMEOUT: "3600.0",
+    INGESTION_RECHECK_INTERVAL: "3600.0",
+    INGESTION_PAGE_BATCH_SIZE: "16",
+    # pdf conversion
+    PDF_PAGE_BATCH_SIZE: "32",
+    PDF_CONVERTER_WORKER: "1",
+    PDF_CONVERTER_TIMEOUT: "1800.0",
+    PDF_CONVERTER_MAX_RSS_MB: "8192",
+    PDF_TEXT_LAYER_ENABLED: "True",
+    PDF_TEXT_LAYER_MIN_CHARS: "20",
+    PDF_TEXT_LAYER_MIN_QUALITY: "0.9",
+    PDF_CACHE_ENABLED: "True",
+    PDF_CACHE_MAX_MB: "1024",
     # base
     LOG_LEVEL: "INFO",
     ROOT_PATH: "/api",
     PORT: "8000",
     ENABLE_LLM_PATH: "True",
+    MODEL_WARMUP: "True",
     WORKER: "1",
 }
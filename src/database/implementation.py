@@ -1,8 +1,18 @@
-from typing import List
-from api.model import Conversation, Message, NotFoundException
+from typing import Dict, List, Optional, Tuple
+from api.model import (
+    Conversation,
+    FileState,
+    IngestionJob,
+    IngestionJobStatus,
+    Message,
+    NotFoundException,
+)
+from api.utils.chains import get_posix_timestamp
 from bson import ObjectId
 from core import Result
 from database.session import BaseDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 import logging
 
@@ -64,3 +74,250 @@ class ConversationDatabase(BaseDatabase[Conversation]):
                 )
         except Exception as e:
             return Result.Err(e)
+
+
+class IngestionJobDatabase(BaseDatabase[IngestionJob]):
+    """
+    Persistent queue of ingestion jobs.
+    Jobs are claimed atomically, so several workers (and processes) can share the queue.
+    A file has at most one open (queued or running) job per course.
+    """
+
+    OpenStatus = [IngestionJobStatus.queued.value, IngestionJobStatus.running.value]
+
+    def __init__(self):
+        super().__init__(IngestionJob, "ingestion_jobs")
+
+    async def start(self):
+        await super().start()
+        await self._collection.create_index(
+            [("status", 1), ("priority", -1), ("timestamp", 1)]
+        )
+        await self._collection.create_index([("fileId", 1), ("courseId", 1)])
+        await self._remove_duplicate_open_jobs()
+        await self._collection.create_index(
+            [("fileId", 1), ("courseId", 1)],
+            name="open_job_per_file",
+            unique=True,
+            partialFilterExpression={"status": {"$in": self.OpenStatus}},
+        )
+
+    async def _remove_duplicate_open_jobs(self):
+        """
+        Older versions could enqueue a file twice, only the oldest open job is kept.
+        """
+        async for group in self._collection.aggregate(
+            [
+                {"$match": {"status": {"$in": self.OpenStatus}}},
+                {"$sort": {"timestamp": 1}},
+                {
+                    "$group": {
+                        "_id": {"fileId": "$fileId", "courseId": "$courseId"},
+                        "ids": {"$push": "$_id"},
+                    }
+                },
+                {"$match": {"ids.1": {"$exists": True}}},
+            ]
+        ):
+            await self._collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+
+    async def enqueue(self, job: IngestionJob) -> Result[Tuple[str, bool]]:
+        """
+        Inserts the job unless the file already has an open job in the course.
+        Returns the id of the open job and whether it was inserted.
+        The upsert and the unique index make this safe for concurrent requests.
+        """
+        job_id = ObjectId()
+        query = {
+            "fileId": job.fileId,
+            "courseId": job.courseId,
+            "status": {"$in": self.OpenStatus},
+        }
+        try:
+            try:
+                doc = await self._collection.find_one_and_update(
+                    query,
+                    {"$setOnInsert": {**job.model_dump(exclude={"id"}), "_id": job_id}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # a concurrent request inserted the job first
+                doc = await self._collection.find_one(query)
+                if doc is None:
+                    return Result.Err(
+                        NotFoundException(f"Open job of file {job.fileId} not found")
+                    )
+            return Result.Ok((str(doc["_id"]), doc["_id"] == job_id))
+        except Exception as e:
+            return Result.Err(e)
+
+    async def find_latest_jobs(
+        self, file_ids: List[str], course_id: Optional[str]
+    ) -> Result[Dict[str, IngestionJob]]:
+        """
+        Returns the newest job of every given file, mapped by the file id.
+        """
+        jobs: Dict[str, IngestionJob] = {}
+        try:
+            async for doc in self._collection.find(
+                {"fileId": {"$in": file_ids}, "courseId": course_id},
+                sort=[("timestamp", 1)],
+            ):
+                job = self._model.model_validate(obj=doc)
+                jobs[job.fileId] = job
+            return Result.Ok(jobs)
+        except Exception as e:
+            return Result.Err(e)
+
+    async def claim_next(self) -> Result[Optional[IngestionJob]]:
+        """
+        Marks the oldest queued job with the highest priority as running and returns it.
+        """
+        try:
+            doc = await self._collection.find_one_and_update(
+                {"status": IngestionJobStatus.queued.value},
+                {
+                    "$set": {
+                        "status": IngestionJobStatus.running.value,
+                        "updated": get_posix_timestamp(),
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("priority", -1), ("timestamp", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc:
+                return Result.Ok(self._model.model_validate(obj=doc))
+            return Result.Ok(None)
+        except Exception as e:
+            return Result.Err(e)
+
+    async def set_status(
+        self, job_id: str, status: IngestionJobStatus, error: Optional[str] = None
+    ) -> Result[None]:
+        try:
+            result = await self._collection.update_one(
+                {"_id": ObjectId(job_id)},
+                {
+                    "$set": {
+                        "status": status.value,
+                        "error": error,
+                        "updated": get_posix_timestamp(),
+                    }
+                },
+            )
+            if result.matched_count == 1:
+                return Result.Ok()
+            return Result.Err(NotFoundException(f"Job {job_id} not found"))
+        except Exception as e:
+            return Result.Err(e)
+
+    async def touch(self, job_id: str) -> Result[None]:
+        """
+        Marks a running job as alive, so it isn't requeued as stale.
+        """
+        try:
+            await self._collection.update_one(
+                {"_id": ObjectId(job_id), "status": IngestionJobStatus.running.value},
+                {"$set": {"updated": get_posix_timestamp()}},
+            )
+            return Result.Ok()
+        except Exception as e:
+            return Result.Err(e)
+
+    async def requeue_stale(self, timeout: float) -> Result[int]:
+        """
+        Jobs that are running longer than the timeout belong to a worker that died.
+        They are put back into the queue.
+        """
+        try:
+            now = get_posix_timestamp()
+            result = await self._collection.update_many(
+                {
+                    "status": IngestionJobStatus.running.value,
+                    "updated": {"$lt": now - timeout},
+                },
+                {
+                    "$set": {
+                        "status": IngestionJobStatus.queued.value,
+                        "updated": now,
+                    }
+                },
+            )
+            return Result.Ok(result.modified_count)
+        except Exception as e:
+            return Result.Err(e)
+
+
+class FileStateDatabase(BaseDatabase[FileState]):
+    """
+    One document per moodle file, keyed by the file id.
+    """
+
+    def __init__(self):
+        super().__init__(FileState, "file_states")
+
+    async def start(self):
+        await super().start()
+        await self._collection.create_index("fileId", unique=True)
+        await self._collection.create_index("sha256")
+
+    async def find_by_file_id(self, file_id: str) -> Result[Optional[FileState]]:
+        try:
+            doc = await self._collection.find_one({"fileId": file_id})
+            if doc:
+                return Result.Ok(self._model.model_validate(obj=doc))
+            return Result.Ok(None)
+        except Exception as e:
+            return Result.Err(e)
+
+    async def find_indexed_by_hash(
+        self, sha256: str, exclude_file_id: str
+    ) -> Result[Optional[FileState]]:
+        """
+        Returns another indexed file with the same content, if there is one.
+        """
+        try:
+            doc = await self._collection.find_one(
+                {
+                    "sha256": sha256,
+                    "indexed": True,
+                    "fileId": {"$ne": exclude_file_id},
+                }
+            )
+            if doc:
+                return Result.Ok(self._model.model_validate(obj=doc))
+            return Result.Ok(None)
+        except Exception as e:
+            return Result.Err(e)
+
+    async def mark_all_unindexed(self) -> Result[List[FileState]]:
+        """
+        Marks every indexed file as not indexed and returns them.
+        """
+        try:
+            states: List[FileState] = []
+            async for doc in self._collection.find({"indexed": True}):
+                states.append(self._model.model_validate(obj=doc))
+            await self._collection.update_many(
+                {"fileId": {"$in": [state.fileId for state in states]}},
+                {"$set": {"indexed": False}},
+            )
+            return Result.Ok(states)
+        except Exception as e:
+            return Result.Err(e)
+
+    async def save(self, state: FileState) -> Result[None]:
+        """
+        Inserts or replaces the state of the file.
+        """
+        try:
+            await self._collection.replace_one(
+                {"fileId": state.fileId},
+                state.model_dump(exclude={"id"}),
+                upsert=True,
+            )
+            return Result.Ok()
+        except Exception as e:
+            return Result.Err(e)
@@ -1,18 +1,27 @@
 from abc import ABC, abstractmethod
+import asyncio
+import hashlib
 import re
 import logging
 import os
-from typing import Optional
-import requests
+import tempfile
+import time
+from typing import BinaryIO, Optional, Tuple
+import httpx
 from pydantic import BaseModel
-from requests.models import Response
-from textwrap import wrap
+from core.metrics import Metrics
 
 
 logger = logging.getLogger(__name__)
 
 API_KEY_QUERY_PARAMETER = "api_key"
 FILE_ID_QUERY_PARAMETER = "file_id"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+DOWNLOAD_BYTES_METRIC = "moodle_download_bytes_total"
+DOWNLOAD_SECONDS_METRIC = "moodle_download_seconds_total"
+DOWNLOAD_FILES_METRIC = "moodle_download_files_total"
+DOWNLOAD_THROUGHPUT_METRIC = "moodle_download_last_bytes_per_second"
 
 
 class MoodleConfig(BaseModel):
@@ -20,13 +29,30 @@ class MoodleConfig(BaseModel):
     api_key: str
     file_store_location: str
     timeout: float
+    max_connections: int = 20
+    max_parallel_downloads: int = 8
+    max_file_size: int = 500 * 1024 * 1024
+
+
+class MoodleFileTooLargeException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
 
 
 class MoodleFile(BaseModel):
+    """
+    has_been_downloaded is False if the local copy is still up to date.
+    The version fields are only set for downloaded files.
+    """
+
     id: str
     org_filename: Optional[str]
     local_filename: str
     has_been_downloaded: bool
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
 
 
 class MoodleClient(ABC):
@@ -37,68 +63,189 @@ class MoodleClient(ABC):
     """
 
     @abstractmethod
-    def download(self, file_id: str) -> MoodleFile:
+    async def download(
+        self,
+        file_id: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> MoodleFile:
+        """
+        Downloads the file unless the local copy matches the given etag or last_modified.
+        """
         pass
 
     @abstractmethod
-    def get_file_ids_for_course(self, courseId: str) -> list[str]:
+    async def get_file_ids_for_course(self, courseId: str) -> list[str]:
+        pass
+
+    async def close(self):
+        """
+        Releases the resources of the client, e.g. open connections.
+        """
         pass
 
 
 class MoodleClientImplementation(MoodleClient):
     """
     Implementation of the Moodle client.
+    All requests share one keep-alive connection pool.
+    The number of downloads running at the same time is limited by max_parallel_downloads,
+    independent of how many callers request files.
     """
+
     _config: MoodleConfig
+    _client: Optional[httpx.AsyncClient]
+    _download_slots: asyncio.Semaphore
 
-    def __init__(self, config) -> None:
+    def __init__(self, config: MoodleConfig) -> None:
         self._config = config
+        self._client = None
+        self._download_slots = asyncio.Semaphore(config.max_parallel_downloads)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # created lazily, the client has to live on the event loop of the server
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                verify=False,
+                timeout=self._config.timeout,
+                limits=httpx.Limits(
+                    max_connections=self._config.max_connections,
+                    max_keepalive_connections=self._config.max_connections,
+                ),
+            )
+        return self._client
 
     def _build_moodle_download_url(self, id) -> str:
         return f"{self._config.moodle_host}/local/mokitul/api/download.php?{FILE_ID_QUERY_PARAMETER}={id}&{API_KEY_QUERY_PARAMETER}={self._config.api_key}"
 
-    def _throw_from_http_request(self, response: Response):
+    def _throw_from_http_request(self, response: httpx.Response):
         raise Exception(
-            f"Failed to request file {response.status_code}, {response.raw._body}"
+            f"Failed to request file {response.status_code}, {response.text}"
         )
 
-    def download(self, file_id: str) -> MoodleFile:
+    def _build_conditional_headers(
+        self, etag: Optional[str], last_modified: Optional[str]
+    ) -> dict[str, str]:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    async def download(
+        self,
+        file_id: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> MoodleFile:
         downloadUrl = self._build_moodle_download_url(file_id)
         file = os.path.join(self._config.file_store_location, f"{file_id}.pdf")
 
+        # without a local copy a 304 would be useless
+        headers = {}
         if os.path.exists(file):
-            logger.info(f"File with FileID{file_id} already downloaded")
-            return MoodleFile(
-                id=file_id,
-                local_filename=file,
-                org_filename="",
-                has_been_downloaded=False,
-            )
-
-        responseFileRequest = requests.get(
-            url=downloadUrl, verify=False, timeout=self._config.timeout
-        )
-        filenameHeader = responseFileRequest.headers["content-disposition"]
-        match = re.search(r'"(.*?)"', filenameHeader)
-        if match:
-            filenameHeader = match.group(1)
-
-        with open(file,"wb") as writer:
-            writer.write(responseFileRequest.content)
+            headers = self._build_conditional_headers(etag, last_modified)
+
+        async with self._download_slots:
+            async with self._get_client().stream(
+                "GET", downloadUrl, headers=headers
+            ) as response:
+                if response.status_code == 304:
+                    logger.info(f"File with FileID{file_id} not modified")
+                    return MoodleFile(
+                        id=file_id,
+                        local_filename=file,
+                        org_filename="",
+                        has_been_downloaded=False,
+                    )
+
+                if not response.is_success:
+                    await response.aread()
+                    self._throw_from_http_request(response=response)
+
+                filenameHeader = response.headers["content-disposition"]
+                match = re.search(r'"(.*?)"', filenameHeader)
+                if match:
+                    filenameHeader = match.group(1)
+
+                size, sha256 = await self._stream_to_file(
+                    file_id=file_id, file=file, response=response
+                )
 
         return MoodleFile(
             id=file_id,
             local_filename=file,
             org_filename=filenameHeader,
             has_been_downloaded=True,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            size=size,
+            sha256=sha256,
         )
 
-    def get_file_ids_for_course(self, courseId: str) -> list[str]:
-        response = requests.get(
+    async def _stream_to_file(
+        self, file_id: str, file: str, response: httpx.Response
+    ) -> Tuple[int, str]:
+        """
+        Writes the response chunk by chunk into a temporary file and renames it afterwards.
+        The memory usage is independent of the file size
+        and the final file either exists completely or not at all.
+        Returns the size and the SHA-256 of the content.
+        """
+        max_file_size = self._config.max_file_size
+        content_length = response.headers.get("content-length")
+        if content_length is not None and int(content_length) > max_file_size:
+            raise MoodleFileTooLargeException(
+                f"File {file_id} has {content_length} bytes, limit is {max_file_size}"
+            )
+
+        start = time.perf_counter()
+        size = 0
+        digest = hashlib.sha256()
+        fd, tmp_file = tempfile.mkstemp(
+            dir=self._config.file_store_location, prefix=f".{file_id}.", suffix=".part"
+        )
+        try:
+            with os.fdopen(fd, "wb") as writer:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_file_size:
+                        raise MoodleFileTooLargeException(
+                            f"File {file_id} exceeds the limit of {max_file_size} bytes"
+                        )
+                    # a slow disk doesn't block the event loop
+                    await asyncio.to_thread(self._write_chunk, writer, digest, chunk)
+            os.replace(tmp_file, file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+        elapsed = time.perf_counter() - start
+        Metrics.increment(DOWNLOAD_BYTES_METRIC, size)
+        Metrics.increment(DOWNLOAD_SECONDS_METRIC, elapsed)
+        Metrics.increment(DOWNLOAD_FILES_METRIC)
+        if elapsed > 0:
+            Metrics.set(DOWNLOAD_THROUGHPUT_METRIC, size / elapsed)
+        logger.info(f"Downloaded file {file_id}, {size} bytes in {elapsed:.2f} sec")
+        return size, digest.hexdigest()
+
+    @staticmethod
+    def _write_chunk(writer: BinaryIO, digest: "hashlib._Hash", chunk: bytes):
+        """Runs in a worker thread, hashing and writing release the GIL."""
+        digest.update(chunk)
+        writer.write(chunk)
+
+    async def get_file_ids_for_course(self, courseId: str) -> list[str]:
+        response = await self._get_client().get(
             url=f"{self._config.moodle_host}/local/mokitul/api/files.php?course_id={courseId}&{API_KEY_QUERY_PARAMETER}={self._config.api_key}",
-            verify=False,
-            timeout=self._config.timeout,
         )
-        if response.ok:
+        if response.is_success:
             return response.json()
         self._throw_from_http_request(response=response)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import zlib
+from core.cache import LRUCache
+from core.metrics import Metrics
+from pdf_converter.utils import file_sha256, get_page_count, page_fingerprints
+from usecases.storage import PDFConverter
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT_PAGES_METRIC = "pdf_cache_pages_hit_total"
+CACHE_MISS_PAGES_METRIC = "pdf_cache_pages_miss_total"
+CACHE_EVICTED_PAGES_METRIC = "pdf_cache_pages_evicted_total"
+
+
+class MarkdownCache:
+    """
+    Compressed markdown of single pages, stored in a sqlite file.
+    Entries are keyed by the hash of the PDF, the converter and the page number.
+    Pages that are not found are looked up by their page fingerprint,
+    so the unchanged pages of an updated PDF are found as well.
+    If the cache grows beyond max_bytes, the least recently used pages are removed.
+    """
+
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _max_bytes: int
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    pdf_hash TEXT NOT NULL,
+                    converter TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    page_hash TEXT,
+                    markdown BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (pdf_hash, converter, page)
+                )
+                """
+            )
+            columns = [
+                row[1] for row in self._connection.execute("PRAGMA table_info(pages)")
+            ]
+            if "page_hash" not in columns:
+                self._connection.execute("ALTER TABLE pages ADD COLUMN page_hash TEXT")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pages_page_hash "
+                "ON pages (page_hash, converter)"
+            )
+
+    def get(
+        self,
+        pdf_hash: str,
+        converter: str,
+        pages: List[int],
+        page_hashes: Optional[Dict[int, str]] = None,
+    ) -> Dict[int, str]:
+        """
+        Returns the cached pages, missing pages are not part of the result.
+        """
+        page_hashes = page_hashes or {}
+        found: Dict[int, str] = {}
+        with self._lock, self._connection:
+            for page in pages:
+                row = self._connection.execute(
+                    "SELECT rowid, markdown FROM pages "
+                    "WHERE pdf_hash = ? AND converter = ? AND page = ?",
+                    (pdf_hash, converter, page),
+                ).fetchone()
+                if row is None and page in page_hashes:
+                    row = self._connection.execute(
+                        "SELECT rowid, markdown FROM pages "
+                        "WHERE page_hash = ? AND converter = ?",
+                        (page_hashes[page], converter),
+                    ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE pages SET accessed = ? WHERE rowid = ?",
+                        (time.time(), row[0]),
+                    )
+                    found[page] = zlib.decompress(row[1]).decode("utf-8")
+        return found
+
+    def put(
+        self,
+        pdf_hash: str,
+        converter: str,
+        pages: Dict[int, str],
+        page_hashes: Optional[Dict[int, str]] = None,
+    ):
+        page_hashes = page_hashes or {}
+        now = time.time()
+        rows = []
+        for page, markdown in pages.items():
+            compressed = zlib.compress(markdown.encode("utf-8"))
+            rows.append(
+                (
+                    pdf_hash,
+                    converter,
+                    page,
+                    page_hashes.get(page),
+                    compressed,
+                    len(compressed),
+                    now,
+                )
+            )
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO pages "
+                "(pdf_hash, converter, page, page_hash, markdown, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM pages"
+        ).fetchone()
+        if total <= self._max_bytes:
+            return
+
+        evicted = []
+        for rowid, size in self._connection.execute(
+            "SELECT rowid, size FROM pages ORDER BY accessed"
+        ):
+            if total <= self._max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self._connection.executemany("DELETE FROM pages WHERE rowid = ?", evicted)
+        Metrics.increment(CACHE_EVICTED_PAGES_METRIC, len(evicted))
+
+    def size(self) -> int:
+        """Size of all compressed pages in bytes."""
+        with self._lock:
+            (total,) = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM pages"
+            ).fetchone()
+        return total
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachedPDFConverter(PDFConverter):
+    """
+    Returns the markdown of pages that were converted before from the cache,
+    only missing pages are converted by the wrapped converter.
+    The cache key contains the hash of the PDF and the cache key of the converter,
+    so a new converter version or config converts the pages again.
+    Unchanged pages of an updated PDF are found by their page fingerprint.
+    Rebuilding the vector database or changing the chunking does not need Marker.
+    """
+
+    _converter: PDFConverter
+    _cache: MarkdownCache
+    _file_hashes: LRUCache[Tuple[str, int, int], Tuple[str, List[str]]]
+
+    def __init__(self, converter: PDFConverter, cache: MarkdownCache) -> None:
+        super().__init__()
+        self._converter = converter
+        self._cache = cache
+        # files are converted in batches, hash them only once
+        self._file_hashes = LRUCache(max_size=16)
+
+    def cache_key(self) -> str:
+        return self._converter.cache_key()
+
+    def transform_file_to_markdown(self, file: str) -> list[str]:
+        return self.transform_pages_to_markdown(
+            file=file, pages=list(range(get_page_count(file=file)))
+        )
+
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        pdf_hash, page_hashes, cached = self._lookup(file=file, pages=pages)
+        missing = [page for page in pages if page not in cached]
+        if len(missing) > 0:
+            converted = self._converter.transform_pages_to_markdown(
+                file=file, pages=missing
+            )
+            cached.update(self._store(pdf_hash, page_hashes, missing, converted))
+        return [cached[page] for page in pages]
+
+    async def transform_file_to_markdown_async(self, file: str) -> list[str]:
+        page_count = await asyncio.to_thread(get_page_count, file)
+        return await self.transform_pages_to_markdown_async(
+            file=file, pages=list(range(page_count))
+        )
+
+    async def transform_pages_to_markdown_async(
+        self, file: str, pages: List[int]
+    ) -> list[str]:
+        """
+        Hashing and the cache run in worker threads, the wrapped converter is awaited.
+        """
+        pdf_hash, page_hashes, cached = await asyncio.to_thread(
+            self._lookup, file, pages
+        )
+        missing = [page for page in pages if page not in cached]
+        if len(missing) > 0:
+            converted = await self._converter.transform_pages_to_markdown_async(
+                file=file, pages=missing
+            )
+            cached.update(
+                await asyncio.to_thread(
+                    self._store, pdf_hash, page_hashes, missing, converted
+                )
+            )
+        return [cached[page] for page in pages]
+
+    def _lookup(
+        self, file: str, pages: List[int]
+    ) -> Tuple[str, Dict[int, str], Dict[int, str]]:
+        """
+        Hash of the file, fingerprints of the pages and the cached pages.
+        """
+        pdf_hash, fingerprints = self._hash_file(file)
+        page_hashes = {page: fingerprints[page] for page in pages}
+        cached = self._cache.get(
+            pdf_hash=pdf_hash,
+            converter=self._converter.cache_key(),
+            pages=pages,
+            page_hashes=page_hashes,
+        )
+        hits = len([page for page in pages if page in cached])
+        Metrics.increment(CACHE_HIT_PAGES_METRIC, hits)
+        Metrics.increment(CACHE_MISS_PAGES_METRIC, len(pages) - hits)
+        return pdf_hash, page_hashes, cached
+
+    def _store(
+        self,
+        pdf_hash: str,
+        page_hashes: Dict[int, str],
+        pages: List[int],
+        converted: List[str],
+    ) -> Dict[int, str]:
+        new_pages = dict(zip(pages, converted))
+        self._cache.put(
+            pdf_hash=pdf_hash,
+            converter=self._converter.cache_key(),
+            pages=new_pages,
+            page_hashes=page_hashes,
+        )
+        return new_pages
+
+    def _hash_file(self, file: str) -> Tuple[str, List[str]]:
+        """
+        SHA-256 and page fingerprints of the file.
+        """
+        stat = os.stat(file)
+        key = (file, stat.st_mtime_ns, stat.st_size)
+        entry = self._file_hashes.get(key)
+        if entry is not None:
+            return entry.value
+        hashes = (file_sha256(file), page_fingerprints(file))
+        self._file_hashes.put(key, hashes)
+        return hashes
+
+    def warm_up(self):
+        self._converter.warm_up()
+
+    def is_ready(self) -> bool:
+        return self._converter.is_ready()
+
+    def close(self):
+        self._converter.close()
+        self._cache.close()
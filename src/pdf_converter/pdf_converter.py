@@ -1,76 +1,121 @@
 import logging
-from typing import Optional
+import re
+import threading
+from typing import Dict, List, Optional
 from marker.config.parser import ConfigParser
 from marker.converters.pdf import PdfConverter
 from marker.models import create_model_dict
 from marker.output import text_from_rendered
 from pydantic import BaseModel
 import torch
+from core.lazy import Lazy
+from pdf_converter.utils import get_page_count, marker_cache_key
 from usecases.storage import PDFConverter
-import PyPDF2
 
 
 logger = logging.getLogger(__name__)
 
 
+PAGE_SEPARATOR_PATTERN = re.compile(r"\{(\d+)\}-{48}")
+
+
+def split_paginated_markdown(markdown: str, page_numbers: List[int]) -> List[str]:
+    """
+    Splits the paginated output of marker into one markdown string per page.
+    Marker starts every page with "{page_id}" followed by 48 dashes.
+    Pages without output are returned as empty strings.
+    """
+    parts = PAGE_SEPARATOR_PATTERN.split(markdown)
+    pages: Dict[int, str] = {}
+    # parts alternate between page id and page content, the first part is the preamble
+    for i in range(1, len(parts) - 1, 2):
+        pages[int(parts[i])] = parts[i + 1].strip()
+    return [pages.get(page_number, "") for page_number in page_numbers]
+
+
 class MarkerPDFConverterConfig(BaseModel):
     ollama_host: Optional[str]
     model: Optional[str]
     use_llm: bool = False
+    page_batch_size: int = 32
 
 
 class MarkerPDFConverter(PDFConverter):
     """
     PDF converter using Marker.
     Github: https://github.com/VikParuchuri/marker
-    Iterares over the pages of the PDF and converts each page to markdown.
-    At the moment of writing, the converter is not able to convert the entire PDF in one go while holding the page context.
-    At least to my knowledge.
-    Therefore, we iterate over the pages and convert each page to markdown.
+    Marker converts a range of pages in one pass and marks the start of every page in the output.
+    The output is split at these markers, so every page is converted exactly once.
+    Large documents are converted in batches of page_batch_size pages to bound the memory usage,
+    0 converts the whole document in one pass.
+    The models are loaded with the first conversion or by warm_up.
+    The page range is set on the shared converter, so conversions run one after another.
     """
-    converter: PdfConverter
+    converter: Lazy[PdfConverter]
     config: MarkerPDFConverterConfig
-
-    def _get_page_count(self, filepath: str) -> int:
-        with open(filepath, "rb") as file:
-            return len(PyPDF2.PdfReader(file).pages)
+    _render_lock: threading.Lock
 
     def __init__(self, config: MarkerPDFConverterConfig) -> None:
         super().__init__()
         self.config = config
+        self.converter = Lazy(self._build_converter, name="marker models")
+        self._render_lock = threading.Lock()
+
+    def _build_converter(self) -> PdfConverter:
+        config_parser = ConfigParser(self._build_marker_config())
+        return PdfConverter(
+            config=config_parser.generate_config_dict(),
+            artifact_dict=create_model_dict(),
+            llm_service=config_parser.get_llm_service(),
+        )
+
+    def warm_up(self):
+        self.converter.get()
+
+    def is_ready(self) -> bool:
+        return self.converter.is_loaded()
+
+    def _build_marker_config(self, page_range: Optional[List[int]] = None) -> dict:
         marker_config = {
             "output_format": "markdown",
+            "paginate_output": True,
             "use_llm": self.config.use_llm,
             "llm_service": "marker.services.ollama.OllamaService",
             "ollama_base_url": self.config.ollama_host,
             "ollama_model": self.config.model,
         }
-        config_parser = ConfigParser(marker_config)
+        if page_range is not None:
+            marker_config["page_range"] = page_range
+        return marker_config
 
-        self.converter = PdfConverter(
-            config=config_parser.generate_config_dict(),
-            artifact_dict=create_model_dict(),
-            llm_service=config_parser.get_llm_service(),
-        )
+    def cache_key(self) -> str:
+        return marker_cache_key(self.config.model_dump())
 
     def transform_file_to_markdown(self, file: str) -> list[str]:
-        pages: list[str] = []
-        page_count = self._get_page_count(filepath=file)
-        for i in range(page_count):
-            marker_config = {
-                "output_format": "markdown",
-                "use_llm": self.config.use_llm,
-                "llm_service": "marker.services.ollama.OllamaService",
-                "ollama_base_url": self.config.ollama_host,
-                "ollama_model": self.config.model,
-            }
-
-            self.converter.config = marker_config
-            rendered = self.converter(file)
+        page_count = get_page_count(file=file)
+        return self.transform_pages_to_markdown(
+            file=file, pages=list(range(page_count))
+        )
+
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        """
+        Converts the given pages (0-based) and returns their markdown in the same order.
+        """
+        batch_size = self.config.page_batch_size
+        if batch_size <= 0:
+            batch_size = max(len(pages), 1)
+
+        converter = self.converter.get()
+        markdown: list[str] = []
+        for start in range(0, len(pages), batch_size):
+            page_range = pages[start : start + batch_size]
+            with self._render_lock:
+                converter.config = self._build_marker_config(page_range=page_range)
+                rendered = converter(file)
             text, _, _ = text_from_rendered(rendered)
-            pages.append(text)
+            markdown.extend(split_paginated_markdown(text, page_range))
         try:
             torch.cuda.empty_cache()
         except Exception as e:
             logger.error(f"Failed to release cuda cache {e}")
-        return pages
+        return markdown
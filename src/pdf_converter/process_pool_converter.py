@@ -0,0 +1,292 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import queue
+import resource
+import sys
+import threading
+from typing import Any, List, Optional, Tuple
+from pydantic import BaseModel
+from pdf_converter.utils import marker_cache_key
+from usecases.storage import PDFConverter
+
+
+logger = logging.getLogger(__name__)
+
+# (file, pages), pages None converts the whole file
+ConversionJob = Tuple[str, Optional[List[int]]]
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of the current process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _worker_main(converter_config: dict, connection: Connection, max_rss: int):
+    """
+    Entry point of a worker process.
+    Loads the models once and converts files until it is stopped
+    or its memory usage exceeds max_rss.
+    """
+    # imported here, the parent process does not need to load torch
+    from pdf_converter.pdf_converter import (
+        MarkerPDFConverter,
+        MarkerPDFConverterConfig,
+    )
+
+    converter = MarkerPDFConverter(config=MarkerPDFConverterConfig(**converter_config))
+    converter.warm_up()
+    connection.send(("ready", None, False))
+    while True:
+        try:
+            job: Optional[ConversionJob] = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        file, pages = job
+        try:
+            if pages is None:
+                result = converter.transform_file_to_markdown(file=file)
+            else:
+                result = converter.transform_pages_to_markdown(file=file, pages=pages)
+            status = "ok"
+        except Exception as e:
+            result = f"{type(e).__name__}: {e}"
+            status = "error"
+
+        # memory of torch and marker is not given back reliably, start fresh
+        exiting = max_rss > 0 and _peak_rss() > max_rss
+        connection.send((status, result, exiting))
+        if exiting:
+            return
+
+
+class ProcessPoolPDFConverterConfig(BaseModel):
+    """
+    converter_config is passed to MarkerPDFConverterConfig inside of the workers.
+    max_rss_mb 0 disables the recycling of workers.
+    """
+
+    worker: int
+    timeout: float
+    max_rss_mb: int
+    converter_config: dict
+
+
+class PDFConversionTimeoutException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class _ConverterProcess:
+    """
+    A single worker process and the pipe to talk to it.
+    """
+
+    _connection: Connection
+    _process: Any
+    _ready: bool
+
+    def __init__(self, context: Any, config: ProcessPoolPDFConverterConfig) -> None:
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(
+                config.converter_config,
+                child_connection,
+                config.max_rss_mb * 1024 * 1024,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        child_connection.close()
+        self._ready = False
+
+    def wait_ready(self):
+        if not self._ready:
+            # loading the models is not part of the job timeout
+            self._receive(timeout=None)
+            self._ready = True
+
+    def run(self, job: ConversionJob, timeout: float) -> List[str]:
+        self.wait_ready()
+        self._connection.send(job)
+        status, result, exiting = self._receive(timeout=timeout)
+        if exiting:
+            logger.info("Pdf converter worker exceeded the memory limit")
+            self._process.join()
+        if status == "error":
+            raise RuntimeError(f"Conversion of {job[0]} failed, {result}")
+        return result
+
+    def _receive(self, timeout: Optional[float]) -> Tuple[str, Any, bool]:
+        if not self._connection.poll(timeout):
+            raise PDFConversionTimeoutException(
+                f"Conversion did not finish within {timeout} sec"
+            )
+        try:
+            return self._connection.recv()
+        except EOFError:
+            self._process.join(timeout=5.0)
+            raise RuntimeError(
+                f"Converter process died with exit code {self._process.exitcode}"
+            )
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def stop(self):
+        try:
+            self._connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=5.0)
+        if self._process.is_alive():
+            self._process.kill()
+        self._connection.close()
+
+    def kill(self):
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+
+
+class ProcessPoolPDFConverter(PDFConverter):
+    """
+    Runs MarkerPDFConverter in dedicated worker processes.
+    Every worker loads its own models, the conversion neither blocks the event loop
+    nor competes with the request handling for the GIL.
+    Workers that exceed the timeout are killed, workers that use more than max_rss_mb are recycled.
+    Workers are started on first use or by warm_up.
+    Async conversions wait for the workers in an executor with one thread per worker,
+    queued conversions don't occupy the threads of the default executor.
+    """
+
+    _config: ProcessPoolPDFConverterConfig
+    _context: Any
+    _executor: ThreadPoolExecutor
+    _idle: "queue.Queue[_ConverterProcess]"
+    _lock: threading.Lock
+    _started: int
+    _ready: bool
+
+    def __init__(self, config: ProcessPoolPDFConverterConfig) -> None:
+        super().__init__()
+        self._config = config
+        # fork does not work with torch, threads and cuda
+        self._context = multiprocessing.get_context("spawn")
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.worker, thread_name_prefix="pdf-converter"
+        )
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._ready = False
+
+    def warm_up(self):
+        """
+        Starts all workers and waits until they loaded their models.
+        """
+        workers = []
+        try:
+            while self._take_slot():
+                workers.append(self._start_worker())
+            for worker in workers:
+                worker.wait_ready()
+            self._ready = True
+        finally:
+            for worker in workers:
+                self._release(worker)
+
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def cache_key(self) -> str:
+        return marker_cache_key(self._config.converter_config)
+
+    def transform_file_to_markdown(self, file: str) -> list[str]:
+        return self._run(job=(file, None))
+
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        return self._run(job=(file, pages))
+
+    async def transform_file_to_markdown_async(self, file: str) -> list[str]:
+        return await self._run_async(job=(file, None))
+
+    async def transform_pages_to_markdown_async(
+        self, file: str, pages: List[int]
+    ) -> list[str]:
+        return await self._run_async(job=(file, pages))
+
+    async def _run_async(self, job: ConversionJob) -> List[str]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._run, job
+        )
+
+    def _run(self, job: ConversionJob) -> List[str]:
+        worker = self._acquire()
+        try:
+            result = worker.run(job=job, timeout=self._config.timeout)
+            self._ready = True
+            return result
+        except PDFConversionTimeoutException:
+            logger.error(f"Conversion of {job[0]} timed out, restarting worker")
+            worker.kill()
+            raise
+        finally:
+            self._release(worker)
+
+    def _acquire(self) -> _ConverterProcess:
+        while True:
+            if self._take_slot():
+                return self._start_worker()
+            try:
+                return self._idle.get(timeout=self._config.timeout)
+            except queue.Empty:
+                # the slot of a worker that failed to start is taken in the next round
+                continue
+
+    def _take_slot(self) -> bool:
+        with self._lock:
+            if self._started < self._config.worker:
+                self._started += 1
+                return True
+            return False
+
+    def _start_worker(self) -> _ConverterProcess:
+        """
+        Starts the worker of a taken slot, the slot is given back if the start fails.
+        """
+        try:
+            return self._create_process()
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def _create_process(self) -> _ConverterProcess:
+        return _ConverterProcess(self._context, self._config)
+
+    def _release(self, worker: _ConverterProcess):
+        if not worker.is_alive():
+            logger.info("Replacing pdf converter worker")
+            try:
+                worker = self._start_worker()
+            except Exception as e:
+                logger.error(f"Pdf converter worker could not be started: {e}")
+                return
+        self._idle.put(worker)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                return
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import re
+from typing import List
+from pydantic import BaseModel
+from core.metrics import Metrics
+from pdf_converter.utils import get_page_count, package_version
+from usecases.storage import PDFConverter
+import PyPDF2
+
+
+logger = logging.getLogger(__name__)
+
+TEXT_LAYER_PAGES_METRIC = "pdf_pages_text_layer_total"
+FALLBACK_PAGES_METRIC = "pdf_pages_fallback_total"
+
+# glyphs without unicode mapping, typical for broken text layers
+UNMAPPED_GLYPH_PATTERN = re.compile(r"\(cid:\d+\)|�")
+
+
+def text_quality(text: str) -> float:
+    """
+    Share of the characters that look like regular text, between 0 and 1.
+    Pages without text (scans, images) have a quality of 0.
+    """
+    if len(text.strip()) == 0:
+        return 0.0
+    unmapped = sum(len(match) for match in UNMAPPED_GLYPH_PATTERN.findall(text))
+    regular = sum(1 for char in text if char.isprintable() or char.isspace())
+    return max(regular - unmapped, 0) / len(text)
+
+
+class TieredPDFConverterConfig(BaseModel):
+    """
+    Pages with less than min_chars characters or a quality below min_quality
+    are converted by the fallback converter.
+    """
+
+    min_chars: int = 20
+    min_quality: float = 0.9
+
+
+class TieredPDFConverter(PDFConverter):
+    """
+    Uses the text layer of the PDF where it is good enough
+    and converts only the remaining pages with the fallback converter, e.g. Marker.
+    Born-digital slides mostly have a usable text layer, scans and image-only pages don't.
+    The number of pages per tier is counted in the metrics.
+    """
+
+    _fallback: PDFConverter
+    _config: TieredPDFConverterConfig
+
+    def __init__(self, fallback: PDFConverter, config: TieredPDFConverterConfig):
+        super().__init__()
+        self._fallback = fallback
+        self._config = config
+
+    def transform_file_to_markdown(self, file: str) -> list[str]:
+        return self.transform_pages_to_markdown(
+            file=file, pages=list(range(get_page_count(file=file)))
+        )
+
+    def cache_key(self) -> str:
+        return (
+            f"text-layer-{package_version('PyPDF2')}-{self._config.min_chars}"
+            f"-{self._config.min_quality}+{self._fallback.cache_key()}"
+        )
+
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        markdown = self._extract_text_layer(file=file, pages=pages)
+        fallback_pages = [pages[i] for i in range(len(pages)) if markdown[i] is None]
+        converted: List[str] = []
+        if len(fallback_pages) > 0:
+            converted = self._fallback.transform_pages_to_markdown(
+                file=file, pages=fallback_pages
+            )
+        return self._merge(file, pages, markdown, fallback_pages, converted)
+
+    async def transform_file_to_markdown_async(self, file: str) -> list[str]:
+        page_count = await asyncio.to_thread(get_page_count, file)
+        return await self.transform_pages_to_markdown_async(
+            file=file, pages=list(range(page_count))
+        )
+
+    async def transform_pages_to_markdown_async(
+        self, file: str, pages: List[int]
+    ) -> list[str]:
+        """
+        The fallback is awaited, e.g. the process pool waits for its workers
+        without occupying a thread of the default executor.
+        """
+        markdown = await asyncio.to_thread(self._extract_text_layer, file, pages)
+        fallback_pages = [pages[i] for i in range(len(pages)) if markdown[i] is None]
+        converted: List[str] = []
+        if len(fallback_pages) > 0:
+            converted = await self._fallback.transform_pages_to_markdown_async(
+                file=file, pages=fallback_pages
+            )
+        return self._merge(file, pages, markdown, fallback_pages, converted)
+
+    def _merge(
+        self,
+        file: str,
+        pages: List[int],
+        markdown: List[str | None],
+        fallback_pages: List[int],
+        converted: List[str],
+    ) -> List[str]:
+        """
+        Fills the pages without usable text layer with the converted markdown.
+        """
+        remaining = iter(converted)
+        merged = [page if page is not None else next(remaining) for page in markdown]
+
+        Metrics.increment(TEXT_LAYER_PAGES_METRIC, len(pages) - len(fallback_pages))
+        Metrics.increment(FALLBACK_PAGES_METRIC, len(fallback_pages))
+        logger.info(
+            f"{file}: {len(pages) - len(fallback_pages)} pages from the text layer, "
+            f"{len(fallback_pages)} pages converted by the fallback"
+        )
+        return merged
+
+    def _extract_text_layer(self, file: str, pages: List[int]) -> List[str | None]:
+        """
+        Text of every page that passes the quality check, None for the others.
+        """
+        texts: List[str | None] = []
+        with open(file, "rb") as reader:
+            pdf = PyPDF2.PdfReader(reader)
+            for page in pages:
+                try:
+                    text = pdf.pages[page].extract_text() or ""
+                except Exception as e:
+                    logger.warning(f"Failed to read text layer of page {page}: {e}")
+                    text = ""
+                text = text.strip()
+                if (
+                    len(text) >= self._config.min_chars
+                    and text_quality(text) >= self._config.min_quality
+                ):
+                    texts.append(text)
+                else:
+                    texts.append(None)
+        return texts
+
+    def warm_up(self):
+        self._fallback.warm_up()
+
+    def is_ready(self) -> bool:
+        return self._fallback.is_ready()
+
+    def close(self):
+        self._fallback.close()
@@ -0,0 +1,129 @@
+import hashlib
+from importlib.metadata import PackageNotFoundError, version
+import json
+import logging
+import os
+from typing import Any, Dict, List
+import PyPDF2
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    StreamObject,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_page_count(file: str) -> int:
+    with open(file, "rb") as reader:
+        return len(PyPDF2.PdfReader(reader).pages)
+
+
+def file_sha256(file: str) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as reader:
+        for chunk in iter(lambda: reader.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def package_version(package: str) -> str:
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def marker_cache_key(converter_config: dict) -> str:
+    """
+    Cache key of MarkerPDFConverter, only settings that change the output are part of it.
+    Doesn't import marker, so it can be used outside of the converter processes.
+    """
+    relevant = {key: converter_config.get(key) for key in ["use_llm", "model"]}
+    marker_version = package_version("marker-pdf")
+    return f"marker-{marker_version}-{json.dumps(relevant, sort_keys=True)}"
+
+
+def page_fingerprints(file: str) -> List[str]:
+    """
+    Hash of every page, built from the content stream, the size, the fonts
+    and the images of the page. The same content stream with other fonts
+    can show another text, so pages of different PDFs are only equal with equal fonts.
+    Pages that can't be read get a random fingerprint, so they always count as changed.
+    """
+    fingerprints: List[str] = []
+    # fonts are shared by the pages, each object is hashed once
+    object_hashes: Dict[int, str] = {}
+    with open(file, "rb") as reader:
+        for page in PyPDF2.PdfReader(reader).pages:
+            digest = hashlib.sha256()
+            try:
+                digest.update(str(page.mediabox).encode("utf-8"))
+                # the contents can be an array of streams
+                digest.update(_object_hash(dict.get(page, "/Contents"), object_hashes))
+                _hash_resources(page, digest, object_hashes)
+            except Exception as e:
+                logger.warning(f"Failed to fingerprint page of {file}: {e}")
+                digest.update(os.urandom(16))
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def _hash_resources(
+    page: PyPDF2.PageObject, digest: Any, object_hashes: Dict[int, str]
+):
+    resources = page.get("/Resources")
+    if resources is None:
+        return
+    resources = resources.get_object()
+    for category in ["/Font", "/XObject"]:
+        entries = resources.get(category)
+        if entries is None:
+            continue
+        entries = entries.get_object()
+        for name in sorted(entries.keys()):
+            digest.update(name.encode("utf-8"))
+            digest.update(_object_hash(dict.get(entries, name), object_hashes))
+
+
+def _object_hash(obj: Any, object_hashes: Dict[int, str]) -> bytes:
+    """
+    Hash of a PDF object with all objects it references,
+    e.g. a font with its encoding, its ToUnicode map and its embedded font file.
+    """
+    if isinstance(obj, IndirectObject):
+        if obj.idnum not in object_hashes:
+            # guards against reference cycles
+            object_hashes[obj.idnum] = ""
+            object_hashes[obj.idnum] = _object_hash(
+                obj.get_object(), object_hashes
+            ).hex()
+        return bytes.fromhex(object_hashes[obj.idnum])
+
+    digest = hashlib.sha256()
+    if isinstance(obj, StreamObject):
+        digest.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        for key in sorted(obj.keys()):
+            if key in ["/Length", "/Filter", "/DecodeParms"]:
+                continue
+            digest.update(key.encode("utf-8"))
+            digest.update(_object_hash(dict.get(obj, key), object_hashes))
+    elif isinstance(obj, ArrayObject):
+        for item in list.__iter__(obj):
+            digest.update(_object_hash(item, object_hashes))
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+    return digest.digest()
+
+
+def changed_pages(old: List[str], new: List[str]) -> List[int]:
+    """
+    Indices of the pages whose fingerprint differs, pages that were added or removed included.
+    """
+    return [
+        i
+        for i in range(max(len(old), len(new)))
+        if i >= len(old) or i >= len(new) or old[i] != new[i]
+    ]
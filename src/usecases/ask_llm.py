@@ -41,3 +41,17 @@ class AskLLMUsecase(metaclass=SingletonMeta):
         result = self._llm.ask(messages=messages, filters=filters, model=model)
         timer.end()
         return result
+
+    async def run_async(
+        self,
+        messages: list[Message],
+        model: str,
+        filters: dict[str, list[str]] = {},
+    ) -> Result[LLMResponse]:
+        timer = RequestTimer()
+        timer.start("Ask LLM")
+        result = await self._llm.ask_async(
+            messages=messages, filters=filters, model=model
+        )
+        timer.end()
+        return result
@@ -1,7 +1,10 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from typing import Iterator, List
 from core.request_timer import RequestTimer
 from core.singelton import SingletonMeta
-from pdf_converter.pdf_converter import MarkerPDFConverter
+from pdf_converter.utils import get_page_count, page_fingerprints
 from usecases.storage import PDFConverter
 
 logger = logging.getLogger(__name__)
@@ -14,11 +17,11 @@ class PdfConverterUsecase(metaclass=SingletonMeta):
     """
     _pdf_converter: PDFConverter
 
-    def __init__(self, pdf_converter: MarkerPDFConverter) -> None:
+    def __init__(self, pdf_converter: PDFConverter) -> None:
         self._pdf_converter = pdf_converter
 
     @classmethod
-    def create(cls, pdf_converter: MarkerPDFConverter):
+    def create(cls, pdf_converter: PDFConverter):
         if cls not in SingletonMeta._instances:
             return cls(pdf_converter)
         else:
@@ -39,3 +42,77 @@ class PdfConverterUsecase(metaclass=SingletonMeta):
         logger.info(f"Converted file:{file} to Markdown. Converted {len(pages)} pages.")
         timer.end()
         return pages
+
+    async def run_async(self, file: str) -> list[str]:
+        timer = RequestTimer()
+        timer.start("Generate Markdown for PDF")
+        pages = await self._pdf_converter.transform_file_to_markdown_async(file=file)
+        logger.info(f"Converted file:{file} to Markdown. Converted {len(pages)} pages.")
+        timer.end()
+        return pages
+
+    def iter_pages(self, file: str, batch_size: int) -> Iterator[List[str]]:
+        """
+        Converts the file in batches of batch_size pages and yields every batch.
+        The next batch is converted while the caller processes the current one,
+        at most two batches are kept in memory.
+        """
+        pages = list(range(get_page_count(file=file)))
+        batches = [
+            pages[start : start + batch_size]
+            for start in range(0, len(pages), max(batch_size, 1))
+        ]
+        if len(batches) == 0:
+            return
+
+        timer = RequestTimer()
+        timer.start("Generate Markdown for PDF in batches")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                self._pdf_converter.transform_pages_to_markdown, file, batches[0]
+            )
+            for i in range(len(batches)):
+                markdown = future.result()
+                timer.checkpoint(
+                    f"Converted pages {batches[i][0] + 1}-{batches[i][-1] + 1}"
+                )
+                if i + 1 < len(batches):
+                    future = executor.submit(
+                        self._pdf_converter.transform_pages_to_markdown,
+                        file,
+                        batches[i + 1],
+                    )
+                yield markdown
+        logger.info(f"Converted file:{file} to Markdown. Converted {len(pages)} pages.")
+        timer.end()
+
+    async def run_pages_async(self, file: str, pages: List[int]) -> list[str]:
+        """
+        Converts only the given pages (0-based), e.g. the changed pages of an update.
+        """
+        timer = RequestTimer()
+        timer.start("Generate Markdown for PDF pages")
+        markdown = await self._pdf_converter.transform_pages_to_markdown_async(
+            file=file, pages=pages
+        )
+        logger.info(f"Converted {len(pages)} pages of file:{file} to Markdown.")
+        timer.end()
+        return markdown
+
+    async def fingerprint_pages_async(self, file: str) -> List[str]:
+        """
+        Hash of every page, used to find the pages that changed between two versions.
+        """
+        return await asyncio.to_thread(page_fingerprints, file)
+
+    def warm_up(self):
+        timer = RequestTimer()
+        timer.start("Load PDF converter models")
+        self._pdf_converter.warm_up()
+        timer.end()
+
+    def is_ready(self) -> bool:
+        return self._pdf_converter.is_ready()
+
+    def close(self):
+        self._pdf_converter.close()
@@ -1,22 +1,59 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from core.cache import LRUCache
+from core.metrics import Metrics
 from core.request_timer import RequestTimer
 from core.singelton import SingletonMeta
 from moodle.downloads import MoodleClient, MoodleFile
 
+logger = logging.getLogger(__name__)
+
+COURSE_CACHE_HIT_METRIC = "course_cache_hits_total"
+COURSE_CACHE_STALE_METRIC = "course_cache_stale_hits_total"
+COURSE_CACHE_MISS_METRIC = "course_cache_misses_total"
+
+
+class CourseCacheConfig(BaseModel):
+    """
+    Entries younger than ttl are used as they are.
+    Until ttl + stale_ttl the old list is returned and refreshed in the background.
+    """
+
+    ttl: float = 300.0
+    stale_ttl: float = 3600.0
+    max_courses: int = 1000
+
 
 class MoodleUsecase(metaclass=SingletonMeta):
     """
     Usecase for the interaction with the Moodle API.
+    The file lists of courses are cached, follow-up questions in a course
+    don't wait for moodle.
     """
 
     _moodle_client: MoodleClient
+    _cache_config: CourseCacheConfig
+    _course_cache: LRUCache[str, List[str]]
+    _loading: Dict[str, asyncio.Task]
 
-    def __init__(self, moodle_client: MoodleClient) -> None:
+    def __init__(
+        self, moodle_client: MoodleClient, cache_config: CourseCacheConfig
+    ) -> None:
         self._moodle_client = moodle_client
+        self._cache_config = cache_config
+        self._course_cache = LRUCache(max_size=cache_config.max_courses)
+        self._loading = {}
 
     @classmethod
-    def create(cls, moodle_client: MoodleClient):
+    def create(
+        cls,
+        moodle_client: MoodleClient,
+        cache_config: CourseCacheConfig = CourseCacheConfig(),
+    ):
         if cls not in SingletonMeta._instances:
-            return cls(moodle_client)
+            return cls(moodle_client, cache_config)
         else:
             raise RuntimeError("Singleton instance already created.")
 
@@ -28,16 +65,77 @@ class MoodleUsecase(metaclass=SingletonMeta):
             )
         return SingletonMeta._instances[cls]
 
-    def download_file(self, file_id: str) -> MoodleFile:
+    async def download_file(
+        self,
+        file_id: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> MoodleFile:
         timer = RequestTimer()
         timer.start("Download File form Moodle")
-        file = self._moodle_client.download(file_id=file_id)
+        file = await self._moodle_client.download(
+            file_id=file_id, etag=etag, last_modified=last_modified
+        )
         timer.end()
         return file
 
-    def get_file_ids_to_course(self, course_id: str) -> list[str]:
-        timer = RequestTimer()
-        timer.start("Download File form Moodle")
-        result = self._moodle_client.get_file_ids_for_course(courseId=course_id)
-        timer.end()
-        return result
+    async def get_file_ids_to_course(self, course_id: str) -> list[str]:
+        """
+        Returns a copy of the cached list, callers may modify it.
+        """
+        entry = self._course_cache.get(course_id)
+        if entry is not None:
+            age = entry.age()
+            if age < self._cache_config.ttl:
+                Metrics.increment(COURSE_CACHE_HIT_METRIC)
+                return list(entry.value)
+            if age < self._cache_config.ttl + self._cache_config.stale_ttl:
+                Metrics.increment(COURSE_CACHE_STALE_METRIC)
+                self._load_course(course_id=course_id)
+                return list(entry.value)
+
+        Metrics.increment(COURSE_CACHE_MISS_METRIC)
+        return list(await asyncio.shield(self._load_course(course_id=course_id)))
+
+    def invalidate_course(self, course_id: str) -> bool:
+        """
+        Drops the cached file list, e.g. after files were added to the course.
+        A request to moodle that is still running doesn't cache its list anymore.
+        Returns False if the course was neither cached nor loading.
+        """
+        loading = self._loading.pop(course_id, None)
+        return self._course_cache.invalidate(course_id) or loading is not None
+
+    def _load_course(self, course_id: str) -> asyncio.Task:
+        # concurrent requests for the same course share one request to moodle
+        task = self._loading.get(course_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch_course(course_id=course_id))
+            task.add_done_callback(self._log_failed_load)
+            self._loading[course_id] = task
+        return task
+
+    async def _fetch_course(self, course_id: str) -> List[str]:
+        try:
+            timer = RequestTimer()
+            timer.start("Download File form Moodle")
+            result = await self._moodle_client.get_file_ids_for_course(
+                courseId=course_id
+            )
+            timer.end()
+            # an invalidation during the request removed the task,
+            # the list may be older than the invalidation
+            if self._loading.get(course_id) is asyncio.current_task():
+                self._course_cache.put(course_id, result)
+            return result
+        finally:
+            if self._loading.get(course_id) is asyncio.current_task():
+                del self._loading[course_id]
+
+    @staticmethod
+    def _log_failed_load(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to load course files: {task.exception()}")
+
+    async def close(self):
+        await self._moodle_client.close()
@@ -0,0 +1,561 @@
+import asyncio
+import logging
+import weakref
+from typing import List, Optional
+from api.model import (
+    FileState,
+    IngestionJob,
+    IngestionJobPriority,
+    IngestionJobStatus,
+    IngestionProgress,
+    NotFoundException,
+)
+from api.utils.chains import get_posix_timestamp
+from core import Result
+from core.request_timer import RequestTimer
+from core.singelton import SingletonMeta
+from database.implementation import FileStateDatabase, IngestionJobDatabase
+from pdf_converter.utils import changed_pages
+from pydantic import BaseModel
+from usecases.convert_pdf_to_markdown import PdfConverterUsecase
+from usecases.download_file_from_moodle import MoodleUsecase
+from usecases.model.dto import Document
+from usecases.vector_db import VectorDBUsecases
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionConfig(BaseModel):
+    worker: int
+    poll_interval: float
+    job_timeout: float
+    recheck_interval: float
+    page_batch_size: int
+
+
+class IngestionUsecases(metaclass=SingletonMeta):
+    """
+    Usecase for ingesting moodle files into the vector database.
+    The request path only enqueues jobs, background workers download,
+    convert and embed the files.
+    Indexed files are checked for updates after the recheck interval,
+    only files whose content changed are converted and embedded again.
+    Files with the same SHA-256 share their nodes in the vector database.
+    Of updated files only the changed pages are converted and embedded again.
+    Files are converted, split and embedded in batches of pages,
+    the first pages are searchable before the whole file is converted.
+    Running jobs are refreshed regularly, the workers requeue the jobs
+    of dead workers once they weren't refreshed for the job timeout.
+    Jobs of the same file in different courses run one after another.
+    """
+
+    _database: IngestionJobDatabase
+    _file_states: FileStateDatabase
+    _config: IngestionConfig
+    _workers: List[asyncio.Task]
+    _wakeup: Optional[asyncio.Event]
+    _content_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]"
+    _file_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]"
+    _last_requeue: float
+
+    def __init__(
+        self,
+        database: IngestionJobDatabase,
+        file_states: FileStateDatabase,
+        config: IngestionConfig,
+    ) -> None:
+        self._database = database
+        self._file_states = file_states
+        self._config = config
+        self._workers = []
+        self._wakeup = None
+        self._content_locks = weakref.WeakValueDictionary()
+        self._file_locks = weakref.WeakValueDictionary()
+        self._last_requeue = 0
+
+    @classmethod
+    def create(
+        cls,
+        database: IngestionJobDatabase,
+        file_states: FileStateDatabase,
+        config: IngestionConfig,
+    ):
+        if cls not in SingletonMeta._instances:
+            return cls(database, file_states, config)
+        else:
+            raise RuntimeError("Singleton instance already created.")
+
+    @classmethod
+    def Instance(cls) -> "IngestionUsecases":
+        if cls not in SingletonMeta._instances:
+            raise RuntimeError(
+                "Singleton instance has not been created yet. Call `create` first."
+            )
+        return SingletonMeta._instances[cls]
+
+    async def start(self):
+        """
+        Starts the worker tasks on the running event loop.
+        """
+        self._wakeup = asyncio.Event()
+        await self._requeue_stale()
+        for i in range(self._config.worker):
+            self._workers.append(asyncio.create_task(self._work(worker_id=i)))
+
+    async def _requeue_stale(self):
+        """
+        Requeues the stale jobs, at most every quarter of the job timeout.
+        Running jobs are refreshed as often, see _keep_alive.
+        """
+        now = get_posix_timestamp()
+        if now - self._last_requeue < self._config.job_timeout / 4:
+            return
+        self._last_requeue = now
+        result = await self._database.requeue_stale(timeout=self._config.job_timeout)
+        if result.is_error():
+            logger.error(f"Failed to requeue stale jobs: {result.get_error()}")
+        elif result.get_ok():
+            logger.info(f"Requeued {result.get_ok()} stale ingestion jobs")
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(
+        self,
+        file_ids: List[str],
+        course_id: Optional[str],
+        priority: IngestionJobPriority = IngestionJobPriority.high,
+        force: bool = False,
+    ) -> Result[List[str]]:
+        """
+        Creates a job for every file that has no queued, running or finished job.
+        Finished files are checked again with low priority once the recheck interval passed,
+        force creates a new job for them immediately.
+        Returns the ids of all jobs that are not finished yet, rechecks are not included.
+        Concurrent calls for the same file share one job.
+        """
+        result = await self._database.find_latest_jobs(
+            file_ids=file_ids, course_id=course_id
+        )
+        if result.is_error():
+            return result.propagate_exception()
+        jobs = result.get_ok()
+
+        pending: List[str] = []
+        created = False
+        recheck_before = get_posix_timestamp() - self._config.recheck_interval
+        for file_id in file_ids:
+            job = jobs.get(file_id)
+            recheck = False
+            if job is not None and job.status == IngestionJobStatus.done.value:
+                recheck = (job.updated or job.timestamp) < recheck_before
+                if not recheck and not force:
+                    continue
+            elif job is not None and job.status != IngestionJobStatus.failed.value:
+                pending.append(str(job.id))
+                continue
+
+            result = await self._database.enqueue(
+                IngestionJob(
+                    fileId=file_id,
+                    courseId=course_id,
+                    priority=(IngestionJobPriority.low if recheck else priority).value,
+                    timestamp=get_posix_timestamp(),
+                )
+            )
+            if result.is_error():
+                return result.propagate_exception()
+            job_id, inserted = result.get_ok()
+            created = created or inserted
+            if not recheck:
+                pending.append(job_id)
+
+        if created and self._wakeup is not None:
+            self._wakeup.set()
+        return Result.Ok(pending)
+
+    async def prefetch_course(self, course_id: str) -> Result[IngestionProgress]:
+        """
+        Enqueues every file of the course with low priority.
+        Questions of users are processed first, the worker count bounds the concurrency.
+        """
+        timer = RequestTimer()
+        timer.start(f"Prefetch course {course_id}")
+        file_ids = await self._get_file_ids(course_id=course_id)
+        result = await self.enqueue(
+            file_ids=file_ids, course_id=course_id, priority=IngestionJobPriority.low
+        )
+        if result.is_error():
+            return result.propagate_exception()
+        logger.info(f"Prefetch of course {course_id}, {len(result.get_ok())} open jobs")
+        timer.end()
+        return await self._progress(course_id=course_id, file_ids=file_ids)
+
+    async def reindex(self) -> Result[int]:
+        """
+        Stores every indexed file again, e.g. after the chunking or the embedding changed.
+        Unchanged files are not downloaded, their markdown comes from the conversion cache.
+        Returns the number of files.
+        """
+        result = await self._file_states.mark_all_unindexed()
+        if result.is_error():
+            return result.propagate_exception()
+        states = result.get_ok()
+
+        for state in states:
+            for course_id in state.courseIds or [None]:
+                result = await self.enqueue(
+                    file_ids=[state.fileId],
+                    course_id=course_id,
+                    priority=IngestionJobPriority.low,
+                    force=True,
+                )
+                if result.is_error():
+                    return result.propagate_exception()
+        logger.info(f"Reindexing {len(states)} files")
+        return Result.Ok(len(states))
+
+    async def course_progress(self, course_id: str) -> Result[IngestionProgress]:
+        file_ids = await self._get_file_ids(course_id=course_id)
+        return await self._progress(course_id=course_id, file_ids=file_ids)
+
+    async def _get_file_ids(self, course_id: str) -> List[str]:
+        file_ids = await MoodleUsecase.Instance().get_file_ids_to_course(
+            course_id=course_id
+        )
+        return [file_id for file_id in file_ids if file_id != ""]
+
+    async def _progress(
+        self, course_id: str, file_ids: List[str]
+    ) -> Result[IngestionProgress]:
+        result = await self._database.find_latest_jobs(
+            file_ids=file_ids, course_id=course_id
+        )
+        if result.is_error():
+            return result.propagate_exception()
+        jobs = result.get_ok()
+
+        progress = IngestionProgress(courseId=course_id, total=len(file_ids))
+        for file_id in file_ids:
+            job = jobs.get(file_id)
+            if job is None:
+                progress.missing += 1
+            elif job.status == IngestionJobStatus.queued.value:
+                progress.queued += 1
+            elif job.status == IngestionJobStatus.running.value:
+                progress.running += 1
+            elif job.status == IngestionJobStatus.done.value:
+                progress.done += 1
+            else:
+                progress.failed += 1
+                progress.failedFileIds.append(file_id)
+        return Result.Ok(progress)
+
+    async def find_job(self, job_id: str) -> Result[IngestionJob]:
+        return await self._database.get(id=job_id)
+
+    async def find_jobs(
+        self,
+        file_id: Optional[str] = None,
+        course_id: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> Result[List[IngestionJob]]:
+        query = {}
+        if file_id:
+            query["fileId"] = file_id
+        if course_id:
+            query["courseId"] = course_id
+        if status:
+            query["status"] = status
+        return await self._database.run_query(query=query)
+
+    async def _work(self, worker_id: int):
+        assert self._wakeup is not None
+        while True:
+            try:
+                await self._requeue_stale()
+                result = await self._database.claim_next()
+                if result.is_error():
+                    logger.error(
+                        f"Worker {worker_id} failed to claim job: {result.get_error()}"
+                    )
+                    await asyncio.sleep(self._config.poll_interval)
+                    continue
+
+                job = result.get_ok()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._wakeup.wait(), timeout=self._config.poll_interval
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker {worker_id} crashed while processing a job: {e}")
+
+    async def _process(self, job: IngestionJob):
+        assert job.id is not None
+        timer = RequestTimer()
+        timer.start(f"Ingest file {job.fileId}")
+        keep_alive = asyncio.create_task(self._keep_alive(job_id=str(job.id)))
+        try:
+            await self._ingest_file(file_id=job.fileId, course_id=job.courseId)
+            result = await self._database.set_status(job.id, IngestionJobStatus.done)
+        except Exception as e:
+            logger.error(f"Ingestion of file {job.fileId} failed: {e}")
+            result = await self._database.set_status(
+                job.id, IngestionJobStatus.failed, error=str(e)
+            )
+        finally:
+            keep_alive.cancel()
+        if result.is_error():
+            # the job stays running and is requeued once it is stale
+            logger.error(
+                f"Failed to set the status of job {job.id}: {result.get_error()}"
+            )
+        timer.end()
+
+    async def _keep_alive(self, job_id: str):
+        """
+        Refreshes the running job, so long conversions aren't requeued as stale.
+        """
+        while True:
+            await asyncio.sleep(self._config.job_timeout / 4)
+            result = await self._database.touch(job_id)
+            if result.is_error():
+                logger.error(f"Failed to refresh job {job_id}: {result.get_error()}")
+
+    async def _ingest_file(self, file_id: str, course_id: Optional[str]):
+        # jobs of the file in other courses would overwrite the course ids of the state
+        async with self._file_lock(file_id):
+            await self._ingest_file_locked(file_id=file_id, course_id=course_id)
+
+    async def _ingest_file_locked(self, file_id: str, course_id: Optional[str]):
+        result = await self._file_states.find_by_file_id(file_id=file_id)
+        if result.is_error():
+            raise result.get_error()
+        state = result.get_ok() or FileState(fileId=file_id)
+        previous = state.model_copy(deep=True)
+
+        file = await MoodleUsecase.Instance().download_file(
+            file_id=file_id, etag=state.etag, last_modified=state.lastModified
+        )
+        state.checked = get_posix_timestamp()
+        if file.has_been_downloaded:
+            # servers without conditional requests send the file again,
+            # the hash tells if the content really changed
+            if file.sha256 != state.sha256:
+                state.indexed = False
+                state.updated = state.checked
+            state.filename = file.org_filename
+            state.etag = file.etag
+            state.lastModified = file.last_modified
+            state.size = file.size
+            state.sha256 = file.sha256
+
+        if state.indexed:
+            logger.info(f"File {file_id} is unchanged")
+            if course_id is not None and course_id not in state.courseIds:
+                await asyncio.to_thread(self._attach_file, file_id, file_id, course_id)
+                state.courseIds.append(course_id)
+            await self._save_state(state)
+            return
+
+        # files with the same content are indexed one after another,
+        # so copies are attached instead of converted twice
+        async with self._content_lock(state.sha256):
+            owner = None
+            if state.sha256 is not None:
+                result = await self._file_states.find_indexed_by_hash(
+                    sha256=state.sha256, exclude_file_id=file_id
+                )
+                if result.is_error():
+                    raise result.get_error()
+                owner = result.get_ok()
+
+            # saved before indexing, so an interrupted run is retried
+            await self._save_state(state)
+            if owner is not None:
+                logger.info(f"File {file_id} has the same content as {owner.fileId}")
+                try:
+                    await asyncio.to_thread(
+                        self._attach_file, owner.fileId, file_id, course_id
+                    )
+                    # the nodes belong to the owner
+                    state.pageFingerprints = []
+                except NotFoundException as e:
+                    logger.warning(f"{e}, storing file {file_id} again")
+                    owner = None
+            if owner is None:
+                fingerprints = (
+                    await PdfConverterUsecase.Instance().fingerprint_pages_async(
+                        file=file.local_filename
+                    )
+                )
+                if await self._update_pages(
+                    file=file.local_filename,
+                    course_id=course_id,
+                    previous=previous,
+                    fingerprints=fingerprints,
+                ):
+                    course_ids = previous.courseIds
+                else:
+                    metadata = {
+                        "course_id": course_id,
+                        "file_id": file_id,
+                        "filename": state.filename,
+                    }
+                    # embedding is blocking, keep it off the event loop
+                    await asyncio.to_thread(
+                        self._store_file, file.local_filename, file_id, metadata
+                    )
+                    course_ids = [course_id] if course_id is not None else []
+                state.pageFingerprints = fingerprints
+            else:
+                course_ids = [course_id] if course_id is not None else []
+            state.indexed = True
+            state.courseIds = course_ids
+            await self._save_state(state)
+
+    async def _update_pages(
+        self,
+        file: str,
+        course_id: Optional[str],
+        previous: FileState,
+        fingerprints: List[str],
+    ) -> bool:
+        """
+        Converts and embeds only the pages that differ from the previous version.
+        Returns False if the file has to be stored completely, e.g. if its nodes
+        are shared with copies or it was not indexed page by page before.
+        """
+        if (
+            not previous.indexed
+            or previous.sha256 is None
+            or len(previous.pageFingerprints) == 0
+            or (course_id is not None and course_id not in previous.courseIds)
+        ):
+            return False
+        result = await self._file_states.find_indexed_by_hash(
+            sha256=previous.sha256, exclude_file_id=previous.fileId
+        )
+        if result.is_error():
+            raise result.get_error()
+        if result.get_ok() is not None:
+            return False
+
+        changed = changed_pages(previous.pageFingerprints, fingerprints)
+        if len(changed) >= len(fingerprints):
+            return False
+
+        # nodes span several pages, the unchanged parts of them are stored again
+        result = await asyncio.to_thread(
+            VectorDBUsecases.Instance().delete_pages,
+            previous.fileId,
+            [page + 1 for page in changed],
+        )
+        if result.is_error():
+            raise result.get_error()
+        pages = [page - 1 for page in result.get_ok() if page <= len(fingerprints)]
+        logger.info(
+            f"File {previous.fileId}: {len(changed)} pages changed, "
+            f"storing {len(pages)} of {len(fingerprints)} pages again"
+        )
+        if len(pages) == 0:
+            return True
+
+        markdown = dict(
+            zip(
+                pages,
+                await PdfConverterUsecase.Instance().run_pages_async(
+                    file=file, pages=pages
+                ),
+            )
+        )
+        metadata = {
+            "course_id": (
+                previous.courseIds[0]
+                if len(previous.courseIds) == 1
+                else previous.courseIds or None
+            ),
+            "file_id": previous.fileId,
+            "filename": previous.filename,
+        }
+        for span in _contiguous_spans(pages):
+            result = await VectorDBUsecases.Instance().store_doc_async(
+                doc=Document(
+                    id=previous.fileId,
+                    content=[markdown[page] for page in span],
+                    metadata=metadata,
+                ),
+                first_page=span[0] + 1,
+            )
+            if result.is_error():
+                raise result.get_error()
+        return True
+
+    def _content_lock(self, sha256: Optional[str]) -> asyncio.Lock:
+        if sha256 is None:
+            return asyncio.Lock()
+        lock = self._content_locks.get(sha256)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._content_locks[sha256] = lock
+        return lock
+
+    def _file_lock(self, file_id: str) -> asyncio.Lock:
+        lock = self._file_locks.get(file_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._file_locks[file_id] = lock
+        return lock
+
+    async def _save_state(self, state: FileState):
+        result = await self._file_states.save(state)
+        if result.is_error():
+            raise result.get_error()
+
+    def _attach_file(self, owner_file_id: str, file_id: str, course_id: Optional[str]):
+        if owner_file_id != file_id:
+            # nodes of an older version of the file are replaced
+            result = VectorDBUsecases.Instance().delete_doc(file_id=file_id)
+            if result.is_error():
+                raise result.get_error()
+
+        result = VectorDBUsecases.Instance().attach_doc(
+            file_id=owner_file_id, new_file_id=file_id, course_id=course_id
+        )
+        if result.is_error():
+            raise result.get_error()
+
+    def _store_file(self, file: str, file_id: str, metadata: dict):
+        # nodes of an older version of the file are replaced
+        result = VectorDBUsecases.Instance().replace_doc(
+            doc=Document(id=file_id, content=[], metadata=metadata),
+            batches=PdfConverterUsecase.Instance().iter_pages(
+                file=file, batch_size=self._config.page_batch_size
+            ),
+        )
+        if result.is_error():
+            raise result.get_error()
+
+
+def _contiguous_spans(pages: List[int]) -> List[List[int]]:
+    spans: List[List[int]] = []
+    for page in sorted(pages):
+        if len(spans) > 0 and spans[-1][-1] == page - 1:
+            spans[-1].append(page)
+        else:
+            spans.append([page])
+    return spans
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import asyncio
 from enum import Enum
 from typing import Dict, List
 from api.model import Message
@@ -34,3 +35,11 @@ class RAGLLM(ABC):
         self, messages: List[Message], model: str, filters: Dict[str, List[str]] = {}
     ) -> Result[LLMResponse]:
         pass
+
+    async def ask_async(
+        self, messages: List[Message], model: str, filters: Dict[str, List[str]] = {}
+    ) -> Result[LLMResponse]:
+        """
+        Answers without blocking the event loop.
+        """
+        return await asyncio.to_thread(self.ask, messages, model, filters)
@@ -0,0 +1,72 @@
+import logging
+from typing import Dict, List, Optional
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+from core.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+AUTO_MERGED_NODES_METRIC = "retrieval_auto_merged_nodes_total"
+
+
+class AutoMergePostprocessor(BaseNodePostprocessor):
+    """
+    Replaces retrieved children of the hierarchical chunking by their parent,
+    if at least two and at least merge_ratio of the children of the parent were retrieved.
+    The parent gets the best score of its children, nodes without parent are kept.
+    Runs after the reranker, which truncates long texts and would only see
+    the beginning of a parent.
+    """
+
+    vector_store: BasePydanticVectorStore
+    merge_ratio: float = Field(default=0.5)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AutoMergePostprocessor"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        siblings: Dict[str, List[NodeWithScore]] = {}
+        for node in nodes:
+            parent = node.node.parent_node
+            if parent is not None:
+                siblings.setdefault(parent.node_id, []).append(node)
+
+        candidates = [id for id, hits in siblings.items() if len(hits) >= 2]
+        if len(candidates) == 0:
+            return nodes
+        try:
+            parents = {
+                parent.node_id: parent
+                for parent in self.vector_store.get_nodes(node_ids=candidates)
+            }
+        except Exception as e:
+            logger.error(f"Failed to load parent nodes, results are not merged: {e}")
+            return nodes
+
+        merged: Dict[str, NodeWithScore] = {}
+        result: List[NodeWithScore] = []
+        for node in nodes:
+            parent_info = node.node.parent_node
+            parent = parents.get(parent_info.node_id) if parent_info else None
+            if parent is None or len(siblings[parent.node_id]) < self.merge_ratio * len(
+                parent.child_nodes or []
+            ):
+                result.append(node)
+                continue
+            if parent.node_id not in merged:
+                hits = siblings[parent.node_id]
+                scores = [hit.score for hit in hits if hit.score is not None]
+                merged[parent.node_id] = NodeWithScore(
+                    node=parent, score=max(scores) if len(scores) > 0 else None
+                )
+                result.append(merged[parent.node_id])
+            Metrics.increment(AUTO_MERGED_NODES_METRIC)
+        return result
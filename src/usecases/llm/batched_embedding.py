@@ -0,0 +1,194 @@
+import asyncio
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from pydantic import BaseModel
+from core.lazy import Lazy
+from core.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_QUEUE_DEPTH_METRIC = "embedding_queue_depth"
+EMBEDDING_TEXTS_METRIC = "embedding_texts_total"
+EMBEDDING_BATCHES_METRIC = "embedding_batches_total"
+EMBEDDING_SECONDS_METRIC = "embedding_seconds_total"
+EMBEDDING_BATCH_SIZE_METRIC = "embedding_last_batch_size"
+EMBEDDING_THROUGHPUT_METRIC = "embedding_texts_per_second"
+
+# prompt names of the sentence transformers model
+QUERY = "query"
+TEXT = "text"
+
+
+class BatchedEmbeddingConfig(BaseModel):
+    """
+    max_batch_size texts are embedded together at most,
+    a batch waits up to max_latency seconds for further requests.
+    """
+
+    max_batch_size: int
+    max_latency: float
+
+
+class _EmbeddingRequest:
+    kind: str
+    texts: List[str]
+    future: "Future[List[Embedding]]"
+
+    def __init__(self, kind: str, texts: List[str]) -> None:
+        self.kind = kind
+        self.texts = texts
+        self.future = Future()
+
+
+class BatchedEmbedding(BaseEmbedding):
+    """
+    Embedding model shared by the ingestion and the queries.
+    Requests of all threads and coroutines are collected into one queue,
+    a single worker thread embeds them in dynamic batches:
+    the first request waits up to max_latency for others, up to max_batch_size texts.
+    The texts of a batch are sorted by length into buckets, so little padding is computed.
+    Queue depth and throughput are exposed as metrics.
+    """
+
+    _model: Lazy[HuggingFaceEmbedding] = PrivateAttr()
+    _config: BatchedEmbeddingConfig = PrivateAttr()
+    _queue: "queue.Queue[_EmbeddingRequest]" = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _worker: Optional[threading.Thread] = PrivateAttr(default=None)
+    _waiting: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        load: Callable[[], HuggingFaceEmbedding],
+        config: BatchedEmbeddingConfig,
+        model_name: str,
+    ) -> None:
+        super().__init__(model_name=model_name, embed_batch_size=config.max_batch_size)
+        self._model = Lazy(load, name=f"embedding model {model_name}")
+        self._config = config
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedEmbedding"
+
+    def load(self):
+        self._model.get()
+
+    def is_loaded(self) -> bool:
+        return self._model.is_loaded()
+
+    def _submit(self, kind: str, texts: List[str]) -> "Future[List[Embedding]]":
+        request = _EmbeddingRequest(kind=kind, texts=texts)
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding", daemon=True
+                )
+                self._worker.start()
+            self._waiting += len(texts)
+            Metrics.set(EMBEDDING_QUEUE_DEPTH_METRIC, self._waiting)
+        self._queue.put(request)
+        return request.future
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._submit(QUERY, [query]).result()[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return (await asyncio.wrap_future(self._submit(QUERY, [query])))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._submit(TEXT, [text]).result()[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await asyncio.wrap_future(self._submit(TEXT, [text])))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._submit(TEXT, texts).result()
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await asyncio.wrap_future(self._submit(TEXT, texts))
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # queries first, a user is waiting for them
+            for kind in [QUERY, TEXT]:
+                requests = [request for request in batch if request.kind == kind]
+                if len(requests) > 0:
+                    self._embed(kind=kind, requests=requests)
+
+    def _collect(self) -> List[_EmbeddingRequest]:
+        """
+        Waits for the first request, then collects further requests
+        until the batch is full or max_latency passed.
+        """
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self._config.max_latency
+        while size < self._config.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _embed(self, kind: str, requests: List[_EmbeddingRequest]):
+        texts: List[Tuple[str, int, int]] = [
+            (text, i, j)
+            for i, request in enumerate(requests)
+            for j, text in enumerate(request.texts)
+        ]
+        # similar lengths in one bucket, short texts are not padded to long ones
+        texts.sort(key=lambda text: len(text[0]))
+        results: Dict[Tuple[int, int], Embedding] = {}
+        start = time.monotonic()
+        try:
+            model = self._model.get()
+            for offset in range(0, len(texts), self._config.max_batch_size):
+                bucket = texts[offset : offset + self._config.max_batch_size]
+                # one forward pass with the prompt of the sentence transformers model
+                embeddings = model._embed(
+                    [text for text, _, _ in bucket], prompt_name=kind
+                )
+                for (_, i, j), embedding in zip(bucket, embeddings):
+                    results[(i, j)] = embedding
+        except Exception as e:
+            logger.error(f"Embedding of {len(texts)} texts failed: {e}")
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        finally:
+            self._record(texts=len(texts), seconds=time.monotonic() - start)
+
+        for i, request in enumerate(requests):
+            request.future.set_result(
+                [results[(i, j)] for j in range(len(request.texts))]
+            )
+
+    def _record(self, texts: int, seconds: float):
+        with self._lock:
+            self._waiting -= texts
+            Metrics.set(EMBEDDING_QUEUE_DEPTH_METRIC, self._waiting)
+        Metrics.increment(EMBEDDING_TEXTS_METRIC, texts)
+        Metrics.increment(EMBEDDING_BATCHES_METRIC)
+        Metrics.increment(EMBEDDING_SECONDS_METRIC, seconds)
+        Metrics.set(EMBEDDING_BATCH_SIZE_METRIC, texts)
+        if seconds > 0:
+            Metrics.set(EMBEDDING_THROUGHPUT_METRIC, texts / seconds)
@@ -0,0 +1,284 @@
+import array
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from core.metrics import Metrics
+
+
+DENSE = "dense"
+SPARSE = "sparse"
+
+# SparseEncoderCallable of llama-index: indices and values of every text
+SparseVectors = Tuple[List[List[int]], List[List[float]]]
+
+
+def _hit_metric(kind: str) -> str:
+    return f"embedding_cache_{kind}_hits_total"
+
+
+def _miss_metric(kind: str) -> str:
+    return f"embedding_cache_{kind}_misses_total"
+
+
+def _rate_metric(kind: str) -> str:
+    return f"embedding_cache_{kind}_hit_rate"
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the text with normalized whitespace."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Dense and sparse vectors of embedded texts, stored in a sqlite file.
+    Entries are keyed by the model and the hash of the normalized text,
+    so unchanged chunks of an updated or copied document are not embedded again.
+    If the cache grows beyond max_bytes, the least recently used vectors are removed.
+    """
+
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _max_bytes: int
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS vectors (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS vectors_accessed ON vectors (accessed)"
+            )
+
+    def get_dense(self, model: str, texts: Sequence[str]) -> List[Optional[Embedding]]:
+        """
+        Cached vector of every text, None for missing texts.
+        """
+        return [
+            None if blob is None else array.array("f", blob).tolist()
+            for blob in self._get(model=model, kind=DENSE, texts=texts)
+        ]
+
+    def put_dense(self, model: str, texts: Sequence[str], vectors: List[Embedding]):
+        self._put(
+            model=model,
+            texts=texts,
+            blobs=[array.array("f", vector).tobytes() for vector in vectors],
+        )
+
+    def get_sparse(
+        self, model: str, texts: Sequence[str]
+    ) -> List[Optional[Tuple[List[int], List[float]]]]:
+        """
+        Cached indices and values of every text, None for missing texts.
+        """
+        vectors: List[Optional[Tuple[List[int], List[float]]]] = []
+        for blob in self._get(model=model, kind=SPARSE, texts=texts):
+            if blob is None:
+                vectors.append(None)
+                continue
+            # the first half are the indices, the second the values
+            half = len(blob) // 2
+            vectors.append(
+                (
+                    array.array("i", blob[:half]).tolist(),
+                    array.array("f", blob[half:]).tolist(),
+                )
+            )
+        return vectors
+
+    def put_sparse(
+        self,
+        model: str,
+        texts: Sequence[str],
+        indices: List[List[int]],
+        values: List[List[float]],
+    ):
+        self._put(
+            model=model,
+            texts=texts,
+            blobs=[
+                array.array("i", text_indices).tobytes()
+                + array.array("f", text_values).tobytes()
+                for text_indices, text_values in zip(indices, values)
+            ],
+        )
+
+    def _get(
+        self, model: str, kind: str, texts: Sequence[str]
+    ) -> List[Optional[bytes]]:
+        found: List[Optional[bytes]] = []
+        with self._lock, self._connection:
+            for text in texts:
+                row = self._connection.execute(
+                    "SELECT rowid, vector FROM vectors "
+                    "WHERE model = ? AND text_hash = ?",
+                    (model, text_hash(text)),
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE vectors SET accessed = ? WHERE rowid = ?",
+                        (time.time(), row[0]),
+                    )
+                found.append(None if row is None else row[1])
+
+        hits = sum(1 for blob in found if blob is not None)
+        Metrics.increment(_hit_metric(kind), hits)
+        Metrics.increment(_miss_metric(kind), len(found) - hits)
+        total = Metrics.get(_hit_metric(kind)) + Metrics.get(_miss_metric(kind))
+        if total > 0:
+            Metrics.set(_rate_metric(kind), Metrics.get(_hit_metric(kind)) / total)
+        return found
+
+    def _put(self, model: str, texts: Sequence[str], blobs: List[bytes]):
+        now = time.time()
+        rows = [
+            (model, text_hash(text), blob, len(blob), now)
+            for text, blob in zip(texts, blobs)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO vectors "
+                "(model, text_hash, vector, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM vectors"
+        ).fetchone()
+        if total <= self._max_bytes:
+            return
+
+        evicted = []
+        for rowid, size in self._connection.execute(
+            "SELECT rowid, size FROM vectors ORDER BY accessed"
+        ):
+            if total <= self._max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self._connection.executemany("DELETE FROM vectors WHERE rowid = ?", evicted)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Returns the vectors of texts that were embedded before from the cache,
+    only missing texts are embedded by the wrapped model.
+    Queries are not cached, they are embedded with another prompt.
+    """
+
+    _embedding: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embedding: BaseEmbedding, cache: EmbeddingCache) -> None:
+        super().__init__(
+            model_name=embedding.model_name,
+            embed_batch_size=embedding.embed_batch_size,
+        )
+        self._embedding = embedding
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embedding.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embedding.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        vectors = self._cache.get_dense(model=self.model_name, texts=texts)
+        missing = [texts[i] for i in range(len(texts)) if vectors[i] is None]
+        if len(missing) > 0:
+            embedded = self._embedding.get_text_embedding_batch(missing)
+            self._cache.put_dense(
+                model=self.model_name, texts=missing, vectors=embedded
+            )
+            return self._fill(vectors, embedded)
+        return vectors  # type: ignore
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        vectors = self._cache.get_dense(model=self.model_name, texts=texts)
+        missing = [texts[i] for i in range(len(texts)) if vectors[i] is None]
+        if len(missing) > 0:
+            embedded = await self._embedding.aget_text_embedding_batch(missing)
+            self._cache.put_dense(
+                model=self.model_name, texts=missing, vectors=embedded
+            )
+            return self._fill(vectors, embedded)
+        return vectors  # type: ignore
+
+    @staticmethod
+    def _fill(vectors: List[Optional[Any]], embedded: List[Any]) -> List[Any]:
+        missing = iter(embedded)
+        return [vector if vector is not None else next(missing) for vector in vectors]
+
+
+class CachedSparseEncoder:
+    """
+    Sparse document encoder of the hybrid search with the same cache,
+    only missing texts are encoded by the wrapped encoder.
+    model_name is resolved on the first call, the encoder depends on the collection.
+    """
+
+    _encoder: Callable[[List[str]], SparseVectors]
+    _cache: EmbeddingCache
+    _model_name: Callable[[], str]
+    _resolved_name: Optional[str]
+
+    def __init__(
+        self,
+        encoder: Callable[[List[str]], SparseVectors],
+        cache: EmbeddingCache,
+        model_name: Callable[[], str],
+    ) -> None:
+        self._encoder = encoder
+        self._cache = cache
+        self._model_name = model_name
+        self._resolved_name = None
+
+    def __call__(self, texts: List[str]) -> SparseVectors:
+        if self._resolved_name is None:
+            self._resolved_name = self._model_name()
+        cached = self._cache.get_sparse(model=self._resolved_name, texts=texts)
+        missing = [texts[i] for i in range(len(texts)) if cached[i] is None]
+        if len(missing) > 0:
+            indices, values = self._encoder(missing)
+            self._cache.put_sparse(
+                model=self._resolved_name, texts=missing, indices=indices, values=values
+            )
+            cached = CachedEmbedding._fill(cached, list(zip(indices, values)))
+        return (
+            [vector[0] for vector in cached],  # type: ignore
+            [vector[1] for vector in cached],  # type: ignore
+        )
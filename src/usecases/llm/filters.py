@@ -0,0 +1,24 @@
+from typing import Dict, List
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+
+def to_metadata_filters(filters: Dict[str, List[str]]) -> MetadataFilters:
+    """
+    One IN condition per key (a MatchAny in Qdrant) instead of one EQ condition
+    per value, a course with hundreds of files doesn't become a filter
+    with hundreds of clauses.
+    The keys are joined with OR, keys without values are ignored.
+    """
+    return MetadataFilters(
+        filters=[
+            MetadataFilter(key=key, value=list(values), operator=FilterOperator.IN)
+            for key, values in filters.items()
+            if len(values) > 0
+        ],
+        condition=FilterCondition.OR,
+    )
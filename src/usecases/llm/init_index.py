@@ -1,11 +1,19 @@
-from typing import Optional
+from typing import List, Optional, cast
+from core.lazy import Lazy
 from core.singelton import SingletonMeta
 from llama_index.core import VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.ollama import Ollama
 from llama_index.postprocessor.colbert_rerank import ColbertRerank
+from llama_index.vector_stores.qdrant import QdrantVectorStore
 from pydantic import BaseModel
+from usecases.llm.auto_merge import AutoMergePostprocessor
+from usecases.llm.batched_embedding import BatchedEmbedding, BatchedEmbeddingConfig
+from usecases.llm.embedding_cache import CachedEmbedding, EmbeddingCache
+from usecases.llm.neighbor_expansion import NeighborExpansionPostprocessor
 
 
 class LlamaIndexRAGConfig(BaseModel):
@@ -18,7 +26,11 @@ class LlamaIndexRAGConfig(BaseModel):
     top_n_count_reranker: int
     top_n_count_dens: int
     top_n_count_sparse: int
+    auto_merge_ratio: float
+    neighbor_window: int
     device: str
+    embedding_batch_size: int
+    embedding_max_latency: float
 
     ollama_url: str
     llm_model: str
@@ -27,36 +39,87 @@ class LlamaIndexRAGConfig(BaseModel):
     context_window: int
 
 
+# embedded once at startup, the length of its vector is the size of the collection
+DIMENSION_PROBE = "dimension"
+
+
+def create_embedding(config: LlamaIndexRAGConfig) -> BatchedEmbedding:
+    """
+    The embedding model, loaded on first use.
+    """
+    return BatchedEmbedding(
+        load=lambda: HuggingFaceEmbedding(
+            model_name=config.embedding_mode,
+            device=config.device,
+            trust_remote_code=True,
+            embed_batch_size=config.embedding_batch_size,
+        ),
+        config=BatchedEmbeddingConfig(
+            max_batch_size=config.embedding_batch_size,
+            max_latency=config.embedding_max_latency,
+        ),
+        model_name=config.embedding_mode,
+    )
+
+
+def embedding_dimension(
+    embedding: BaseEmbedding, embedding_cache: Optional[EmbeddingCache] = None
+) -> int:
+    """
+    Number of dimensions of the dense vectors of the model.
+    With the embedding cache the model is only loaded for this on the first start,
+    otherwise it is loaded here instead of on first use.
+    """
+    if embedding_cache is not None:
+        embedding = CachedEmbedding(embedding=embedding, cache=embedding_cache)
+    return len(embedding.get_text_embedding(DIMENSION_PROBE))
+
+
 class LLamaIndexHolder(metaclass=SingletonMeta):
     """
     Holdes References to AI Models and Indexes
+    The models are loaded on first use or by warm_up,
+    so the application starts without waiting for them.
     """
-    _index: Optional[VectorStoreIndex]
-    _colbert_reranker: Optional[ColbertRerank]
-    _embedding_model: Optional[HuggingFaceEmbedding]
+    _index: Lazy[VectorStoreIndex]
+    _colbert_reranker: Lazy[ColbertRerank]
+    _auto_merge: AutoMergePostprocessor
+    _neighbor_expansion: NeighborExpansionPostprocessor
+    _embedding: BatchedEmbedding
+    _cached_embedding: Optional[CachedEmbedding]
     _llm: Optional[Ollama]
 
     def __init__(
         self,
         vector_store: BasePydanticVectorStore,
         config: LlamaIndexRAGConfig,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding: Optional[BatchedEmbedding] = None,
     ):
         self._config = config
 
-        self._colbert_reranker = ColbertRerank(
-            top_n=config.top_n_count_reranker,
-            model="colbert-ir/colbertv2.0",
-            tokenizer="colbert-ir/colbertv2.0",
-            device=config.device,
-            keep_retrieval_score=True,
+        self._colbert_reranker = Lazy(
+            lambda: ColbertRerank(
+                top_n=config.top_n_count_reranker,
+                model="colbert-ir/colbertv2.0",
+                tokenizer="colbert-ir/colbertv2.0",
+                device=config.device,
+                keep_retrieval_score=True,
+            ),
+            name="colbert reranker",
         )
 
-        self._embedding_model = HuggingFaceEmbedding(
-            model_name=config.embedding_mode,
-            device=config.device,
-            trust_remote_code=True,
+        # ingestion and queries share the model and its batches
+        self._embedding = (
+            embedding if embedding is not None else create_embedding(config)
+        )
+        self._cached_embedding = (
+            CachedEmbedding(embedding=self._embedding, cache=embedding_cache)
+            if embedding_cache is not None
+            else None
         )
 
+        # only a client, nothing is loaded
         self._llm = Ollama(
             model=self._config.llm_model,
             base_url=self._config.ollama_url,
@@ -64,8 +127,19 @@ class LLamaIndexHolder(metaclass=SingletonMeta):
             context_window=self._config.context_window,
         )
 
-        self._index = VectorStoreIndex.from_vector_store(
-            vector_store=vector_store, embed_model=self._embedding_model
+        self._auto_merge = AutoMergePostprocessor(
+            vector_store=vector_store, merge_ratio=config.auto_merge_ratio
+        )
+        self._neighbor_expansion = NeighborExpansionPostprocessor(
+            vector_store=cast(QdrantVectorStore, vector_store),
+            window=config.neighbor_window,
+        )
+
+        self._index = Lazy(
+            lambda: VectorStoreIndex.from_vector_store(
+                vector_store=vector_store, embed_model=self.get_embedding()
+            ),
+            name="vector store index",
         )
 
     @classmethod
@@ -73,9 +147,11 @@ class LLamaIndexHolder(metaclass=SingletonMeta):
         cls,
         vector_store: BasePydanticVectorStore,
         config: LlamaIndexRAGConfig,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding: Optional[BatchedEmbedding] = None,
     ):
         if cls not in SingletonMeta._instances:
-            return cls(vector_store, config)
+            return cls(vector_store, config, embedding_cache, embedding)
         else:
             raise RuntimeError("Singleton instance already created.")
 
@@ -88,16 +164,46 @@ class LLamaIndexHolder(metaclass=SingletonMeta):
         return SingletonMeta._instances[cls]
 
     def get_index(self) -> VectorStoreIndex:
-        assert self._index is not None
-        return self._index
+        return self._index.get()
 
     def get_reranker(self) -> ColbertRerank:
-        assert self._colbert_reranker is not None
-        return self._colbert_reranker
-
-    def get_embedding(self) -> HuggingFaceEmbedding:
-        assert self._embedding_model is not None
-        return self._embedding_model
+        return self._colbert_reranker.get()
+
+    def get_node_postprocessors(self) -> List[BaseNodePostprocessor]:
+        """
+        Reranks the nodes, merges the children of the hierarchical chunking
+        and adds the neighbors of the remaining nodes.
+        """
+        postprocessors: List[BaseNodePostprocessor] = [
+            self.get_reranker(),
+            self._auto_merge,
+        ]
+        if self._config.neighbor_window > 0:
+            postprocessors.append(self._neighbor_expansion)
+        return postprocessors
+
+    def get_embedding(self) -> BaseEmbedding:
+        """
+        The embedding model, with the cached vectors of already embedded chunks if enabled.
+        """
+        if self._cached_embedding is not None:
+            return self._cached_embedding
+        return self._embedding
+
+    def warm_up(self):
+        """
+        Loads all models, blocks until they are ready.
+        """
+        self.get_reranker()
+        self._embedding.load()
+        self.get_index()
+
+    def is_ready(self) -> bool:
+        return (
+            self._colbert_reranker.is_loaded()
+            and self._embedding.is_loaded()
+            and self._index.is_loaded()
+        )
 
     def get_llm(self) -> Ollama:
         assert self._llm is not None
@@ -1,21 +1,19 @@
+import asyncio
 import logging
-from typing import Dict, List, cast
+from typing import Dict, List, Optional, cast
 from api.model import Message
 from llama_index.core import VectorStoreIndex
 from llama_index.core.bridge.pydantic import BaseModel
-from llama_index.core.chat_engine.types import AgentChatResponse, ChatMode
+from llama_index.core.chat_engine import CondensePlusContextChatEngine
+from llama_index.core.chat_engine.types import AgentChatResponse
 from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.core.vector_stores.types import (
-    BasePydanticVectorStore,
-    FilterCondition,
-    FilterOperator,
-    MetadataFilter,
-    MetadataFilters,
-)
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from core import Result
 import torch
 from usecases.llm import RAGLLM, LLMResponse
+from usecases.llm.filters import to_metadata_filters
 from usecases.llm.init_index import LLamaIndexHolder, LlamaIndexRAGConfig
+from usecases.llm.retrieval_cache import CachedRetriever, RetrievalCache
 from usecases.model.dto import Node
 from llama_index.llms.ollama import Ollama
 
@@ -27,26 +25,70 @@ class LLamaIndexRAGLLM(RAGLLM):
     Allows to ask questions to the LLM model using the LlamaIndex
     Uses a vector store to retrieve the documents
     will use the colbert reranker to rerank the documents
+    The reranked documents of repeated questions are taken from the retrieval_cache.
     """
 
     def __init__(
         self,
         config: LlamaIndexRAGConfig,
+        retrieval_cache: Optional[RetrievalCache] = None,
     ):
         self._config = config
         self._index_holder = LLamaIndexHolder.Instance()
+        self._retrieval_cache = retrieval_cache
 
     def ask(
         self, messages: List[Message], model: str, filters: Dict[str, List[str]] = {}
     ) -> Result[LLMResponse]:
-        index_holder = LLamaIndexHolder.Instance()
+        chat_engine = self._build_chat_engine(filters=filters)
+
+        # last massage is the new user input, therefore we remove it from the chat history
+        last_message = messages[len(messages) - 1]
+        messages.remove(last_message)
+        chat_history = self.__convert_to_chat_history(messages)
+
+        try:
+            response = cast(
+                AgentChatResponse,
+                chat_engine.chat(last_message.content, chat_history=chat_history),
+            )
+            return Result.Ok(self._to_response(response))
+        except Exception as e:
+            return Result.Err(Exception(f"failed to retrive answer from llm {e}"))
+
+    async def ask_async(
+        self, messages: List[Message], model: str, filters: Dict[str, List[str]] = {}
+    ) -> Result[LLMResponse]:
+        """
+        The search uses the async qdrant client, the reranker runs in a worker thread,
+        concurrent questions overlap their I/O.
+        The engine is built in a worker thread as well, the first question
+        loads the index and the reranker without blocking the event loop.
+        """
+        chat_engine = await asyncio.to_thread(self._build_chat_engine, filters)
+
+        last_message = messages[len(messages) - 1]
+        messages.remove(last_message)
+        chat_history = self.__convert_to_chat_history(messages)
 
-        metadata_filters = MetadataFilters(filters=[])
-        for key in filters.keys():
-            for value in filters[key]:
-                metadata_filters.filters.append(
-                    MetadataFilter(key=key, value=value, operator=FilterOperator.EQ)
-                )
+        try:
+            response = cast(
+                AgentChatResponse,
+                await chat_engine.achat(
+                    last_message.content, chat_history=chat_history
+                ),
+            )
+            return Result.Ok(self._to_response(response))
+        except Exception as e:
+            return Result.Err(Exception(f"failed to retrive answer from llm {e}"))
+
+    def _build_chat_engine(
+        self, filters: Dict[str, List[str]]
+    ) -> CondensePlusContextChatEngine:
+        """
+        A new engine per question, concurrent questions don't share the chat history.
+        """
+        index_holder = LLamaIndexHolder.Instance()
 
         llm = Ollama(
             model=self._config.llm_model,
@@ -54,52 +96,45 @@ class LLamaIndexRAGLLM(RAGLLM):
             request_timeout=self._config.timeout,
             context_window=self._config.context_window,
         )
-        metadata_filters.condition = FilterCondition.OR
         index = self._index_holder.get_index()
-        self._chat_engine = index.as_chat_engine(
+        retriever = CachedRetriever(
+            retriever=index.as_retriever(
+                similarity_top_k=self._config.top_n_count_dens,
+                sparse_top_k=self._config.top_n_count_dens,
+                vector_store_query_mode="hybrid",
+                filters=to_metadata_filters(filters),
+            ),
+            node_postprocessors=index_holder.get_node_postprocessors(),
+            cache=self._retrieval_cache,
+            filters=filters,
+        )
+        return CondensePlusContextChatEngine.from_defaults(
+            retriever=retriever,
             llm=llm,
-            chat_mode=ChatMode.CONDENSE_PLUS_CONTEXT,
             context_prompt=DEFAULT_CONTEXT_PROMPT_TEMPLATE,
             condense_prompt=DEFAULT_CONDENSE_PROMPT_TEMPLATE,
-            similarity_top_k=self._config.top_n_count_dens,
-            sparse_top_k=self._config.top_n_count_dens,
-            node_postprocessors=[index_holder.get_reranker()],
-            vector_store_query_mode="hybrid",
-            filters=metadata_filters,
             verbose=True,
         )
 
-        # last massage is the new user input, therefore we remove it from the chat history
-        last_message = messages[len(messages) - 1]
-        messages.remove(last_message)
-        chat_history = self.__convert_to_chat_history(messages)
-
-        try:
-            response = cast(
-                AgentChatResponse,
-                self._chat_engine.chat(last_message.content, chat_history=chat_history),
+    def _to_response(self, response: AgentChatResponse) -> LLMResponse:
+        nodes = [
+            Node(
+                id=node.id_,
+                content=node.text,
+                metadata=node.metadata,
+                relations=[],
+                similarity_score=node.get_score(raise_error=False),
             )
+            for node in response.source_nodes
+        ]
+        for node in nodes:
+            logging.getLogger(__name__).debug(f"use Node:{node}")
 
-            nodes = [
-                Node(
-                    id=node.id_,
-                    content=node.text,
-                    metadata=node.metadata,
-                    relations=[],
-                    similarity_score=node.get_score(raise_error=False),
-                )
-                for node in response.source_nodes
-            ]
-            for node in nodes:
-                logging.getLogger(__name__).debug(f"use Node:{node}")
-
-            try:
-                torch.cuda.empty_cache()
-            except Exception as e:
-                logger.error(f"Failed to release cuda cache {e}")
-            return Result.Ok(LLMResponse(response=response.response, nodes=nodes))
+        try:
+            torch.cuda.empty_cache()
         except Exception as e:
-            return Result.Err(Exception(f"failed to retrive answer from llm {e}"))
+            logger.error(f"Failed to release cuda cache {e}")
+        return LLMResponse(response=response.response, nodes=nodes)
 
     def __convert_to_chat_history(self, messages: list[Message]) -> List[ChatMessage]:
         return [
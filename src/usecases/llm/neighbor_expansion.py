@@ -0,0 +1,160 @@
+import logging
+from typing import Dict, List, Optional
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import (
+    BaseNode,
+    NodeRelationship,
+    NodeWithScore,
+    QueryBundle,
+    TextNode,
+)
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from core.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOR_NODES_METRIC = "retrieval_neighbor_nodes_total"
+
+# page keys of the NodeSplitter
+START_PAGE_KEY = "start_page"
+UP_TO_PAGE_KEY = "up_to_page"
+
+
+def stitch_texts(first: str, second: str) -> str:
+    """
+    Joins the texts of two consecutive chunks, the overlap of the chunks is kept once.
+    """
+    for length in [32, 8]:
+        head = second[:length]
+        position = first.rfind(head) if len(head) > 0 else -1
+        while position >= 0:
+            if second.startswith(first[position:]):
+                return first[:position] + second
+            position = first.rfind(head, 0, position + len(head) - 1)
+    return f"{first}\n{second}"
+
+
+class NeighborExpansionPostprocessor(BaseNodePostprocessor):
+    """
+    Adds the window previous and next nodes of every retrieved node.
+    The neighbors are loaded by their ids with one retrieve request per step.
+    Contiguous nodes are stitched into one node with the best score of its hits,
+    so overlapping windows of nearby hits are returned once.
+    Nodes without PREVIOUS/NEXT relationships, e.g. merged parents, are kept.
+    """
+
+    vector_store: QdrantVectorStore
+    window: int = Field(default=1)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NeighborExpansionPostprocessor"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if self.window <= 0 or len(nodes) == 0:
+            return nodes
+        known: Dict[str, BaseNode] = {node.node.node_id: node.node for node in nodes}
+        try:
+            self._load_neighbors(known=known, hits=[node.node for node in nodes])
+        except Exception as e:
+            logger.error(f"Failed to load neighbors, results are not expanded: {e}")
+            return nodes
+        Metrics.increment(NEIGHBOR_NODES_METRIC, len(known) - len(nodes))
+
+        scores = {node.node.node_id: node.score for node in nodes}
+        result: List[NodeWithScore] = []
+        visited = set()
+        for node in nodes:
+            if node.node.node_id in visited:
+                continue
+            chain = self._chain(known=known, node=node.node)
+            visited.update(link.node_id for link in chain)
+            if len(chain) == 1:
+                result.append(node)
+                continue
+            chain_scores = [
+                scores[link.node_id]
+                for link in chain
+                if scores.get(link.node_id) is not None
+            ]
+            result.append(
+                NodeWithScore(
+                    node=self._stitch(chain=chain, hit=node.node),
+                    score=max(chain_scores) if len(chain_scores) > 0 else None,
+                )
+            )
+        return result
+
+    def _load_neighbors(self, known: Dict[str, BaseNode], hits: List[BaseNode]):
+        """
+        Loads the neighbors up to window steps away from the hits.
+        """
+        frontier = hits
+        for _ in range(self.window):
+            missing = set()
+            for node in frontier:
+                for neighbor in [node.prev_node, node.next_node]:
+                    if neighbor is not None and neighbor.node_id not in known:
+                        missing.add(neighbor.node_id)
+            if len(missing) == 0:
+                return
+            records = self.vector_store.client.retrieve(
+                collection_name=self.vector_store.collection_name,
+                ids=list(missing),
+                with_payload=True,
+                with_vectors=False,
+            )
+            frontier = self.vector_store.parse_to_query_result(records).nodes
+            for node in frontier:
+                known[node.node_id] = node
+
+    def _chain(self, known: Dict[str, BaseNode], node: BaseNode) -> List[BaseNode]:
+        """
+        The loaded nodes that are linked to node without a gap, in text order.
+        """
+        chain = [node]
+        previous = node.prev_node
+        while previous is not None and previous.node_id in known:
+            chain.insert(0, known[previous.node_id])
+            previous = chain[0].prev_node
+        following = node.next_node
+        while following is not None and following.node_id in known:
+            chain.append(known[following.node_id])
+            following = chain[-1].next_node
+        return chain
+
+    @staticmethod
+    def _stitch(chain: List[BaseNode], hit: BaseNode) -> TextNode:
+        """
+        One node with the text and pages of the chain, id and metadata of the hit.
+        """
+        text = chain[0].get_content()
+        for node in chain[1:]:
+            text = stitch_texts(text, node.get_content())
+        metadata = dict(hit.metadata)
+        if START_PAGE_KEY in chain[0].metadata:
+            metadata[START_PAGE_KEY] = chain[0].metadata[START_PAGE_KEY]
+        if UP_TO_PAGE_KEY in chain[-1].metadata:
+            metadata[UP_TO_PAGE_KEY] = chain[-1].metadata[UP_TO_PAGE_KEY]
+
+        stitched = TextNode(
+            id_=hit.node_id,
+            text=text,
+            metadata=metadata,
+            excluded_embed_metadata_keys=hit.excluded_embed_metadata_keys,
+            excluded_llm_metadata_keys=hit.excluded_llm_metadata_keys,
+        )
+        for relationship, node in [
+            (NodeRelationship.SOURCE, hit.source_node),
+            (NodeRelationship.PREVIOUS, chain[0].prev_node),
+            (NodeRelationship.NEXT, chain[-1].next_node),
+        ]:
+            if node is not None:
+                stitched.relationships[relationship] = node
+        return stitched
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+from typing import Dict, FrozenSet, Hashable, List, Optional, Tuple
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from pydantic import BaseModel
+from core.cache import LRUCache
+from core.metrics import Metrics
+
+
+RETRIEVAL_CACHE_HIT_METRIC = "retrieval_cache_hits_total"
+RETRIEVAL_CACHE_MISS_METRIC = "retrieval_cache_misses_total"
+RETRIEVAL_CACHE_INVALIDATION_METRIC = "retrieval_cache_invalidations_total"
+
+# filter key of the files a question is asked about
+FILE_ID_KEY = "file_id"
+
+RetrievalKey = Tuple[str, FrozenSet[Tuple[str, str]], Hashable]
+
+
+class RetrievalCacheConfig(BaseModel):
+    """
+    Reranked nodes are reused for ttl seconds, max_entries queries are kept.
+    """
+
+    ttl: float = 600.0
+    max_entries: int = 256
+
+
+class RetrievalCache:
+    """
+    Reranked nodes of condensed questions, so repeated questions in a course
+    are not embedded, searched and reranked again.
+    The key contains the index version of every file in the filter,
+    writes to a file increase its version and questions about it miss the cache.
+    Questions without file filter use the version of the whole index.
+    Old entries are never read again and are evicted by the LRU.
+    The versions only count the writes of this process,
+    the cache must not be used by several API processes.
+    """
+
+    _config: RetrievalCacheConfig
+    _entries: LRUCache[RetrievalKey, List[NodeWithScore]]
+    _lock: threading.Lock
+    _versions: Dict[str, int]
+    _version: int
+
+    def __init__(self, config: RetrievalCacheConfig) -> None:
+        self._config = config
+        self._entries = LRUCache(max_size=config.max_entries)
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._version = 0
+
+    def key(self, query: str, filters: Dict[str, List[str]]) -> RetrievalKey:
+        """
+        Must be created before the retrieval,
+        so results of a retrieval that overlapped a write are never read.
+        """
+        filter_set = frozenset(
+            (key, value) for key, values in filters.items() for value in values
+        )
+        with self._lock:
+            if FILE_ID_KEY in filters:
+                version: Hashable = tuple(
+                    self._versions.get(file_id, 0)
+                    for file_id in sorted(set(filters[FILE_ID_KEY]))
+                )
+            else:
+                version = self._version
+        return (" ".join(query.split()), filter_set, version)
+
+    def get(self, key: RetrievalKey) -> Optional[List[NodeWithScore]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.age() < self._config.ttl:
+            Metrics.increment(RETRIEVAL_CACHE_HIT_METRIC)
+            return list(entry.value)
+        Metrics.increment(RETRIEVAL_CACHE_MISS_METRIC)
+        return None
+
+    def put(self, key: RetrievalKey, nodes: List[NodeWithScore]):
+        self._entries.put(key, list(nodes))
+
+    def invalidate(self, file_id: str):
+        """
+        Called after points of the file were written or deleted.
+        """
+        with self._lock:
+            self._versions[file_id] = self._versions.get(file_id, 0) + 1
+            self._version += 1
+        Metrics.increment(RETRIEVAL_CACHE_INVALIDATION_METRIC)
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Retrieves and postprocesses the nodes of a question, or returns them from the cache.
+    The postprocessors run here instead of in the chat engine,
+    so the reranked nodes are cached.
+    In the async path the postprocessors run in a worker thread,
+    the reranker doesn't block the event loop. Without cache every question is retrieved.
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        node_postprocessors: List[BaseNodePostprocessor],
+        cache: Optional[RetrievalCache],
+        filters: Dict[str, List[str]],
+    ) -> None:
+        super().__init__()
+        self._retriever = retriever
+        self._node_postprocessors = node_postprocessors
+        self._cache = cache
+        self._filters = filters
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        key = self._key(query_bundle)
+        nodes = self._cached(key)
+        if nodes is not None:
+            return nodes
+
+        nodes = self._postprocess(self._retriever.retrieve(query_bundle), query_bundle)
+        self._store(key, nodes)
+        return nodes
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        key = self._key(query_bundle)
+        nodes = self._cached(key)
+        if nodes is not None:
+            return nodes
+
+        nodes = await self._retriever.aretrieve(query_bundle)
+        nodes = await asyncio.to_thread(self._postprocess, nodes, query_bundle)
+        self._store(key, nodes)
+        return nodes
+
+    def _key(self, query_bundle: QueryBundle) -> Optional[RetrievalKey]:
+        if self._cache is None:
+            return None
+        return self._cache.key(query=query_bundle.query_str, filters=self._filters)
+
+    def _cached(self, key: Optional[RetrievalKey]) -> Optional[List[NodeWithScore]]:
+        if self._cache is None or key is None:
+            return None
+        return self._cache.get(key)
+
+    def _store(self, key: Optional[RetrievalKey], nodes: List[NodeWithScore]):
+        if self._cache is not None and key is not None:
+            self._cache.put(key, nodes)
+
+    def _postprocess(
+        self, nodes: List[NodeWithScore], query_bundle: QueryBundle
+    ) -> List[NodeWithScore]:
+        for postprocessor in self._node_postprocessors:
+            nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        return nodes
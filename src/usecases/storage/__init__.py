@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
+import asyncio
+from typing import Dict, Iterable, List, Optional
 from core import Result
 from usecases.model.dto import (
     Document,
@@ -13,7 +14,51 @@ Contains interfaces for the database classes used in the project, that are used
 
 class VectorDatabase(ABC):
     @abstractmethod
-    def create_document(self, doc: Document) -> Result[None]:
+    def create_document(self, doc: Document, first_page: int = 1) -> Result[None]:
+        """
+        first_page is the number of the first page, if doc contains only a part of the file.
+        """
+        pass
+
+    @abstractmethod
+    def stream_document(
+        self, doc: Document, batches: Iterable[List[str]], first_page: int = 1
+    ) -> Result[None]:
+        """
+        Stores the pages of doc batch by batch, every batch is a list of pages.
+        The content of doc is ignored.
+        """
+        pass
+
+    @abstractmethod
+    def delete_document(self, file_id: str) -> Result[None]:
+        pass
+
+    def replace_document(
+        self, doc: Document, batches: Iterable[List[str]]
+    ) -> Result[None]:
+        """
+        Stores the pages of a new version of the file doc.id like stream_document,
+        the nodes of the older version are removed.
+        """
+        result = self.delete_document(file_id=doc.id)
+        if result.is_error():
+            return result
+        return self.stream_document(doc=doc, batches=batches)
+
+    @abstractmethod
+    def delete_pages(self, file_id: str, pages: List[int]) -> Result[List[int]]:
+        """
+        Removes the nodes of the file that contain one of the pages (1-based).
+        Returns the pages that have to be stored again,
+        nodes can span several pages, so the result can contain more pages.
+        """
+        pass
+
+    @abstractmethod
+    def attach_document(
+        self, file_id: str, new_file_id: str, course_id: Optional[str]
+    ) -> Result[None]:
         pass
 
     @abstractmethod
@@ -24,8 +69,66 @@ class VectorDatabase(ABC):
     def does_object_with_metadata_exist(self, metadata: Dict[str, str]) -> Result[bool]:
         pass
 
+    async def create_document_async(
+        self, doc: Document, first_page: int = 1
+    ) -> Result[None]:
+        """
+        Stores the document without blocking the event loop.
+        """
+        return await asyncio.to_thread(self.create_document, doc, first_page)
+
+    async def find_similar_nodes_async(self, query: str) -> Result[List[Node]]:
+        return await asyncio.to_thread(self.find_similar_nodes, query)
+
+    async def does_object_with_metadata_exist_async(
+        self, metadata: Dict[str, str]
+    ) -> Result[bool]:
+        return await asyncio.to_thread(self.does_object_with_metadata_exist, metadata)
+
 
 class PDFConverter(ABC):
     @abstractmethod
     def transform_file_to_markdown(self, file: str) -> list[str]:
         pass
+
+    @abstractmethod
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        """
+        Converts only the given pages (0-based), the result has the same order.
+        """
+        pass
+
+    def cache_key(self) -> str:
+        """
+        Identifies the converter and the settings that change its output.
+        """
+        return type(self).__name__
+
+    async def transform_file_to_markdown_async(self, file: str) -> list[str]:
+        """
+        Converts the file without blocking the event loop.
+        """
+        return await asyncio.to_thread(self.transform_file_to_markdown, file)
+
+    async def transform_pages_to_markdown_async(
+        self, file: str, pages: List[int]
+    ) -> list[str]:
+        return await asyncio.to_thread(self.transform_pages_to_markdown, file, pages)
+
+    def warm_up(self):
+        """
+        Loads the models of the converter, otherwise they are loaded on first use.
+        """
+        pass
+
+    def is_ready(self) -> bool:
+        """
+        True if a conversion doesn't have to wait for models to load.
+        """
+        return True
+
+    def close(self):
+        """
+        Releases the resources of the converter, e.g. worker processes.
+        """
+        pass
@@ -1,3 +1,4 @@
+from typing import Iterable, List, Optional
 from core import Result
 from core.request_timer import RequestTimer
 from core.singelton import SingletonMeta
@@ -5,6 +6,7 @@ from usecases.model.dto import (
     Document,
 )
 
+from usecases.llm.retrieval_cache import RetrievalCache
 from usecases.storage import VectorDatabase
 
 
@@ -15,14 +17,22 @@ class VectorDBUsecases(metaclass=SingletonMeta):
     """
 
     _vector_db: VectorDatabase
+    _retrieval_cache: Optional[RetrievalCache]
 
-    def __init__(self, vector_db: VectorDatabase) -> None:
+    def __init__(
+        self, vector_db: VectorDatabase, retrieval_cache: Optional[RetrievalCache]
+    ) -> None:
         self._vector_db = vector_db
+        self._retrieval_cache = retrieval_cache
 
     @classmethod
-    def create(cls, vector_db: VectorDatabase):
+    def create(
+        cls,
+        vector_db: VectorDatabase,
+        retrieval_cache: Optional[RetrievalCache] = None,
+    ):
         if cls not in SingletonMeta._instances:
-            return cls(vector_db)
+            return cls(vector_db, retrieval_cache)
         else:
             raise RuntimeError("Singleton instance already created.")
 
@@ -34,9 +44,73 @@ class VectorDBUsecases(metaclass=SingletonMeta):
             )
         return SingletonMeta._instances[cls]
 
-    def store_doc(self, doc: Document) -> Result[None]:
+    def store_doc(self, doc: Document, first_page: int = 1) -> Result[None]:
         timer = RequestTimer()
         timer.start("query db")
-        result = self._vector_db.create_document(doc=doc)
+        result = self._vector_db.create_document(doc=doc, first_page=first_page)
+        self._invalidate(file_id=doc.id)
         timer.end()
         return result
+
+    async def store_doc_async(self, doc: Document, first_page: int = 1) -> Result[None]:
+        timer = RequestTimer()
+        timer.start("store doc")
+        result = await self._vector_db.create_document_async(
+            doc=doc, first_page=first_page
+        )
+        self._invalidate(file_id=doc.id)
+        timer.end()
+        return result
+
+    def stream_doc(
+        self, doc: Document, batches: Iterable[List[str]], first_page: int = 1
+    ) -> Result[None]:
+        timer = RequestTimer()
+        timer.start("stream doc")
+        result = self._vector_db.stream_document(
+            doc=doc, batches=batches, first_page=first_page
+        )
+        self._invalidate(file_id=doc.id)
+        timer.end()
+        return result
+
+    def replace_doc(self, doc: Document, batches: Iterable[List[str]]) -> Result[None]:
+        timer = RequestTimer()
+        timer.start("replace doc")
+        result = self._vector_db.replace_document(doc=doc, batches=batches)
+        self._invalidate(file_id=doc.id)
+        timer.end()
+        return result
+
+    def delete_doc(self, file_id: str) -> Result[None]:
+        timer = RequestTimer()
+        timer.start("delete doc")
+        result = self._vector_db.delete_document(file_id=file_id)
+        self._invalidate(file_id=file_id)
+        timer.end()
+        return result
+
+    def delete_pages(self, file_id: str, pages: List[int]) -> Result[List[int]]:
+        timer = RequestTimer()
+        timer.start("delete pages")
+        result = self._vector_db.delete_pages(file_id=file_id, pages=pages)
+        self._invalidate(file_id=file_id)
+        timer.end()
+        return result
+
+    def attach_doc(
+        self, file_id: str, new_file_id: str, course_id: Optional[str]
+    ) -> Result[None]:
+        timer = RequestTimer()
+        timer.start("attach doc")
+        result = self._vector_db.attach_document(
+            file_id=file_id, new_file_id=new_file_id, course_id=course_id
+        )
+        self._invalidate(file_id=new_file_id)
+        timer.end()
+        return result
+
+    def _invalidate(self, file_id: str):
+        # also after failed writes, some points may have been written
+        if self._retrieval_cache is not None:
+            self._retrieval_cache.invalidate(file_id=file_id)
@@ -1,33 +1,63 @@
-from typing import Any, Dict, List, Optional, Tuple, cast
+import asyncio
+import bisect
+from enum import Enum
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, cast
 import logging
 import re
+import uuid
 
 from huggingface_hub import file_exists
 from llama_index.core.base.embeddings.base import similarity
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.schema import BaseNode, NodeRelationship, RelatedNodeType
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import (
+    BaseNode,
+    MetadataMode,
+    NodeRelationship,
+    NodeWithScore,
+    RelatedNodeType,
+    TextNode,
+)
 from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.core import Document as LlamaIndexDoc, Response
 from llama_index.core.node_parser.file.markdown import MarkdownNodeParser
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
 from pydantic import BaseModel
 from qdrant_client.http import models
+from api.model import NotFoundException
 from core import Result
+from core.lazy import Lazy
 from usecases.llm.init_index import LLamaIndexHolder
+from usecases.llm.embedding_cache import (
+    CachedSparseEncoder,
+    EmbeddingCache,
+    text_hash,
+)
+from usecases.llm.retrieval_cache import CachedRetriever
 from usecases.model.dto import Document, Node
 from usecases.storage import VectorDatabase
 
 
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 
 from llama_index.core import VectorStoreIndex
 from llama_index.postprocessor.colbert_rerank import ColbertRerank
 from llama_index.vector_stores.qdrant import QdrantVectorStore
+from llama_index.vector_stores.qdrant.base import (
+    DENSE_VECTOR_NAME,
+    DOCUMENT_ID_KEY,
+    SPARSE_VECTOR_NAME,
+)
+from llama_index.vector_stores.qdrant.utils import SparseEncoderCallable
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
 
 class LlamaIndexVectorStoreConfig(BaseModel):
     """
     Configuration for the LlamaIndexVectorStore.
+    parent_chunk_size 0 disables the hierarchical chunking.
     """
 
     qdrant_host: str
@@ -39,52 +69,453 @@ class LlamaIndexVectorStoreConfig(BaseModel):
     top_n_count_sparse: int
     chunk_size: int
     chunk_overlap: int
+    parent_chunk_size: int
     device: str
 
 
+class QdrantQuantization(str, Enum):
+    none = "none"
+    # int8 per dimension, 4x smaller
+    scalar = "scalar"
+    # one bit per dimension, 32x smaller, for embeddings with many dimensions
+    binary = "binary"
+
+
+class QdrantCollectionConfig(BaseModel):
+    """
+    Parameters of the collection, applied at startup.
+    vector_size is read from the embedding model.
+    Segments below indexing_threshold KB are not indexed by HNSW,
+    filtered searches with fewer matches than full_scan_threshold KB use the payload index.
+    Quantized vectors are kept in RAM, a search takes oversampling times the results
+    from them and rescores these with the original vectors (with on_disk from disk).
+    """
+
+    vector_size: int
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    full_scan_threshold: int = 10000
+    indexing_threshold: int = 20000
+    quantization: QdrantQuantization = QdrantQuantization.none
+    oversampling: float = 2.0
+    rescore: bool = True
+    on_disk: bool = False
+    on_disk_payload: bool = False
+
+
+class QdrantCollectionManager:
+    """
+    Creates the collection at startup, instead of the store on the first insert,
+    with keyword payload indexes for the keys used in filters.
+    Missing indexes and changed HNSW/optimizer parameters of an existing collection
+    are added and updated, so filtered searches stay fast as the collection grows.
+    """
+
+    _client: QdrantClient
+    _collection: str
+    _config: QdrantCollectionConfig
+
+    def __init__(
+        self, client: QdrantClient, collection: str, config: QdrantCollectionConfig
+    ) -> None:
+        self._client = client
+        self._collection = collection
+        self._config = config
+
+    def ensure_collection(self):
+        if not self._client.collection_exists(self._collection):
+            self._create_collection()
+        else:
+            self._check_vector_size()
+            self._update_parameters()
+            self._update_storage()
+        self._ensure_payload_indexes()
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        """
+        Parameters of the dense searches, None without quantization.
+        """
+        if self._config.quantization == QdrantQuantization.none:
+            return None
+        return models.SearchParams(
+            quantization=models.QuantizationSearchParams(
+                oversampling=self._config.oversampling,
+                rescore=self._config.rescore,
+            )
+        )
+
+    def _create_collection(self):
+        logging.getLogger(__name__).info(f"Creating collection {self._collection}")
+        try:
+            self._client.create_collection(
+                collection_name=self._collection,
+                # the names the store expects for a new collection
+                vectors_config={
+                    DENSE_VECTOR_NAME: models.VectorParams(
+                        size=self._config.vector_size,
+                        distance=models.Distance.COSINE,
+                        on_disk=self._config.on_disk,
+                    )
+                },
+                sparse_vectors_config={
+                    SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                        index=models.SparseIndexParams()
+                    )
+                },
+                hnsw_config=self._hnsw_config(),
+                optimizers_config=self._optimizers_config(),
+                quantization_config=self._quantization_config(),
+                on_disk_payload=self._config.on_disk_payload,
+            )
+        except Exception as e:
+            # another instance created it in the meantime
+            if "already exists" not in str(e):
+                raise e
+
+    def _check_vector_size(self):
+        """
+        The vectors of another embedding model can't be searched,
+        the collection has to be reindexed after the model changed.
+        """
+        vectors = self._client.get_collection(self._collection).config.params.vectors
+        dense = vectors.get(DENSE_VECTOR_NAME) if isinstance(vectors, dict) else vectors
+        if dense is not None and dense.size != self._config.vector_size:
+            raise RuntimeError(
+                f"The dense vectors of collection {self._collection} have "
+                f"{dense.size} dimensions, the embedding model has "
+                f"{self._config.vector_size}. Use another QDRANT_COLLECTION "
+                "and reindex the files, or the previous EMBEDDING_MODEL."
+            )
+
+    def _update_parameters(self):
+        info = self._client.get_collection(self._collection)
+        hnsw = info.config.hnsw_config
+        if (
+            hnsw.m != self._config.hnsw_m
+            or hnsw.ef_construct != self._config.hnsw_ef_construct
+            or hnsw.full_scan_threshold != self._config.full_scan_threshold
+            or info.config.optimizer_config.indexing_threshold
+            != self._config.indexing_threshold
+        ):
+            logging.getLogger(__name__).info(
+                f"Updating HNSW and optimizer parameters of {self._collection}"
+            )
+            self._client.update_collection(
+                collection_name=self._collection,
+                hnsw_config=self._hnsw_config(),
+                optimizers_config=self._optimizers_config(),
+            )
+
+    def _update_storage(self):
+        """
+        Qdrant rebuilds the segments of the collection in the background.
+        """
+        info = self._client.get_collection(self._collection)
+        vectors = info.config.params.vectors
+        dense = vectors.get(DENSE_VECTOR_NAME) if isinstance(vectors, dict) else None
+        if dense is None:
+            return
+        quantization = info.config.quantization_config
+        if (
+            bool(dense.on_disk) != self._config.on_disk
+            or bool(info.config.params.on_disk_payload) != self._config.on_disk_payload
+            or type(quantization) is not type(self._quantization_config())
+        ):
+            logging.getLogger(__name__).info(
+                f"Updating quantization and on disk storage of {self._collection}"
+            )
+            self._client.update_collection(
+                collection_name=self._collection,
+                vectors_config={
+                    DENSE_VECTOR_NAME: models.VectorParamsDiff(
+                        on_disk=self._config.on_disk
+                    )
+                },
+                collection_params=models.CollectionParamsDiff(
+                    on_disk_payload=self._config.on_disk_payload
+                ),
+                quantization_config=self._quantization_config()
+                or models.Disabled.DISABLED,
+            )
+
+    def _ensure_payload_indexes(self):
+        schema = self._client.get_collection(self._collection).payload_schema
+        for key in [
+            FILE_ID_KEY,
+            COURSE_ID_KEY,
+            NodeSplitter.MetaDataContentHashKey,
+            NodeSplitter.MetaDataParentIdKey,
+            NodeSplitter.MetaDataVersionKey,
+            DOCUMENT_ID_KEY,
+        ]:
+            if key not in schema:
+                logging.getLogger(__name__).info(
+                    f"Creating payload index {key} of {self._collection}"
+                )
+                self._client.create_payload_index(
+                    collection_name=self._collection,
+                    field_name=key,
+                    field_schema=models.PayloadSchemaType.KEYWORD,
+                    wait=True,
+                )
+
+    def _hnsw_config(self) -> models.HnswConfigDiff:
+        return models.HnswConfigDiff(
+            m=self._config.hnsw_m,
+            ef_construct=self._config.hnsw_ef_construct,
+            full_scan_threshold=self._config.full_scan_threshold,
+        )
+
+    def _optimizers_config(self) -> models.OptimizersConfigDiff:
+        return models.OptimizersConfigDiff(
+            indexing_threshold=self._config.indexing_threshold
+        )
+
+    def _quantization_config(
+        self,
+    ) -> Optional[models.ScalarQuantization | models.BinaryQuantization]:
+        if self._config.quantization == QdrantQuantization.scalar:
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+                )
+            )
+        if self._config.quantization == QdrantQuantization.binary:
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=True)
+            )
+        return None
+
+
+class QuantizedSearchClient:
+    """
+    Client of the store that adds the search parameters of the quantization
+    to the dense searches, the store doesn't pass them to Qdrant.
+    Everything else is delegated to the wrapped client.
+    """
+
+    def __init__(self, client: Any, search_params: models.SearchParams) -> None:
+        self._client = client
+        self._search_params = search_params
+
+    def search_batch(
+        self, collection_name: str, requests: List[models.SearchRequest], **kwargs
+    ):
+        return self._client.search_batch(
+            collection_name=collection_name,
+            requests=self._with_params(requests),
+            **kwargs,
+        )
+
+    def _with_params(
+        self, requests: List[models.SearchRequest]
+    ) -> List[models.SearchRequest]:
+        for request in requests:
+            # sparse vectors are not quantized
+            if isinstance(request.vector, models.NamedVector):
+                request.params = request.params or self._search_params
+        return requests
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class AsyncQuantizedSearchClient(QuantizedSearchClient):
+    async def search_batch(
+        self, collection_name: str, requests: List[models.SearchRequest], **kwargs
+    ):
+        return await self._client.search_batch(
+            collection_name=collection_name,
+            requests=self._with_params(requests),
+            **kwargs,
+        )
+
+
+class LazySparseEncoder:
+    """
+    Sparse encoder of the hybrid search that loads its model on the first call.
+    """
+
+    _encoder: Lazy[SparseEncoderCallable]
+
+    def __init__(self, load: Callable[[], SparseEncoderCallable], name: str) -> None:
+        self._encoder = Lazy(load, name=name)
+
+    def __call__(self, texts: List[str]):
+        return self._encoder.get()(texts)
+
+    def load(self):
+        self._encoder.get()
+
+    def is_loaded(self) -> bool:
+        return self._encoder.is_loaded()
+
+
+class PrecomputedSparseEncoder:
+    """
+    Sparse document encoder of the store.
+    The store encodes the texts while it adds nodes, in the async path on the event loop.
+    The async insertion precomputes the vectors in a worker thread instead,
+    the store then only takes them.
+    """
+
+    _encoder: SparseEncoderCallable
+    _vectors: Dict[str, Tuple[List[int], List[float]]]
+    _lock: threading.Lock
+
+    def __init__(self, encoder: SparseEncoderCallable) -> None:
+        self._encoder = encoder
+        self._vectors = {}
+        self._lock = threading.Lock()
+
+    def precompute(self, texts: List[str]):
+        indices, values = self._encoder(texts)
+        with self._lock:
+            self._vectors.update(zip(texts, zip(indices, values)))
+
+    def discard(self, texts: List[str]):
+        """
+        Drops precomputed vectors that were not used, e.g. after a failed insert.
+        """
+        with self._lock:
+            for text in texts:
+                self._vectors.pop(text, None)
+
+    def __call__(self, texts: List[str]) -> Tuple[List[List[int]], List[List[float]]]:
+        with self._lock:
+            vectors = [self._vectors.pop(text, None) for text in texts]
+        missing = [texts[i] for i in range(len(texts)) if vectors[i] is None]
+        if len(missing) > 0:
+            indices, values = self._encoder(missing)
+            encoded = iter(zip(indices, values))
+            vectors = [
+                vector if vector is not None else next(encoded) for vector in vectors
+            ]
+        return (
+            [vector[0] for vector in vectors],  # type: ignore
+            [vector[1] for vector in vectors],  # type: ignore
+        )
+
+
 class LlamaIndexVectorStoreSession:
     """
     LlamaIndexVectorStoreSession is a singleton class that holds the database instance.
     Allows to reuse the same database instance across the application.
+    The store gets a synchronous and an async client of the same server,
+    requests of the event loop use the async one and don't block other requests.
     """
 
     _instance = None
     _vectore_store: Optional[BasePydanticVectorStore] = None
     _config: Optional[LlamaIndexVectorStoreConfig]
     _client: Optional[QdrantClient] = None
+    _aclient: Optional[AsyncQdrantClient] = None
+    _sparse_doc_encoder: Optional[PrecomputedSparseEncoder] = None
+    _sparse_encoders: List[LazySparseEncoder] = []
 
-    def __new__(cls, config: Optional[LlamaIndexVectorStoreConfig] = None):
+    def __new__(
+        cls,
+        config: Optional[LlamaIndexVectorStoreConfig] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        collection_config: Optional[QdrantCollectionConfig] = None,
+    ):
         if cls._instance is None:
             from llama_index.core import Settings
 
-            assert config is not None, (
+            assert config is not None and collection_config is not None, (
                 "Configuration must be provided for the first initialization."
             )
             Settings.llm = None  # type: ignore
             cls._instance = super().__new__(cls)
-            vectore_store, client = cls._build_qdrant_vector_store(config)
+            (
+                vectore_store,
+                client,
+                aclient,
+                sparse_doc_encoder,
+                sparse_encoders,
+            ) = cls._build_qdrant_vector_store(
+                config, embedding_cache, collection_config
+            )
             cls._instance._initialize(
-                vectore_store=vectore_store, config=config, client=client
+                vectore_store=vectore_store,
+                config=config,
+                client=client,
+                aclient=aclient,
+                sparse_doc_encoder=sparse_doc_encoder,
+                sparse_encoders=sparse_encoders,
             )
         return cls._instance
 
     @staticmethod
     def _build_qdrant_vector_store(
         config: LlamaIndexVectorStoreConfig,
-    ) -> Tuple[BasePydanticVectorStore, QdrantClient]:
+        embedding_cache: Optional[EmbeddingCache],
+        collection_config: QdrantCollectionConfig,
+    ) -> Tuple[
+        BasePydanticVectorStore,
+        QdrantClient,
+        AsyncQdrantClient,
+        PrecomputedSparseEncoder,
+        List[LazySparseEncoder],
+    ]:
         """Build the MongoDB connection URL from the configuration."""
         client = QdrantClient(host=config.qdrant_host, port=config.qdrant_port)
+        aclient = AsyncQdrantClient(host=config.qdrant_host, port=config.qdrant_port)
+        collection_manager = QdrantCollectionManager(
+            client=client, collection=config.collection, config=collection_config
+        )
+        collection_manager.ensure_collection()
+        search_params = collection_manager.search_params()
+        # the default encoders of the store load their models immediately
+        doc_encoder = LazySparseEncoder(
+            lambda: vector_store.get_default_sparse_doc_encoder(config.collection),
+            name="sparse document encoder",
+        )
+        query_encoder = LazySparseEncoder(
+            lambda: vector_store.get_default_sparse_query_encoder(config.collection),
+            name="sparse query encoder",
+        )
+        sparse_doc_fn: SparseEncoderCallable = doc_encoder
+        if embedding_cache is not None:
+            # the name of the sparse vector tells which encoder the collection uses
+            sparse_doc_fn = CachedSparseEncoder(
+                encoder=doc_encoder,
+                cache=embedding_cache,
+                model_name=lambda: f"sparse/{vector_store.sparse_vector_name()}",
+            )
+        sparse_doc_encoder = PrecomputedSparseEncoder(encoder=sparse_doc_fn)
         vector_store = QdrantVectorStore(
             config.collection,
-            client=client,
+            client=(
+                client
+                if search_params is None
+                else QuantizedSearchClient(client, search_params)
+            ),
+            aclient=(
+                aclient
+                if search_params is None
+                else AsyncQuantizedSearchClient(aclient, search_params)
+            ),
             enable_hybrid=True,
             batch_size=20,
+            sparse_doc_fn=sparse_doc_encoder,
+            sparse_query_fn=query_encoder,
+        )
+        return (
+            vector_store,
+            client,
+            aclient,
+            sparse_doc_encoder,
+            [doc_encoder, query_encoder],
         )
-        return (vector_store, client)
 
     @staticmethod
-    def init_database(config: LlamaIndexVectorStoreConfig):
-        LlamaIndexVectorStoreSession(config)
+    def init_database(
+        config: LlamaIndexVectorStoreConfig,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        collection_config: Optional[QdrantCollectionConfig] = None,
+    ):
+        LlamaIndexVectorStoreSession(config, embedding_cache, collection_config)
 
     @staticmethod
     def get_instance() -> "LlamaIndexVectorStoreSession":
@@ -95,10 +526,16 @@ class LlamaIndexVectorStoreSession:
         vectore_store: BasePydanticVectorStore,
         config: LlamaIndexVectorStoreConfig,
         client: QdrantClient,
+        aclient: AsyncQdrantClient,
+        sparse_doc_encoder: PrecomputedSparseEncoder,
+        sparse_encoders: List[LazySparseEncoder],
     ):
         self._vectore_store = vectore_store
         self._config = config
         self._client = client
+        self._aclient = aclient
+        self._sparse_doc_encoder = sparse_doc_encoder
+        self._sparse_encoders = sparse_encoders
 
     def get_database(self) -> BasePydanticVectorStore:
         assert self._vectore_store is not None, "Database is not initialized."
@@ -112,60 +549,474 @@ class LlamaIndexVectorStoreSession:
         assert self._client is not None, "Database is not initialized."
         return self._client
 
+    def get_async_qdrant_client(self) -> AsyncQdrantClient:
+        assert self._aclient is not None, "Database is not initialized."
+        return self._aclient
+
+    def get_sparse_doc_encoder(self) -> PrecomputedSparseEncoder:
+        assert self._sparse_doc_encoder is not None, "Database is not initialized."
+        return self._sparse_doc_encoder
+
+    def warm_up(self):
+        """
+        Loads the sparse models of the hybrid search.
+        """
+        for encoder in self._sparse_encoders:
+            encoder.load()
+
+    def is_ready(self) -> bool:
+        return all(encoder.is_loaded() for encoder in self._sparse_encoders)
+
+    async def close(self):
+        if self._aclient is not None:
+            await self._aclient.close()
+        if self._client is not None:
+            self._client.close()
+
 
 class NodeSplitterConfig(BaseModel):
+    """
+    parent_chunk_size > 0 enables the hierarchical chunking,
+    nodes of chunk_size tokens are the children of parents along the markdown sections.
+    """
+
     chunk_size: int
     chunk_overlap: int
+    parent_chunk_size: int = 0
+
+
+# namespace of the deterministic node ids
+NODE_ID_NAMESPACE = uuid.UUID("5d0c1f6e-2b8a-4c43-9e57-3f1a9b6d2c80")
 
 
 class NodeSplitter:
     _config: NodeSplitterConfig
 
     PageSplitPattern = r"---- Ende Seite (\d+) ----"
+    PageSeparator = "\n\n"
     MetaDateStartPageKey = "start_page"
     MetaDateUpToPageKey = "up_to_page"
+    MetaDataParentIdKey = "parent_id"
+    MetaDataContentHashKey = "content_hash"
+    MetaDataVersionKey = "version"
 
     def __init__(self, config: NodeSplitterConfig) -> None:
         self._config = config
 
-    def _merge_doc(self, pages: list[str]) -> str:
-        content = ""
-        for i in range(len(pages)):
-            content = f"""{content}\n\n{pages[i]}\n\n---- Ende Seite {i + 1} ----\n\n"""
-        return content
+    def _merge_doc(self, pages: list[str]) -> Tuple[str, List[int]]:
+        """
+        Joins the pages in one pass.
+        Returns the text and the offset of the first character of every page.
+        """
+        page_starts: List[int] = []
+        offset = 0
+        for page in pages:
+            page_starts.append(offset)
+            offset += len(page) + len(self.PageSeparator)
+        return self.PageSeparator.join(pages), page_starts
+
+    def _split_pages(self, content: str) -> List[str]:
+        """
+        Pages of a text with page markers, e.g. markdown stored by older versions.
+        """
+        # the page numbers of the markers are at the odd positions
+        return [page.strip() for page in re.split(self.PageSplitPattern, content)[::2]]
+
+    @staticmethod
+    def _page_at(page_starts: List[int], offset: int) -> int:
+        """Index of the page that contains the character at offset."""
+        return max(bisect.bisect_right(page_starts, offset) - 1, 0)
+
+    @staticmethod
+    def _locate_chunk(content: str, chunk: str, cursor: int) -> Tuple[int, int]:
+        """
+        Start and end offset of the chunk, searched from cursor on.
+        The splitter may change whitespace inside of a chunk,
+        so only its beginning and its end are searched.
+        """
+        start = cursor
+        for length in [32, 8]:
+            found = content.find(chunk[:length], cursor)
+            if found >= 0:
+                start = found
+                break
+        end = min(start + len(chunk), len(content))
+        # the end is searched close to the expected position, texts repeat
+        expected = max(start, end - 32 - len(chunk) // 8)
+        for length in [32, 8]:
+            suffix = chunk[-length:]
+            found = content.find(suffix, expected)
+            if found >= 0:
+                return start, found + len(suffix)
+        return start, end
+
+    def _assign_id(self, node: TextNode, file_id: str, ordinals: Dict[str, int]):
+        """
+        The id is derived from the file, the content hash and the ordinal of the node
+        among the nodes of its kind with the same content in the file.
+        Storing a file again overwrites the points of unchanged chunks instead of
+        adding duplicates. Only repeated chunks get an ordinal above 0,
+        so the ids don't depend on the number or position of the other chunks.
+        """
+        kind = "parent" if NodeRelationship.CHILD in node.relationships else "node"
+        content_hash = node.metadata[self.MetaDataContentHashKey]
+        key = f"{kind}/{content_hash}"
+        ordinal = ordinals.get(key, 0)
+        ordinals[key] = ordinal + 1
+        node.id_ = str(uuid.uuid5(NODE_ID_NAMESPACE, f"{file_id}/{key}/{ordinal}"))
 
-    def split_documents(self, doc: Document) -> List[BaseNode]:
-        content = ""
+    def stored_ordinals(self, payloads: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Number of stored nodes per kind and content hash, from their payloads.
+        Children have a parent id, with hierarchical chunking the others are parents.
+        """
+        ordinals: Dict[str, int] = {}
+        for payload in payloads:
+            kind = (
+                "parent"
+                if self._config.parent_chunk_size > 0
+                and self.MetaDataParentIdKey not in payload
+                else "node"
+            )
+            key = f"{kind}/{payload.get(self.MetaDataContentHashKey)}"
+            ordinals[key] = ordinals.get(key, 0) + 1
+        return ordinals
+
+    @staticmethod
+    def _link(nodes: List[TextNode]):
+        for i in range(1, len(nodes)):
+            prev_node = nodes[i - 1]
+            nodes[i].relationships[NodeRelationship.PREVIOUS] = (
+                prev_node.as_related_node_info()
+            )
+            prev_node.relationships[NodeRelationship.NEXT] = (
+                nodes[i].as_related_node_info()
+            )
+
+    def split_documents(
+        self,
+        doc: Document,
+        first_page: int = 1,
+        ordinals: Optional[Dict[str, int]] = None,
+    ) -> List[BaseNode]:
+        """
+        first_page is the number of the first page in doc,
+        used if only some pages of a file are stored again.
+        ordinals counts the chunks per content for the ids, it is shared by all parts
+        of a file, so repeated chunks in different parts get different ids.
+        The pages of a node are found by the offsets of the node in the text,
+        the text itself contains no page markers.
+        With hierarchical chunking the parents are returned after their children.
+        The id of doc is the file id, the node ids are derived from it.
+        """
         if isinstance(doc.content, list):
-            content = self._merge_doc(pages=doc.content)
+            pages = doc.content
         else:
-            content = doc.content
+            pages = self._split_pages(content=doc.content)
+        content, page_starts = self._merge_doc(pages=pages)
 
-        doc_llama_index = LlamaIndexDoc(text=content)  # type: ignore
-        doc_llama_index.excluded_llm_metadata_keys = ["course_id", "file_id"]
+        doc_llama_index = LlamaIndexDoc(id_=doc.id, text=content)  # type: ignore
+        doc_llama_index.excluded_llm_metadata_keys = [
+            "course_id",
+            "file_id",
+            self.MetaDataContentHashKey,
+            self.MetaDataVersionKey,
+        ]
+        # ids are no content, the chunk text of copied documents is embedded the same
+        doc_llama_index.excluded_embed_metadata_keys = [
+            "course_id",
+            "file_id",
+            self.MetaDataContentHashKey,
+            self.MetaDataVersionKey,
+        ]
         doc_llama_index.metadata = {**doc_llama_index.metadata, **doc.metadata}
-        nodes = SentenceSplitter(
+
+        if ordinals is None:
+            ordinals = {}
+        if self._config.parent_chunk_size > 0:
+            return self._split_hierarchical(
+                document=doc_llama_index,
+                page_starts=page_starts,
+                first_page=first_page,
+                ordinals=ordinals,
+            )
+        nodes = self._split_text(
+            document=doc_llama_index,
+            start=0,
+            end=len(content),
+            page_starts=page_starts,
+            first_page=first_page,
+            ordinals=ordinals,
+        )
+        self._link(nodes)
+        return cast(List[BaseNode], nodes)
+
+    def _split_text(
+        self,
+        document: LlamaIndexDoc,
+        start: int,
+        end: int,
+        page_starts: List[int],
+        first_page: int,
+        ordinals: Dict[str, int],
+    ) -> List[TextNode]:
+        """
+        Splits the text of the document between start and end into nodes.
+        The offsets and pages of the nodes refer to the whole document.
+        ordinals counts the nodes per content for the ids, across all calls for a file.
+        """
+        content = document.text[start:end]
+        metadata_str = max(
+            document.get_metadata_str(mode=MetadataMode.EMBED),
+            document.get_metadata_str(mode=MetadataMode.LLM),
+            key=len,
+        )
+        chunks = SentenceSplitter(
             chunk_size=self._config.chunk_size, chunk_overlap=self._config.chunk_overlap
-        ).get_nodes_from_documents(documents=[doc_llama_index])
-        page_number = 1
+        ).split_text_metadata_aware(text=content, metadata_str=metadata_str)
+        nodes = build_nodes_from_splits(text_splits=chunks, document=document)
+
+        # chunks follow each other, searching from the previous chunk keeps this linear
+        overlap = self._config.chunk_overlap / self._config.chunk_size
+        cursor = 0
         for i in range(len(nodes)):
-            node = nodes[i]
-            matches = re.findall(self.PageSplitPattern, node.get_content())
-            node.metadata[self.MetaDateStartPageKey] = page_number
-            if len(matches) > 0:
-                page_number = matches[len(matches) - 1]
-                page_number = int(page_number) + 1
-            node.metadata[self.MetaDateUpToPageKey] = page_number
-            if i == 0:
-                continue
-            prev_node = nodes[i - 1]
-            node.relationships[NodeRelationship.PREVIOUS] = (
-                prev_node.as_related_node_info()
+            node = cast(TextNode, nodes[i])
+            chunk_start, chunk_end = self._locate_chunk(content, chunks[i], cursor)
+            # the next chunk starts within the overlap at the end of this one
+            cursor = max(
+                chunk_start + 1, chunk_end - int(2 * overlap * len(chunks[i])) - 32
             )
+            node.start_char_idx = start + chunk_start
+            node.end_char_idx = start + chunk_end
+            node.metadata = {
+                **document.metadata,
+                self.MetaDateStartPageKey: first_page
+                + self._page_at(page_starts, node.start_char_idx),
+                self.MetaDateUpToPageKey: first_page
+                + self._page_at(
+                    page_starts, max(node.end_char_idx - 1, node.start_char_idx)
+                ),
+                self.MetaDataContentHashKey: text_hash(node.text),
+            }
+            self._assign_id(node, file_id=document.id_, ordinals=ordinals)
+        return cast(List[TextNode], nodes)
 
-            prev_node.relationships[NodeRelationship.NEXT] = node.as_related_node_info()
+    def _section_spans(self, content: str) -> List[Tuple[int, int]]:
+        """
+        Start and end offsets of the markdown sections, each starts with a heading.
+        Sections are packed together up to parent_chunk_size tokens.
+        """
+        sections = MarkdownNodeParser(
+            include_metadata=False, include_prev_next_rel=False
+        ).get_nodes_from_node(LlamaIndexDoc(text=content))  # type: ignore
+        starts: List[int] = []
+        cursor = 0
+        for section in sections:
+            start, end = self._locate_chunk(content, section.text, cursor)
+            starts.append(start)
+            cursor = end
+        if len(starts) == 0 or starts[0] > 0:
+            starts.insert(0, 0)
+        ends = starts[1:] + [len(content)]
 
-        return nodes
+        tokenizer = get_tokenizer()
+        spans: List[Tuple[int, int]] = []
+        tokens = 0
+        for start, end in zip(starts, ends):
+            section_tokens = len(tokenizer(content[start:end]))
+            fits = tokens + section_tokens <= self._config.parent_chunk_size
+            if len(spans) > 0 and fits:
+                spans[-1] = (spans[-1][0], end)
+                tokens += section_tokens
+            else:
+                spans.append((start, end))
+                tokens = section_tokens
+        return spans
+
+    def _split_hierarchical(
+        self,
+        document: LlamaIndexDoc,
+        page_starts: List[int],
+        first_page: int,
+        ordinals: Dict[str, int],
+    ) -> List[BaseNode]:
+        """
+        Parents follow the markdown sections, large sections are split into several.
+        A parent is the text of consecutive children, only the children are embedded.
+        """
+        step = max(self._config.chunk_size - self._config.chunk_overlap, 1)
+        children_per_parent = max(
+            (self._config.parent_chunk_size - self._config.chunk_overlap) // step, 1
+        )
+        parents: List[TextNode] = []
+        children: List[TextNode] = []
+        for start, end in self._section_spans(document.text):
+            section_children = self._split_text(
+                document=document,
+                start=start,
+                end=end,
+                page_starts=page_starts,
+                first_page=first_page,
+                ordinals=ordinals,
+            )
+            groups = [
+                section_children[i : i + children_per_parent]
+                for i in range(0, len(section_children), children_per_parent)
+            ]
+            # parents cover the section without gaps, offsets of children are estimated
+            bounds = [start] + [cast(int, group[0].start_char_idx) for group in groups]
+            bounds = bounds[:1] + bounds[2:] + [end]
+            for i, siblings in enumerate(groups):
+                parent = self._build_parent(
+                    document=document,
+                    start=bounds[i],
+                    end=bounds[i + 1],
+                    children=siblings,
+                    page_starts=page_starts,
+                    first_page=first_page,
+                    ordinals=ordinals,
+                )
+                parents.append(parent)
+                children.extend(siblings)
+        self._link(children)
+        return cast(List[BaseNode], children + parents)
+
+    def _build_parent(
+        self,
+        document: LlamaIndexDoc,
+        start: int,
+        end: int,
+        children: List[TextNode],
+        page_starts: List[int],
+        first_page: int,
+        ordinals: Dict[str, int],
+    ) -> TextNode:
+        parent = cast(
+            TextNode,
+            build_nodes_from_splits(
+                text_splits=[document.text[start:end]], document=document
+            )[0],
+        )
+        parent.start_char_idx = start
+        parent.end_char_idx = end
+        parent.metadata = {
+            **document.metadata,
+            self.MetaDateStartPageKey: first_page + self._page_at(page_starts, start),
+            self.MetaDateUpToPageKey: first_page
+            + self._page_at(page_starts, max(end - 1, start)),
+            self.MetaDataContentHashKey: text_hash(parent.text),
+        }
+        parent.relationships[NodeRelationship.CHILD] = [
+            child.as_related_node_info() for child in children
+        ]
+        self._assign_id(parent, file_id=document.id_, ordinals=ordinals)
+        for child in children:
+            child.relationships[NodeRelationship.PARENT] = parent.as_related_node_info()
+            # allows to delete the children of a parent by a filter
+            child.metadata[self.MetaDataParentIdKey] = parent.node_id
+            child.excluded_embed_metadata_keys = [
+                *child.excluded_embed_metadata_keys,
+                self.MetaDataParentIdKey,
+            ]
+            child.excluded_llm_metadata_keys = [
+                *child.excluded_llm_metadata_keys,
+                self.MetaDataParentIdKey,
+            ]
+        return parent
+
+    def split_page_batches(
+        self,
+        doc: Document,
+        batches: Iterable[List[str]],
+        first_page: int = 1,
+        ordinals: Optional[Dict[str, int]] = None,
+    ) -> Iterator[List[BaseNode]]:
+        """
+        Splits the pages batch by batch, the memory is bounded by the batch size.
+        The content of doc is ignored, only id and metadata are used.
+        The last embedded node of a batch is held back until the next batch is split,
+        so it can be linked to its successor.
+        """
+        if ordinals is None:
+            ordinals = {}
+        tail: Optional[BaseNode] = None
+        page_number = first_page
+        for batch in batches:
+            nodes = self.split_documents(
+                doc=Document(id=doc.id, content=batch, metadata=doc.metadata),
+                first_page=page_number,
+                ordinals=ordinals,
+            )
+            page_number += len(batch)
+            leaves = [node for node in nodes if is_leaf_node(node)]
+            if len(leaves) == 0:
+                continue
+            if tail is not None:
+                leaves[0].relationships[NodeRelationship.PREVIOUS] = (
+                    tail.as_related_node_info()
+                )
+                tail.relationships[NodeRelationship.NEXT] = (
+                    leaves[0].as_related_node_info()
+                )
+                nodes.insert(0, tail)
+            tail = leaves[-1]
+            nodes = [node for node in nodes if node is not tail]
+            if len(nodes) > 0:
+                yield nodes
+        if tail is not None:
+            yield [tail]
+
+
+def is_leaf_node(node: BaseNode) -> bool:
+    """Nodes without children are embedded, parents are stored without vectors."""
+    return NodeRelationship.CHILD not in node.relationships
+
+
+FILE_ID_KEY = "file_id"
+COURSE_ID_KEY = "course_id"
+
+
+def _file_condition(file_id: str) -> models.FieldCondition:
+    # matches single values and lists of shared nodes
+    return models.FieldCondition(
+        key=FILE_ID_KEY, match=models.MatchValue(value=file_id)
+    )
+
+
+def _metadata_filter(metadata: Dict[str, str]) -> models.Filter:
+    return models.Filter(
+        must=[
+            models.FieldCondition(key=key, match=models.MatchValue(value=value))
+            for key, value in metadata.items()
+        ]
+    )
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _page_ranges(pages: List[int]) -> List[Tuple[int, int]]:
+    """
+    Contiguous ranges (first, last) of the pages, one filter condition per range.
+    """
+    ranges: List[Tuple[int, int]] = []
+    for page in sorted(set(pages)):
+        if len(ranges) > 0 and ranges[-1][1] == page - 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def _add_unique(values: List[str], value: Optional[str]) -> List[str]:
+    if value is not None and value not in values:
+        values.append(value)
+    return values
 
 
 class LlamaIndexVectorStore(VectorDatabase):
@@ -175,61 +1026,489 @@ class LlamaIndexVectorStore(VectorDatabase):
 
     _note_splitter: NodeSplitter
     _config: LlamaIndexVectorStoreConfig
+    _vector_store: BasePydanticVectorStore
 
     def __init__(
         self, vector_store: BasePydanticVectorStore, config: LlamaIndexVectorStoreConfig
     ):
         self._config = config
+        self._vector_store = vector_store
         self._note_splitter = NodeSplitter(
             config=NodeSplitterConfig(
-                chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap
+                chunk_size=config.chunk_size,
+                chunk_overlap=config.chunk_overlap,
+                parent_chunk_size=config.parent_chunk_size,
             )
         )
 
-        colbert_reranker = LLamaIndexHolder.Instance().get_reranker()
-        embedding_model = LLamaIndexHolder.Instance().get_embedding()
-
-        self._index = VectorStoreIndex.from_vector_store(
-            vector_store=vector_store, embed_model=embedding_model
+        # built on first use, the models are loaded lazily
+        self._index = Lazy(
+            lambda: VectorStoreIndex.from_vector_store(
+                vector_store=vector_store,
+                embed_model=LLamaIndexHolder.Instance().get_embedding(),
+            ),
+            name="ingestion index",
         )
-
-        self._query_engine = self._index.as_query_engine(
-            llm=None,
-            similarity_top_k=self._config.top_n_count_dens,
-            sparse_top_k=self._config.top_n_count_dens,
-            node_postprocessors=[colbert_reranker],
-            vector_store_query_mode="hybrid",
+        self._query_engine = Lazy(
+            lambda: self._index.get().as_query_engine(
+                llm=None,
+                similarity_top_k=self._config.top_n_count_dens,
+                sparse_top_k=self._config.top_n_count_dens,
+                node_postprocessors=(
+                    LLamaIndexHolder.Instance().get_node_postprocessors()
+                ),
+                vector_store_query_mode="hybrid",
+            ),
+            name="query engine",
         )
 
-    def create_document(self, doc: Document) -> Result[None]:
+    def create_document(self, doc: Document, first_page: int = 1) -> Result[None]:
         try:
-            nodes = self._note_splitter.split_documents(doc=doc)
-            self._index.insert_nodes(nodes=nodes)
+            nodes = self._split_part(doc=doc, first_page=first_page)
+            self._insert_nodes(nodes=nodes)
             logging.getLogger(__name__).info(f"stored {doc.id}")
             return Result.Ok(None)
         except Exception as e:
             logging.getLogger(__name__).error(f"{e}")
             return Result.Err(e)
 
-    def find_similar_nodes(self, query: str) -> Result[List[Node]]:
+    async def create_document_async(
+        self, doc: Document, first_page: int = 1
+    ) -> Result[None]:
+        try:
+            nodes = await asyncio.to_thread(self._split_part, doc, first_page)
+            await self._ainsert_nodes(nodes=nodes)
+            logging.getLogger(__name__).info(f"stored {doc.id}")
+            return Result.Ok(None)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"{e}")
+            return Result.Err(e)
+
+    def _split_part(self, doc: Document, first_page: int) -> List[BaseNode]:
+        """
+        Splits pages that are stored in addition to the remaining nodes of the file.
+        The ordinals continue after the stored chunks with the same content,
+        so a repeated chunk doesn't overwrite its copy on another page.
+        """
+        client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+        return self._note_splitter.split_documents(
+            doc=doc,
+            first_page=first_page,
+            ordinals=self._stored_ordinals(client=client, file_id=doc.id),
+        )
+
+    def _stored_ordinals(self, client: QdrantClient, file_id: str) -> Dict[str, int]:
+        """Number of stored nodes of the file per kind and content hash."""
+        if not client.collection_exists(self._config.collection):
+            return {}
+        payloads: List[Dict[str, Any]] = []
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self._config.collection,
+                scroll_filter=models.Filter(must=[_file_condition(file_id)]),
+                with_payload=[
+                    NodeSplitter.MetaDataContentHashKey,
+                    NodeSplitter.MetaDataParentIdKey,
+                ],
+                with_vectors=False,
+                limit=256,
+                offset=offset,
+            )
+            payloads.extend(point.payload or {} for point in points)
+            if offset is None:
+                return self._note_splitter.stored_ordinals(payloads)
+
+    def stream_document(
+        self, doc: Document, batches: Iterable[List[str]], first_page: int = 1
+    ) -> Result[None]:
+        """
+        Splits, embeds and stores the pages batch by batch.
+        The first pages are searchable before the last ones are converted.
+        """
         try:
-            response = cast(Response, self._query_engine.query(query))
-            llama_index_nodes = response.source_nodes
-            nodes = [
-                Node(
-                    id=node.id_,
-                    content=node.text,
-                    metadata=node.metadata,
-                    relations=[],
-                    similarity_score=node.get_score(raise_error=False),
+            count = 0
+            for nodes in self._note_splitter.split_page_batches(
+                doc=doc, batches=batches, first_page=first_page
+            ):
+                self._insert_nodes(nodes=nodes)
+                count += len(nodes)
+                logging.getLogger(__name__).info(
+                    f"stored {len(nodes)} nodes of {doc.id}, {count} in total"
+                )
+            return Result.Ok(None)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"{e}")
+            return Result.Err(e)
+
+    def _insert_nodes(self, nodes: List[BaseNode]):
+        """
+        Embeds and stores the nodes, parents of the hierarchical chunking are stored
+        without vectors. The search doesn't find them, they are merged from children.
+        """
+        leaves = [node for node in nodes if is_leaf_node(node)]
+        parents = [node for node in nodes if not is_leaf_node(node)]
+        if len(leaves) > 0:
+            self._index.get().insert_nodes(nodes=leaves)
+        if len(parents) > 0:
+            client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+            client.upsert(
+                collection_name=self._config.collection,
+                points=self._parent_points(parents),
+            )
+
+    async def _ainsert_nodes(self, nodes: List[BaseNode]):
+        """
+        Async version of _insert_nodes, the event loop only waits.
+        The dense vectors come from the shared embedding worker,
+        the sparse vectors are computed in a worker thread before the store adds the nodes.
+        """
+        session = LlamaIndexVectorStoreSession.get_instance()
+        leaves = [node for node in nodes if is_leaf_node(node)]
+        parents = [node for node in nodes if not is_leaf_node(node)]
+        if len(leaves) > 0:
+            texts = [
+                leaf.get_content(metadata_mode=MetadataMode.EMBED) for leaf in leaves
+            ]
+            embedding = LLamaIndexHolder.Instance().get_embedding()
+            embeddings = await embedding.aget_text_embedding_batch(texts)
+            for leaf, vector in zip(leaves, embeddings):
+                leaf.embedding = vector
+            sparse_encoder = session.get_sparse_doc_encoder()
+            await asyncio.to_thread(sparse_encoder.precompute, texts)
+            try:
+                await self._vector_store.async_add(leaves)
+            finally:
+                sparse_encoder.discard(texts)
+        if len(parents) > 0:
+            await session.get_async_qdrant_client().upsert(
+                collection_name=self._config.collection,
+                points=self._parent_points(parents),
+            )
+
+    def _parent_points(self, parents: List[BaseNode]) -> List[models.PointStruct]:
+        return [
+            models.PointStruct(
+                id=parent.node_id,
+                vector={},
+                payload=node_to_metadata_dict(
+                    parent,
+                    remove_text=False,
+                    flat_metadata=self._vector_store.flat_metadata,
+                ),
+            )
+            for parent in parents
+        ]
+
+    def replace_document(
+        self, doc: Document, batches: Iterable[List[str]]
+    ) -> Result[None]:
+        """
+        Stores the new version of the file like stream_document.
+        Unchanged chunks have the same ids and overwrite their points,
+        every written point is tagged with a new version.
+        Afterwards the points of the file with another version are removed,
+        after a failed replace the next one also removes the partly written version.
+        The file stays searchable while it is replaced.
+        """
+        try:
+            client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+            version = uuid.uuid4().hex
+            tagged = Document(
+                id=doc.id,
+                content=doc.content,
+                metadata={**doc.metadata, NodeSplitter.MetaDataVersionKey: version},
+            )
+            count = 0
+            for nodes in self._note_splitter.split_page_batches(
+                doc=tagged, batches=batches
+            ):
+                self._keep_shared_files(client=client, nodes=nodes)
+                self._insert_nodes(nodes=nodes)
+                count += len(nodes)
+            self._remove_file_points(client=client, file_id=doc.id, version=version)
+            logging.getLogger(__name__).info(f"replaced {doc.id} with {count} nodes")
+            return Result.Ok(None)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"{e}")
+            return Result.Err(e)
+
+    def _keep_shared_files(self, client: QdrantClient, nodes: List[BaseNode]):
+        """
+        Points of unchanged chunks can be shared with copies of the older version,
+        the overwritten points keep the other files and their courses.
+        """
+        points = client.retrieve(
+            collection_name=self._config.collection,
+            ids=[node.node_id for node in nodes],
+            with_payload=[FILE_ID_KEY, COURSE_ID_KEY],
+            with_vectors=False,
+        )
+        shared = {
+            str(point.id): point.payload or {}
+            for point in points
+            if len(_as_list((point.payload or {}).get(FILE_ID_KEY))) > 1
+        }
+        for node in nodes:
+            payload = shared.get(node.node_id)
+            if payload is None:
+                continue
+            node.metadata[FILE_ID_KEY] = _add_unique(
+                _as_list(payload.get(FILE_ID_KEY)), node.metadata.get(FILE_ID_KEY)
+            )
+            node.metadata[COURSE_ID_KEY] = _add_unique(
+                _as_list(payload.get(COURSE_ID_KEY)), node.metadata.get(COURSE_ID_KEY)
+            )
+
+    def delete_document(self, file_id: str) -> Result[None]:
+        """
+        Removes all nodes of the file.
+        Nodes that are shared with other files with the same content only lose the file id.
+        """
+        try:
+            client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+            self._remove_file_points(client=client, file_id=file_id, version=None)
+            logging.getLogger(__name__).info(f"deleted {file_id}")
+            return Result.Ok(None)
+        except Exception as e:
+            return Result.Err(e)
+
+    def _remove_file_points(
+        self, client: QdrantClient, file_id: str, version: Optional[str]
+    ):
+        """
+        Removes the nodes of the file except the ones of version with one filtered
+        delete, shared nodes only lose the file id.
+        """
+        if not client.collection_exists(self._config.collection):
+            return
+
+        keep_condition: List[models.Condition] = (
+            [
+                models.FieldCondition(
+                    key=NodeSplitter.MetaDataVersionKey,
+                    match=models.MatchValue(value=version),
                 )
-                for node in llama_index_nodes
             ]
-            return Result.Ok(nodes)
+            if version is not None
+            else []
+        )
+        client.delete(
+            collection_name=self._config.collection,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        _file_condition(file_id),
+                        models.FieldCondition(
+                            key=FILE_ID_KEY, values_count=models.ValuesCount(lte=1)
+                        ),
+                    ],
+                    must_not=keep_condition,
+                )
+            ),
+        )
+
+        for (file_ids, course_ids), point_ids in self._group_file_points(
+            client=client, file_id=file_id, exclude=keep_condition
+        ).items():
+            client.set_payload(
+                collection_name=self._config.collection,
+                payload={
+                    FILE_ID_KEY: [id for id in file_ids if id != file_id],
+                    COURSE_ID_KEY: list(course_ids),
+                },
+                points=point_ids,
+            )
+
+    def delete_pages(self, file_id: str, pages: List[int]) -> Result[List[int]]:
+        """
+        Removes the nodes of the file that overlap one of the pages.
+        Shared nodes are not changed, files with copies are stored completely.
+        The returned pages include all pages of the removed nodes,
+        with hierarchical chunking all pages of the removed parents.
+        """
+        try:
+            client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+            if len(pages) == 0 or not client.collection_exists(self._config.collection):
+                return Result.Ok(sorted(set(pages)))
+
+            page_filter = models.Filter(
+                must=[
+                    _file_condition(file_id),
+                    models.FieldCondition(
+                        key=FILE_ID_KEY, values_count=models.ValuesCount(lte=1)
+                    ),
+                ],
+                should=[
+                    models.Filter(
+                        must=[
+                            models.FieldCondition(
+                                key=NodeSplitter.MetaDateStartPageKey,
+                                range=models.Range(lte=last),
+                            ),
+                            models.FieldCondition(
+                                key=NodeSplitter.MetaDateUpToPageKey,
+                                range=models.Range(gte=first),
+                            ),
+                        ]
+                    )
+                    for first, last in _page_ranges(pages)
+                ],
+            )
+
+            affected = set(pages)
+            point_ids = []
+            offset = None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=self._config.collection,
+                    scroll_filter=page_filter,
+                    with_payload=[
+                        NodeSplitter.MetaDateStartPageKey,
+                        NodeSplitter.MetaDateUpToPageKey,
+                    ],
+                    with_vectors=False,
+                    limit=256,
+                    offset=offset,
+                )
+                for point in points:
+                    payload = point.payload or {}
+                    start = int(payload[NodeSplitter.MetaDateStartPageKey])
+                    end = int(payload[NodeSplitter.MetaDateUpToPageKey])
+                    affected.update(range(start, end + 1))
+                    point_ids.append(point.id)
+                if offset is None:
+                    break
+
+            if len(point_ids) > 0:
+                # children of deleted parents are removed even outside of the pages
+                client.delete(
+                    collection_name=self._config.collection,
+                    points_selector=models.FilterSelector(
+                        filter=models.Filter(
+                            must=[_file_condition(file_id)],
+                            should=[
+                                models.HasIdCondition(has_id=point_ids),
+                                models.FieldCondition(
+                                    key=NodeSplitter.MetaDataParentIdKey,
+                                    match=models.MatchAny(
+                                        any=[str(id) for id in point_ids]
+                                    ),
+                                ),
+                            ],
+                        )
+                    ),
+                )
+            logging.getLogger(__name__).info(
+                f"deleted {len(point_ids)} nodes of {file_id} for {len(pages)} pages"
+            )
+            return Result.Ok(sorted(affected))
+        except Exception as e:
+            return Result.Err(e)
+
+    def attach_document(
+        self, file_id: str, new_file_id: str, course_id: Optional[str]
+    ) -> Result[None]:
+        """
+        Adds another file (and its course) to the nodes of an already stored file.
+        Used for copies of the same document, they are stored and embedded only once.
+        """
+        try:
+            client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+            groups = self._group_file_points(client=client, file_id=file_id)
+            if len(groups) == 0:
+                return Result.Err(
+                    NotFoundException(f"No nodes of file {file_id} to attach to")
+                )
+
+            for (file_ids, course_ids), point_ids in groups.items():
+                client.set_payload(
+                    collection_name=self._config.collection,
+                    payload={
+                        FILE_ID_KEY: _add_unique(list(file_ids), new_file_id),
+                        COURSE_ID_KEY: _add_unique(list(course_ids), course_id),
+                    },
+                    points=point_ids,
+                )
+            logging.getLogger(__name__).info(f"attached {new_file_id} to {file_id}")
+            return Result.Ok(None)
+        except Exception as e:
+            return Result.Err(e)
+
+    def _group_file_points(
+        self,
+        client: QdrantClient,
+        file_id: str,
+        exclude: List[models.Condition] = [],
+    ) -> Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Any]]:
+        """
+        Ids of all nodes of the file that match none of the exclude conditions,
+        grouped by their file and course ids.
+        All nodes of a document usually end up in one group, so one update is enough.
+        """
+        groups: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Any]] = {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self._config.collection,
+                scroll_filter=models.Filter(
+                    must=[_file_condition(file_id)], must_not=exclude
+                ),
+                with_payload=[FILE_ID_KEY, COURSE_ID_KEY],
+                with_vectors=False,
+                limit=256,
+                offset=offset,
+            )
+            for point in points:
+                payload = point.payload or {}
+                key = (
+                    tuple(_as_list(payload.get(FILE_ID_KEY))),
+                    tuple(_as_list(payload.get(COURSE_ID_KEY))),
+                )
+                groups.setdefault(key, []).append(point.id)
+            if offset is None:
+                return groups
+
+    def find_similar_nodes(self, query: str) -> Result[List[Node]]:
+        try:
+            response = cast(Response, self._query_engine.get().query(query))
+            return Result.Ok(self._to_nodes(response.source_nodes))
 
         except Exception as e:
             return Result.Err(e)
 
+    async def find_similar_nodes_async(self, query: str) -> Result[List[Node]]:
+        try:
+            retriever = CachedRetriever(
+                retriever=self._index.get().as_retriever(
+                    similarity_top_k=self._config.top_n_count_dens,
+                    sparse_top_k=self._config.top_n_count_dens,
+                    vector_store_query_mode="hybrid",
+                ),
+                node_postprocessors=(
+                    LLamaIndexHolder.Instance().get_node_postprocessors()
+                ),
+                cache=None,
+                filters={},
+            )
+            return Result.Ok(self._to_nodes(await retriever.aretrieve(query)))
+
+        except Exception as e:
+            return Result.Err(e)
+
+    @staticmethod
+    def _to_nodes(llama_index_nodes: List[NodeWithScore]) -> List[Node]:
+        return [
+            Node(
+                id=node.id_,
+                content=node.text,
+                metadata=node.metadata,
+                relations=[],
+                similarity_score=node.get_score(raise_error=False),
+            )
+            for node in llama_index_nodes
+        ]
+
     def does_object_with_metadata_exist(self, metadata: Dict[str, str]) -> Result[bool]:
         try:
             client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
@@ -238,15 +1517,26 @@ class LlamaIndexVectorStore(VectorDatabase):
 
             qdrant_nodes, point_id = client.scroll(
                 collection_name=self._config.collection,
-                scroll_filter=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key=key,
-                            match=models.MatchValue(value=metadata[key]),
-                        )
-                        for key in metadata.keys()
-                    ]
-                ),
+                scroll_filter=_metadata_filter(metadata),
+            )
+            return Result.Ok(len(qdrant_nodes) > 0)
+        except Exception as e:
+            return Result.Err(e)
+
+    async def does_object_with_metadata_exist_async(
+        self, metadata: Dict[str, str]
+    ) -> Result[bool]:
+        try:
+            aclient = (
+                LlamaIndexVectorStoreSession.get_instance().get_async_qdrant_client()
+            )
+            if not await aclient.collection_exists(self._config.collection):
+                return Result.Ok(False)
+
+            qdrant_nodes, point_id = await aclient.scroll(
+                collection_name=self._config.collection,
+                scroll_filter=_metadata_filter(metadata),
+                limit=1,
             )
             return Result.Ok(len(qdrant_nodes) > 0)
         except Exception as e:
@@ -1,6 +1,8 @@
+import asyncio
 import logging
 from urllib.parse import urlencode
 from api.routes.v1.conversations import ConversationAPI, ConvesationAPIConfig
+from api.routes.v1.ingestion import IngestionAPI
 from httpx import AsyncClient
 from typing import Callable
 import unittest
@@ -10,7 +12,11 @@ from api.utils.chains import get_posix_timestamp
 from fastapi.testclient import TestClient
 
 
-from database.implementation import ConversationDatabase
+from database.implementation import (
+    ConversationDatabase,
+    FileStateDatabase,
+    IngestionJobDatabase,
+)
 from database.session import DatabaseConfig, MongoDatabaseSession
 from fastapi import FastAPI
 from moodle.downloads import MoodleClient, MoodleFile
@@ -23,13 +29,20 @@ from usecases.ask_llm import AskLLMUsecase
 from usecases.conversation_usecases import ConversationUsecases
 from usecases.convert_pdf_to_markdown import PdfConverterUsecase
 from usecases.download_file_from_moodle import MoodleUsecase
-from usecases.llm.init_index import LLamaIndexHolder, LlamaIndexRAGConfig
+from usecases.ingestion_usecases import IngestionConfig, IngestionUsecases
+from usecases.llm.init_index import (
+    LLamaIndexHolder,
+    LlamaIndexRAGConfig,
+    create_embedding,
+    embedding_dimension,
+)
 from usecases.llm.llama_index_rag_llm import LLamaIndexRAGLLM
 from usecases.vector_db import VectorDBUsecases
 from vector_database.vectore_store import (
     LlamaIndexVectorStore,
     LlamaIndexVectorStoreConfig,
     LlamaIndexVectorStoreSession,
+    QdrantCollectionConfig,
 )
 
 USER_DUMMY_ID = "dummy_user_id"
@@ -41,6 +54,7 @@ METADATA_DUMMY_ATTRIBUTE = "test_attribute"
 METADATA_DUMMY_VALUE = "test_value"
 API_PREFIX: str = "/api/v1"
 CONVERATION_PATH = f"{API_PREFIX}/conversations/"
+INGESTION_JOBS_PATH = f"{API_PREFIX}/ingestion/jobs"
 
 """
 The Tests in this file are just to test if the dataflow works.
@@ -56,11 +70,16 @@ collection = "qdrant_collection"
 embedding_mode = "nomic-ai/nomic-embed-text-v2-moe"
 chunk_size = 128
 chunk_overlap = 32
+parent_chunk_size = 0
+auto_merge_ratio = 0.5
+neighbor_window = 0
 
 top_n_count_dens = 5
 top_n_count_sparse = 5
 top_n_count_reranker = 5
 device = "mps"
+embedding_batch_size = 32
+embedding_max_latency = 0.01
 ollama_url = "http://127.0.0.1:11434"
 llm_model = "llama3.2"
 timeout = 60.0
@@ -82,6 +101,7 @@ v1.include_router(
     conversationAPI.get_rounter(), tags=["Conversation"], prefix="/conversations"
 )
 v1.include_router(MoodleRouter, tags=["Moodle"], prefix="/moodle")
+v1.include_router(IngestionAPI().get_rounter(), tags=["Ingestion"], prefix="/ingestion")
 app.mount("/v1", v1)
 
 
@@ -96,10 +116,17 @@ def create_usecases(
     Start the usecases
     the create method is used to create the usecases, they also reinitialize them for every test
     """
-    LlamaIndexVectorStoreSession.init_database(config=config_v_db)
+    embedding = create_embedding(config_llm)
+    LlamaIndexVectorStoreSession.init_database(
+        config=config_v_db,
+        collection_config=QdrantCollectionConfig(
+            vector_size=embedding_dimension(embedding)
+        ),
+    )
     LLamaIndexHolder.create(
         vector_store=LlamaIndexVectorStoreSession.get_instance().get_database(),
         config=config_llm,
+        embedding=embedding,
     )
     VectorDBUsecases.create(
         vector_db=LlamaIndexVectorStore(
@@ -128,6 +155,23 @@ async def create_database(config: DatabaseConfig):
     await conversation_database.start()
     ConversationUsecases.create(conversation_database)
 
+    ingestion_database = IngestionJobDatabase()
+    await ingestion_database.start()
+    file_state_database = FileStateDatabase()
+    await file_state_database.start()
+    IngestionUsecases.create(
+        database=ingestion_database,
+        file_states=file_state_database,
+        config=IngestionConfig(
+            worker=1,
+            poll_interval=0.5,
+            job_timeout=600.0,
+            recheck_interval=3600.0,
+            page_batch_size=16,
+        ),
+    )
+    await IngestionUsecases.Instance().start()
+
 
 async def run_test_with_container(handle_msg: Callable):
     """
@@ -153,6 +197,7 @@ async def run_test_with_container(handle_msg: Callable):
                 top_n_count_reranker=top_n_count_reranker,
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
+                    parent_chunk_size=parent_chunk_size,
                 device=device,
             )
 
@@ -161,6 +206,10 @@ async def run_test_with_container(handle_msg: Callable):
                 top_n_count_dens=top_n_count_dens,
                 top_n_count_sparse=top_n_count_sparse,
                 top_n_count_reranker=top_n_count_reranker,
+                auto_merge_ratio=auto_merge_ratio,
+                neighbor_window=neighbor_window,
+                embedding_batch_size=embedding_batch_size,
+                embedding_max_latency=embedding_max_latency,
                 ollama_url=ollama_url,
                 llm_model=llm_model,
                 timeout=timeout,
@@ -170,6 +219,7 @@ async def run_test_with_container(handle_msg: Callable):
             await create_database(config=config)
             create_usecases(config_v_db=config_v_db, config_llm=config_llm)
             await handle_msg()
+            await IngestionUsecases.Instance().stop()
 
 
 class TestVectorDB(unittest.IsolatedAsyncioTestCase):
@@ -263,6 +313,24 @@ class TestVectorDB(unittest.IsolatedAsyncioTestCase):
                 assert len(response.json()) == 0
 
                 # test vector
+                # the first message only enqueues the files of the conversation
+
+                response = await client.put(
+                    url=get_chat_path(id),
+                    json=MessageRequest(
+                        message="What information do you have access?", model=llm_model
+                    ).model_dump(),
+                )
+                if response.status_code != 200:
+                    logger.error(response)
+                assert response.status_code == 200
+                message = response.json()
+                assert message["response"] != ""
+                assert len(message["pendingJobs"]) > 0
+
+                for job_id in message["pendingJobs"]:
+                    job = await wait_for_job(client, job_id)
+                    assert job["status"] == "done"
 
                 response = await client.put(
                     url=get_chat_path(id),
@@ -276,6 +344,7 @@ class TestVectorDB(unittest.IsolatedAsyncioTestCase):
                 message = response.json()
                 assert message["response"] != ""
                 assert len(message["nodes"]) > 0
+                assert len(message["pendingJobs"]) == 0
 
                 response = await client.get(
                     url=get_user_conversation_path(USER_DUMMY_ID)
@@ -285,7 +354,7 @@ class TestVectorDB(unittest.IsolatedAsyncioTestCase):
                 assert response.status_code == 200
                 assert len(response.json()) == 1
                 chat = response.json()[0]
-                assert len(chat["messages"]) == 2
+                assert len(chat["messages"]) == 4
 
                 # Delete Test
                 response = await client.delete(url=get_user_conversation_path(id))
@@ -303,15 +372,22 @@ class TestVectorDB(unittest.IsolatedAsyncioTestCase):
 
 
 class MoodleDummyClient(MoodleClient):
-    def download(self, file_id: str) -> MoodleFile:
+    async def download(
+        self,
+        file_id: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> MoodleFile:
         return MoodleFile(
             id=file_id,
             org_filename=dummy_pdf,
             local_filename=dummy_pdf,
             has_been_downloaded=True,
+            etag=etag,
+            sha256=file_id,
         )
 
-    def get_file_ids_for_course(self, courseId: str) -> list[str]:
+    async def get_file_ids_for_course(self, courseId: str) -> list[str]:
         return [FILE_DUMMY_ID, FILE_2_DUMMY_ID]
 
 def get_user_conversation_path(user_id: str) -> str:
@@ -322,6 +398,21 @@ def get_chat_path(chat_id: str) -> str:
     return f"{CONVERATION_PATH}{chat_id}/message"
 
 
+async def wait_for_job(client: AsyncClient, job_id: str, timeout: float = 600.0):
+    """
+    polls the job endpoint until the job is finished
+    """
+    job = {}
+    for _ in range(int(timeout)):
+        response = await client.get(url=f"{INGESTION_JOBS_PATH}/{job_id}")
+        assert response.status_code == 200
+        job = response.json()
+        if job["status"] in ["done", "failed"]:
+            return job
+        await asyncio.sleep(1.0)
+    return job
+
+
 def query_conversation_path(
     user_id: str,
     course_id: str | None = None,
@@ -0,0 +1,34 @@
+import threading
+import time
+import unittest
+
+from core.lazy import Lazy
+
+
+class TestLazy(unittest.TestCase):
+    def test_loaded_on_first_use(self):
+        loads = []
+        value = Lazy(lambda: loads.append(1) or "model", name="dummy model")
+        assert not value.is_loaded()
+        assert loads == []
+
+        assert value.get() == "model"
+        assert value.get() == "model"
+        assert value.is_loaded()
+        assert loads == [1]
+
+    def test_concurrent_callers_share_load(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.05)
+            return "model"
+
+        value = Lazy(load, name="dummy model")
+        threads = [threading.Thread(target=value.get) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert loads == [1]
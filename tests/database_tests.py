@@ -1,13 +1,27 @@
+import asyncio
 import logging
 from typing import Callable
 import unittest
-from api.model import ChatScope, Context, Conversation, Message, NotFoundException
+from api.model import (
+    ChatScope,
+    Context,
+    Conversation,
+    FileState,
+    IngestionJob,
+    IngestionJobStatus,
+    Message,
+    NotFoundException,
+)
 from api.utils.chains import get_posix_timestamp
 from pydantic import InstanceOf
 from testcontainers.mongodb import MongoDbContainer
 
 from core.settings import init_logging
-from database.implementation import ConversationDatabase
+from database.implementation import (
+    ConversationDatabase,
+    FileStateDatabase,
+    IngestionJobDatabase,
+)
 from database.session import DatabaseConfig, MongoDatabaseSession
 from usecases.conversation_usecases import ConversationUsecases
 from usecases.model.dto import Node
@@ -269,3 +283,185 @@ class TestConversationDatbase(unittest.IsolatedAsyncioTestCase):
             assert isinstance(result.get_error(), NotFoundException)
 
         await run_test_with_mongo(run)
+
+
+class TestIngestionJobDatabase(unittest.IsolatedAsyncioTestCase):
+    async def test_claim_jobs_in_order(self):
+        async def run():
+            database = IngestionJobDatabase()
+            await database.start()
+
+            ids = []
+            for file_id in [FILE_DUMMY_ID, "second_file"]:
+                result = await database.create(
+                    IngestionJob(
+                        fileId=file_id,
+                        courseId=COURSE_DUMMY_ID,
+                        timestamp=get_posix_timestamp(),
+                    )
+                )
+                assert result.is_ok()
+                ids.append(result.get_ok())
+
+            result = await database.claim_next()
+            assert result.is_ok()
+            job = result.get_ok()
+            assert job is not None
+            assert job.id == ids[0]
+            assert job.status == IngestionJobStatus.running.value
+            assert job.attempts == 1
+
+            result = await database.set_status(job.id, IngestionJobStatus.done)
+            assert result.is_ok()
+
+            result = await database.find_latest_jobs(
+                file_ids=[FILE_DUMMY_ID], course_id=COURSE_DUMMY_ID
+            )
+            assert result.is_ok()
+            assert (
+                result.get_ok()[FILE_DUMMY_ID].status == IngestionJobStatus.done.value
+            )
+
+            result = await database.claim_next()
+            assert result.is_ok()
+            assert result.get_ok().id == ids[1]
+
+            # nothing left to claim
+            result = await database.claim_next()
+            assert result.is_ok()
+            assert result.get_ok() is None
+
+            # running jobs of dead workers are requeued
+            result = await database.requeue_stale(timeout=0.0)
+            assert result.is_ok()
+            assert result.get_ok() == 1
+
+        await run_test_with_mongo(run)
+
+    async def test_latest_job_per_file(self):
+        async def run():
+            database = IngestionJobDatabase()
+            await database.start()
+
+            result = await database.create(
+                IngestionJob(
+                    fileId=FILE_DUMMY_ID,
+                    courseId=COURSE_DUMMY_ID,
+                    timestamp=get_posix_timestamp(),
+                )
+            )
+            assert result.is_ok()
+            id = result.get_ok()
+
+            result = await database.set_status(
+                id, IngestionJobStatus.failed, error="broken pdf"
+            )
+            assert result.is_ok()
+
+            result = await database.find_latest_jobs(
+                file_ids=[FILE_DUMMY_ID, "missing_file"], course_id=COURSE_DUMMY_ID
+            )
+            assert result.is_ok()
+            jobs = result.get_ok()
+            assert len(jobs) == 1
+            assert jobs[FILE_DUMMY_ID].status == IngestionJobStatus.failed.value
+            assert jobs[FILE_DUMMY_ID].error == "broken pdf"
+
+        await run_test_with_mongo(run)
+
+    async def test_enqueue_once_per_file(self):
+        async def run():
+            database = IngestionJobDatabase()
+            await database.start()
+
+            def job():
+                return IngestionJob(
+                    fileId=FILE_DUMMY_ID,
+                    courseId=COURSE_DUMMY_ID,
+                    timestamp=get_posix_timestamp(),
+                )
+
+            # concurrent requests for the same file share one job
+            results = await asyncio.gather(*[database.enqueue(job()) for _ in range(5)])
+            assert all(result.is_ok() for result in results)
+            assert len({result.get_ok()[0] for result in results}) == 1
+            assert [result.get_ok()[1] for result in results].count(True) == 1
+            id = results[0].get_ok()[0]
+
+            result = await database.claim_next()
+            assert result.is_ok() and result.get_ok().id == id
+            result = await database.enqueue(job())
+            assert result.is_ok() and result.get_ok() == (id, False)
+
+            # a finished file gets a new job
+            result = await database.set_status(id, IngestionJobStatus.done)
+            assert result.is_ok()
+            result = await database.enqueue(job())
+            assert result.is_ok()
+            assert result.get_ok()[0] != id and result.get_ok()[1]
+
+        await run_test_with_mongo(run)
+
+
+class TestFileStateDatabase(unittest.IsolatedAsyncioTestCase):
+    async def test_save_and_replace_state(self):
+        async def run():
+            database = FileStateDatabase()
+            await database.start()
+
+            result = await database.find_by_file_id(file_id=FILE_DUMMY_ID)
+            assert result.is_ok()
+            assert result.get_ok() is None
+
+            result = await database.save(
+                FileState(fileId=FILE_DUMMY_ID, etag='"v1"', sha256="aaa")
+            )
+            assert result.is_ok()
+
+            result = await database.find_by_file_id(file_id=FILE_DUMMY_ID)
+            assert result.is_ok()
+            state = result.get_ok()
+            assert state is not None
+            assert state.etag == '"v1"'
+            assert not state.indexed
+
+            state.etag = '"v2"'
+            state.indexed = True
+            result = await database.save(state)
+            assert result.is_ok()
+
+            result = await database.get_all()
+            assert result.is_ok()
+            states = result.get_ok()
+            assert len(states) == 1
+            assert states[0].etag == '"v2"'
+            assert states[0].indexed
+
+        await run_test_with_mongo(run)
+
+    async def test_find_copy_by_hash(self):
+        async def run():
+            database = FileStateDatabase()
+            await database.start()
+
+            for file_id, indexed in [(FILE_DUMMY_ID, True), ("copy", False)]:
+                result = await database.save(
+                    FileState(fileId=file_id, sha256="same_content", indexed=indexed)
+                )
+                assert result.is_ok()
+
+            result = await database.find_indexed_by_hash(
+                sha256="same_content", exclude_file_id="copy"
+            )
+            assert result.is_ok()
+            assert result.get_ok() is not None
+            assert result.get_ok().fileId == FILE_DUMMY_ID
+
+            # the file itself and not indexed copies are no match
+            result = await database.find_indexed_by_hash(
+                sha256="same_content", exclude_file_id=FILE_DUMMY_ID
+            )
+            assert result.is_ok()
+            assert result.get_ok() is None
+
+        await run_test_with_mongo(run)
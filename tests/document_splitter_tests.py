@@ -1,7 +1,9 @@
 import logging
-from typing import Callable
+from typing import Callable, Dict, List
 import unittest
 
+from llama_index.core.schema import MetadataMode, NodeRelationship
+
 from api.model import Message
 from api.utils.chains import get_posix_timestamp
 from pdf_converter.pdf_converter import MarkerPDFConverter, MarkerPDFConverterConfig
@@ -21,6 +23,7 @@ from vector_database.vectore_store import (
     LlamaIndexVectorStoreSession,
     NodeSplitter,
     NodeSplitterConfig,
+    is_leaf_node,
 )
 
 USER_DUMMY_ID = "dummy_id"
@@ -65,6 +68,173 @@ class TestSplitter(unittest.TestCase):
         assert node.metadata[NodeSplitter.MetaDateStartPageKey] == 1
         assert node.metadata[NodeSplitter.MetaDateUpToPageKey] == 4
 
+    def test_splitter_first_page(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(chunk_size=100, chunk_overlap=20)
+        )
+
+        doc = Document(id="", content=["page five", "page six"], metadata={})
+        nodes = splitter.split_documents(doc=doc, first_page=5)
+        assert len(nodes) == 1
+        node = nodes[0]
+        assert node.metadata[NodeSplitter.MetaDateStartPageKey] == 5
+        assert node.metadata[NodeSplitter.MetaDateUpToPageKey] == 6
+
+    def test_pages_without_markers(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(chunk_size=60, chunk_overlap=0)
+        )
+
+        pages = [f"Seite {i + 1}. " + "wort " * 100 for i in range(5)]
+        doc = Document(id="", content=pages, metadata={})
+        nodes = splitter.split_documents(doc=doc)
+        for node in nodes:
+            assert "Ende Seite" not in node.get_content()
+            start_page = node.metadata[NodeSplitter.MetaDateStartPageKey]
+            assert node.get_content().startswith(f"Seite {start_page}.") or (
+                node.get_content().startswith("wort")
+            )
+        assert nodes[-1].metadata[NodeSplitter.MetaDateUpToPageKey] == 5
+
+    def test_split_page_batches(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(chunk_size=60, chunk_overlap=10)
+        )
+
+        pages = [f"Seite {i + 1} " + "wort " * 40 for i in range(10)]
+        batches = [pages[start : start + 3] for start in range(0, len(pages), 3)]
+        doc = Document(id="", content=[], metadata={})
+        nodes = [
+            node
+            for nodes in splitter.split_page_batches(doc=doc, batches=batches)
+            for node in nodes
+        ]
+        assert nodes[0].metadata[NodeSplitter.MetaDateStartPageKey] == 1
+        assert nodes[-1].metadata[NodeSplitter.MetaDateStartPageKey] == 10
+        # nodes are linked across the batches
+        for prev_node, node in zip(nodes, nodes[1:]):
+            assert prev_node.relationships[NodeRelationship.NEXT].node_id == node.node_id
+            assert node.relationships[NodeRelationship.PREVIOUS].node_id == (
+                prev_node.node_id
+            )
+
+    def test_deterministic_node_ids(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(
+                chunk_size=60, chunk_overlap=10, parent_chunk_size=200
+            )
+        )
+
+        # the same text on every page, the ids still differ
+        pages = ["wort " * 100 for _ in range(4)]
+
+        def ids(file_id: str):
+            return [
+                node.node_id
+                for node in splitter.split_documents(
+                    doc=Document(id=file_id, content=pages, metadata={})
+                )
+            ]
+
+        assert ids("a") == ids("a")
+        assert len(set(ids("a"))) == len(ids("a"))
+        assert len(set(ids("a")) & set(ids("b"))) == 0
+
+    def test_node_ids_of_unchanged_pages(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(
+                chunk_size=60, chunk_overlap=10, parent_chunk_size=200
+            )
+        )
+
+        pages = [f"# Kapitel {i + 1}\n\n" + f"wort{i} " * 120 for i in range(4)]
+        edited = pages.copy()
+        edited[1] = "# Kapitel 2\n\n" + "anders " * 40
+
+        def ids_per_page(content: List[str]):
+            ids: Dict[int, List[str]] = {}
+            doc = Document(id="a", content=[], metadata={})
+            batches = [[page] for page in content]
+            for nodes in splitter.split_page_batches(doc=doc, batches=batches):
+                for node in nodes:
+                    page = node.metadata[NodeSplitter.MetaDateStartPageKey]
+                    ids.setdefault(page, []).append(node.node_id)
+            return ids
+
+        before = ids_per_page(pages)
+        after = ids_per_page(edited)
+        assert before[2] != after[2]
+        for page in [1, 3, 4]:
+            assert before[page] == after[page]
+
+    def test_ordinals_of_stored_nodes(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(
+                chunk_size=60, chunk_overlap=10, parent_chunk_size=200
+            )
+        )
+
+        page = "# Kapitel\n\nmein Toller Text"
+
+        def split(first_page: int, ordinals: Dict[str, int]):
+            doc = Document(id="a", content=[page], metadata={})
+            return splitter.split_documents(
+                doc=doc, first_page=first_page, ordinals=ordinals
+            )
+
+        ordinals: Dict[str, int] = {}
+        first = split(1, ordinals)
+        second = split(2, ordinals)
+        # the parent and its only child have the same content hash
+        assert len(first) == 2
+        hashes = {node.metadata[NodeSplitter.MetaDataContentHashKey] for node in first}
+        assert len(hashes) == 1
+
+        # the second page is stored again next to the stored nodes of the first
+        stored = splitter.stored_ordinals(node.metadata for node in first)
+        again = split(2, stored)
+        assert [node.node_id for node in again] == [node.node_id for node in second]
+
+    def test_hierarchical_splitting(self):
+        splitter = NodeSplitter(
+            config=NodeSplitterConfig(
+                chunk_size=60, chunk_overlap=10, parent_chunk_size=200
+            )
+        )
+
+        pages = [
+            f"# Kapitel {i + 1}\n\n"
+            + "wort " * 60
+            + f"\n\n## Abschnitt {i + 1}\n\n"
+            + "satz " * 20
+            for i in range(3)
+        ]
+        doc = Document(id="", content=pages, metadata={})
+        nodes = splitter.split_documents(doc=doc)
+        parents = [node for node in nodes if not is_leaf_node(node)]
+        children = [node for node in nodes if is_leaf_node(node)]
+        assert len(parents) > 0 and len(children) > len(parents)
+
+        # every chapter starts a new parent, the parents cover the whole text
+        chapters = [
+            parent.get_content()[: len("# Kapitel 1")]
+            for parent in parents
+            if parent.get_content().startswith("# Kapitel")
+        ]
+        assert chapters == ["# Kapitel 1", "# Kapitel 2", "# Kapitel 3"]
+        for prev_parent, parent in zip(parents, parents[1:]):
+            assert prev_parent.end_char_idx == parent.start_char_idx
+        for parent in parents:
+            assert parent.child_nodes is not None and len(parent.child_nodes) > 0
+        for child in children:
+            parent_id = child.relationships[NodeRelationship.PARENT].node_id
+            parent = next(parent for parent in parents if parent.node_id == parent_id)
+            assert parent.start_char_idx <= child.start_char_idx < parent.end_char_idx
+            assert child.metadata[NodeSplitter.MetaDataParentIdKey] == parent.node_id
+            embedded = child.get_content(metadata_mode=MetadataMode.EMBED)
+            assert parent.node_id not in embedded
+        assert children[-1].metadata[NodeSplitter.MetaDateUpToPageKey] == 3
+
     def test_with_splitting_pdf(self):
         PdfConverterUsecase.create(pdf_converter=MarkerPDFConverter(
             config=MarkerPDFConverterConfig(ollama_host=None,use_llm=False,model=None)
@@ -96,4 +266,5 @@ class TestSplitter(unittest.TestCase):
         nodes = splitter.split_documents(doc=doc)
         assert len(nodes) > 1
         node = nodes[len(nodes) - 1]
-        assert node.metadata[NodeSplitter.MetaDateUpToPageKey] == 78
+        # the text after the last page marker is empty
+        assert node.metadata[NodeSplitter.MetaDateUpToPageKey] == 77
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import time
+from typing import List, Optional
+import unittest
+
+from core.metrics import Metrics
+from usecases.llm.batched_embedding import BatchedEmbedding, BatchedEmbeddingConfig
+from usecases.llm.embedding_cache import (
+    CachedEmbedding,
+    CachedSparseEncoder,
+    EmbeddingCache,
+)
+
+
+class CountingModel:
+    """
+    Returns the length of the text and whether it is a query, counts the forward passes.
+    """
+
+    def __init__(self) -> None:
+        self.batches: List[List[int]] = []
+
+    def _embed(
+        self, texts: List[str], prompt_name: Optional[str] = None
+    ) -> List[List[float]]:
+        self.batches.append([len(text) for text in texts])
+        time.sleep(0.02)
+        return [[float(len(text)), float(prompt_name == "query")] for text in texts]
+
+
+class TestBatchedEmbedding(unittest.TestCase):
+    def test_concurrent_requests_are_batched(self):
+        model = CountingModel()
+        embedding = BatchedEmbedding(
+            load=lambda: model,  # type: ignore
+            config=BatchedEmbeddingConfig(max_batch_size=8, max_latency=0.05),
+            model_name="counting model",
+        )
+
+        results = {}
+
+        def embed(i: int):
+            results[i] = embedding.get_text_embedding_batch(
+                ["x" * (10 * i + j) for j in range(2)]
+            )
+
+        threads = [threading.Thread(target=embed, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(4):
+            assert results[i] == [[float(10 * i + j), 0.0] for j in range(2)]
+        assert len(model.batches) < 4
+        # texts of a batch are sorted by length
+        for batch in model.batches:
+            assert batch == sorted(batch)
+        assert embedding.get_query_embedding("query") == [5.0, 1.0]
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def test_unchanged_chunks_are_not_embedded_again(self):
+        model = CountingModel()
+        embedding = BatchedEmbedding(
+            load=lambda: model,  # type: ignore
+            config=BatchedEmbeddingConfig(max_batch_size=8, max_latency=0.0),
+            model_name="counting model",
+        )
+        sparse_calls: List[List[str]] = []
+
+        def sparse_encoder(texts: List[str]):
+            sparse_calls.append(texts)
+            return [[len(text)] for text in texts], [[0.5] for _ in texts]
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = EmbeddingCache(
+                path=os.path.join(directory, "embedding_cache.sqlite3"),
+                max_bytes=1024 * 1024,
+            )
+            cached = CachedEmbedding(embedding=embedding, cache=cache)
+            cached_sparse = CachedSparseEncoder(
+                encoder=sparse_encoder, cache=cache, model_name=lambda: "sparse"
+            )
+
+            assert cached.get_text_embedding_batch(["eins", "zwei"]) == [
+                [4.0, 0.0],
+                [4.0, 0.0],
+            ]
+            hits = Metrics.get("embedding_cache_dense_hits_total")
+            # whitespace is normalized, only the new chunk is embedded
+            assert cached.get_text_embedding_batch(["eins ", "drei!"]) == [
+                [4.0, 0.0],
+                [5.0, 0.0],
+            ]
+            assert model.batches[-1] == [5]
+            assert Metrics.get("embedding_cache_dense_hits_total") == hits + 1
+
+            assert cached_sparse(["eins", "zwei"]) == ([[4], [4]], [[0.5], [0.5]])
+            assert cached_sparse(["zwei", "vier!"]) == ([[4], [5]], [[0.5], [0.5]])
+            assert sparse_calls == [["eins", "zwei"], ["vier!"]]
+            assert 0 < Metrics.get("embedding_cache_sparse_hit_rate") < 1
+
+            # queries are not cached
+            passes = len(model.batches)
+            cached.get_query_embedding("eins")
+            cached.get_query_embedding("eins")
+            assert len(model.batches) == passes + 2
+            cache.close()
@@ -0,0 +1,130 @@
+"""
+Benchmark of the filters of a question about n files.
+Run from the root of the repository: python tests/filter_benchmark.py
+
+Compares the previous filter (one EQ condition per file joined with OR)
+with one IN condition on the file ids (MatchAny).
+With QDRANT_HOST the benchmark runs against that server (with the payload indexes),
+otherwise against a smaller local in-memory Qdrant, which ignores payload indexes
+and checks every condition of the filter against every point.
+"""
+
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, "src")
+
+from llama_index.core.vector_stores.types import (  # noqa: E402
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+from llama_index.vector_stores.qdrant import QdrantVectorStore  # noqa: E402
+from llama_index.vector_stores.qdrant.base import DENSE_VECTOR_NAME  # noqa: E402
+from qdrant_client import QdrantClient, models  # noqa: E402
+
+from usecases.llm.filters import to_metadata_filters  # noqa: E402
+from vector_database.vectore_store import (  # noqa: E402
+    QdrantCollectionConfig,
+    QdrantCollectionManager,
+)
+
+COLLECTION = "filter_benchmark"
+FILES = [10, 50, 200]
+TOTAL_FILES = 1000
+VECTOR_SIZE = 64
+# server, local in-memory Qdrant
+NODES_PER_FILE = (10, 2)
+QUERIES = (50, 3)
+
+
+def legacy_filters(filters: Dict[str, List[str]]) -> MetadataFilters:
+    metadata_filters = MetadataFilters(filters=[])
+    for key in filters.keys():
+        for value in filters[key]:
+            metadata_filters.filters.append(
+                MetadataFilter(key=key, value=value, operator=FilterOperator.EQ)
+            )
+    metadata_filters.condition = FilterCondition.OR
+    return metadata_filters
+
+
+def random_vector() -> List[float]:
+    return [random.random() for _ in range(VECTOR_SIZE)]
+
+
+def fill_collection(client: QdrantClient, nodes_per_file: int) -> Dict[int, List[str]]:
+    """
+    File ids of the question of every size, the remaining files are not asked about.
+    """
+    courses: Dict[int, List[str]] = {}
+    file_number = 0
+    points = []
+    for size in FILES + [TOTAL_FILES - sum(FILES)]:
+        courses[size] = [f"file-{file_number + i}" for i in range(size)]
+        for file_id in courses[size]:
+            for _ in range(nodes_per_file):
+                points.append(
+                    models.PointStruct(
+                        id=len(points),
+                        vector={DENSE_VECTOR_NAME: random_vector()},
+                        payload={"file_id": [file_id], "course_id": [f"course-{size}"]},
+                    )
+                )
+        file_number += size
+
+    for start in range(0, len(points), 1000):
+        client.upsert(collection_name=COLLECTION, points=points[start : start + 1000])
+    return courses
+
+
+def measure(
+    client: QdrantClient,
+    store: QdrantVectorStore,
+    filters: MetadataFilters,
+    queries: int,
+) -> float:
+    query_filter = store._build_subfilter(filters)
+    start = time.perf_counter()
+    for _ in range(queries):
+        client.query_points(
+            collection_name=COLLECTION,
+            query=random_vector(),
+            using=DENSE_VECTOR_NAME,
+            query_filter=query_filter,
+            limit=10,
+        )
+    return (time.perf_counter() - start) / queries
+
+
+def main():
+    host = os.environ.get("QDRANT_HOST")
+    client = QdrantClient(host=host) if host else QdrantClient(location=":memory:")
+    mode = 0 if host else 1
+    queries = QUERIES[mode]
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    QdrantCollectionManager(
+        client=client,
+        collection=COLLECTION,
+        config=QdrantCollectionConfig(vector_size=VECTOR_SIZE),
+    ).ensure_collection()
+    store = QdrantVectorStore(client=client, collection_name=COLLECTION)
+    courses = fill_collection(client, nodes_per_file=NODES_PER_FILE[mode])
+    print(f"{TOTAL_FILES * NODES_PER_FILE[mode]} points, {queries} queries per filter")
+
+    print(f"{'files':>6} {'OR of EQ [ms]':>14} {'IN [ms]':>8}")
+    for size in FILES:
+        file_filter = {"file_id": courses[size]}
+        legacy = measure(client, store, legacy_filters(file_filter), queries)
+        match_any = measure(client, store, to_metadata_filters(file_filter), queries)
+        print(f"{size:>6} {legacy * 1000:>14.2f} {match_any * 1000:>8.2f}")
+    client.delete_collection(COLLECTION)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import asyncio
+from typing import Optional
+import unittest
+
+from moodle.downloads import MoodleClient, MoodleFile
+from usecases.download_file_from_moodle import CourseCacheConfig, MoodleUsecase
+
+COURSE_DUMMY_ID = "dummy_course_id"
+
+
+class CountingMoodleClient(MoodleClient):
+    """
+    Returns a new file list on every request and counts the requests.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+
+    async def download(
+        self,
+        file_id: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> MoodleFile:
+        raise NotImplementedError()
+
+    async def get_file_ids_for_course(self, courseId: str) -> list[str]:
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return [f"{courseId}_{self.requests}"]
+
+
+class TestCourseFileCache(unittest.IsolatedAsyncioTestCase):
+    async def test_cached_within_ttl(self):
+        client = CountingMoodleClient()
+        usecase = MoodleUsecase(client, CourseCacheConfig(ttl=60.0, stale_ttl=0.0))
+
+        file_ids = await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID)
+        file_ids.append("modified by caller")
+        assert await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID) == [
+            f"{COURSE_DUMMY_ID}_1"
+        ]
+        assert client.requests == 1
+
+        assert usecase.invalidate_course(course_id=COURSE_DUMMY_ID)
+        assert not usecase.invalidate_course(course_id=COURSE_DUMMY_ID)
+        assert await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID) == [
+            f"{COURSE_DUMMY_ID}_2"
+        ]
+
+    async def test_concurrent_misses_share_request(self):
+        client = CountingMoodleClient()
+        usecase = MoodleUsecase(client, CourseCacheConfig())
+
+        results = await asyncio.gather(
+            *[
+                usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID)
+                for _ in range(5)
+            ]
+        )
+        assert client.requests == 1
+        assert all(result == results[0] for result in results)
+
+    async def test_stale_while_revalidate(self):
+        client = CountingMoodleClient()
+        usecase = MoodleUsecase(client, CourseCacheConfig(ttl=0.0, stale_ttl=60.0))
+
+        await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID)
+        # the stale list is returned at once, the refresh runs in the background
+        assert await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID) == [
+            f"{COURSE_DUMMY_ID}_1"
+        ]
+        await asyncio.sleep(0.1)
+        assert client.requests == 2
+        assert await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID) == [
+            f"{COURSE_DUMMY_ID}_2"
+        ]
+
+    async def test_least_recently_used_course_is_evicted(self):
+        client = CountingMoodleClient()
+        usecase = MoodleUsecase(client, CourseCacheConfig(max_courses=1))
+
+        await usecase.get_file_ids_to_course(course_id="first")
+        await usecase.get_file_ids_to_course(course_id="second")
+        await usecase.get_file_ids_to_course(course_id="first")
+        assert client.requests == 3
+
+    async def test_invalidate_during_request(self):
+        client = CountingMoodleClient()
+        usecase = MoodleUsecase(client, CourseCacheConfig(ttl=60.0, stale_ttl=0.0))
+
+        loading = asyncio.create_task(
+            usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID)
+        )
+        await asyncio.sleep(0)
+        assert usecase.invalidate_course(course_id=COURSE_DUMMY_ID)
+        # the list of the running request is not cached
+        assert await loading == [f"{COURSE_DUMMY_ID}_1"]
+        assert await usecase.get_file_ids_to_course(course_id=COURSE_DUMMY_ID) == [
+            f"{COURSE_DUMMY_ID}_2"
+        ]
+        assert client.requests == 2
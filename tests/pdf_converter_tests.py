@@ -0,0 +1,279 @@
+import os
+import tempfile
+from typing import List
+import unittest
+
+import PyPDF2
+from PyPDF2.generic import DictionaryObject, NameObject
+
+from pdf_converter.markdown_cache import CachedPDFConverter, MarkdownCache
+from pdf_converter.pdf_converter import split_paginated_markdown
+from pdf_converter.process_pool_converter import (
+    ProcessPoolPDFConverter,
+    ProcessPoolPDFConverterConfig,
+)
+from pdf_converter.tiered_converter import (
+    TieredPDFConverter,
+    TieredPDFConverterConfig,
+    text_quality,
+)
+from pdf_converter.utils import changed_pages, page_fingerprints
+from usecases.storage import PDFConverter
+
+PAGE_SEPARATOR = "-" * 48
+dummy_pdf = "dummy.pdf"
+
+
+def paginate(pages: dict[int, str]) -> str:
+    """
+    builds the paginated output of marker
+    """
+    return "".join(
+        f"\n\n{{{page_id}}}{PAGE_SEPARATOR}\n\n{content}"
+        for page_id, content in pages.items()
+    )
+
+
+class TestSplitPaginatedMarkdown(unittest.TestCase):
+    def test_split_pages(self):
+        markdown = paginate({0: "# Title\n\nfirst page", 1: "second page"})
+        pages = split_paginated_markdown(markdown, [0, 1])
+        assert pages == ["# Title\n\nfirst page", "second page"]
+
+    def test_page_range_and_missing_pages(self):
+        # page ids of a batch keep their position in the document
+        markdown = paginate({10: "eleventh page", 12: "thirteenth page"})
+        pages = split_paginated_markdown(markdown, [10, 11, 12])
+        assert pages == ["eleventh page", "", "thirteenth page"]
+
+    def test_tables_are_no_separator(self):
+        markdown = paginate({0: "| a | b |\n|---|---|\n| 1 | 2 |"})
+        pages = split_paginated_markdown(markdown, [0])
+        assert pages == ["| a | b |\n|---|---|\n| 1 | 2 |"]
+
+
+class RecordingPDFConverter(PDFConverter):
+    """
+    Fallback that remembers which pages it had to convert.
+    """
+
+    def __init__(self) -> None:
+        self.converted_pages: List[int] = []
+
+    def transform_file_to_markdown(self, file: str) -> list[str]:
+        raise NotImplementedError()
+
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        self.converted_pages.extend(pages)
+        return [f"converted {page}" for page in pages]
+
+
+class AsyncRecordingPDFConverter(RecordingPDFConverter):
+    """
+    Fails if a wrapper calls the blocking conversion in its async path.
+    """
+
+    def transform_pages_to_markdown(self, file: str, pages: List[int]) -> list[str]:
+        raise AssertionError("blocking conversion called")
+
+    async def transform_pages_to_markdown_async(
+        self, file: str, pages: List[int]
+    ) -> list[str]:
+        return super().transform_pages_to_markdown(file=file, pages=pages)
+
+
+class FakeConverterProcess:
+    """
+    Worker that converts in the test process, dies after its conversion if mortal.
+    """
+
+    def __init__(self, mortal: bool) -> None:
+        self.alive = True
+        self.mortal = mortal
+
+    def wait_ready(self):
+        pass
+
+    def run(self, job, timeout: float) -> List[str]:
+        self.alive = not self.mortal
+        return [f"converted {job[0]}"]
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+    def stop(self):
+        self.alive = False
+
+
+class FailingStartPDFConverter(ProcessPoolPDFConverter):
+    """
+    The next failures worker starts raise, like a system without free processes.
+    """
+
+    def __init__(self, failures: int, mortal: bool = False) -> None:
+        super().__init__(
+            config=ProcessPoolPDFConverterConfig(
+                worker=1, timeout=0.1, max_rss_mb=0, converter_config={}
+            )
+        )
+        self.failures = failures
+        self.mortal = mortal
+
+    def _create_process(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("no free processes")
+        return FakeConverterProcess(mortal=self.mortal)
+
+
+class TestProcessPoolPDFConverter(unittest.TestCase):
+    def test_failed_start_gives_the_slot_back(self):
+        converter = FailingStartPDFConverter(failures=1)
+        with self.assertRaises(OSError):
+            converter.transform_file_to_markdown(dummy_pdf)
+        # without the slot the conversion would wait for an idle worker forever
+        assert converter.transform_file_to_markdown(dummy_pdf) == [
+            f"converted {dummy_pdf}"
+        ]
+        converter.close()
+
+    def test_failed_restart_gives_the_slot_back(self):
+        converter = FailingStartPDFConverter(failures=0, mortal=True)
+        converter.transform_file_to_markdown(dummy_pdf)
+        converter.failures = 1
+        # the dead worker is replaced after the next conversion, which fails
+        converter.transform_file_to_markdown(dummy_pdf)
+        converter.mortal = False
+        assert converter.transform_file_to_markdown(dummy_pdf) == [
+            f"converted {dummy_pdf}"
+        ]
+        converter.close()
+
+
+class TestTieredPDFConverter(unittest.TestCase):
+    def test_text_layer_is_used(self):
+        fallback = RecordingPDFConverter()
+        converter = TieredPDFConverter(
+            fallback=fallback, config=TieredPDFConverterConfig(min_chars=1)
+        )
+        pages = converter.transform_file_to_markdown(dummy_pdf)
+        assert pages == ["Dummy", "dummy", "dummy", "dummy"]
+        assert fallback.converted_pages == []
+
+    def test_short_pages_use_fallback(self):
+        fallback = RecordingPDFConverter()
+        converter = TieredPDFConverter(
+            fallback=fallback, config=TieredPDFConverterConfig(min_chars=100)
+        )
+        pages = converter.transform_pages_to_markdown(dummy_pdf, [1, 3])
+        assert pages == ["converted 1", "converted 3"]
+        assert fallback.converted_pages == [1, 3]
+
+    def test_text_quality(self):
+        assert text_quality("Regular text of a slide") == 1.0
+        assert text_quality("") == 0.0
+        assert text_quality("(cid:12)(cid:7)(cid:3)") < 0.5
+
+
+class TestCachedPDFConverter(unittest.TestCase):
+    def test_only_missing_pages_are_converted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fallback = RecordingPDFConverter()
+            cache = MarkdownCache(
+                path=os.path.join(directory, "cache.sqlite3"), max_bytes=1024 * 1024
+            )
+            converter = CachedPDFConverter(converter=fallback, cache=cache)
+
+            assert converter.transform_pages_to_markdown(dummy_pdf, [0, 1]) == [
+                "converted 0",
+                "converted 1",
+            ]
+            pages = converter.transform_file_to_markdown(dummy_pdf)
+            # pages 1 to 3 of the dummy are identical, they share the markdown
+            assert pages == ["converted 0"] + ["converted 1"] * 3
+            assert fallback.converted_pages == [0, 1]
+            converter.close()
+
+    def test_least_recently_used_pages_are_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = MarkdownCache(
+                path=os.path.join(directory, "cache.sqlite3"), max_bytes=25
+            )
+            cache.put("first", "converter", {0: "a" * 10})
+            cache.put("second", "converter", {0: "b" * 10})
+            assert cache.get("first", "converter", [0]) == {0: "a" * 10}
+
+            cache.put("third", "converter", {0: "c" * 10})
+            assert cache.size() <= 25
+            assert cache.get("second", "converter", [0]) == {}
+            assert cache.get("first", "converter", [0]) == {0: "a" * 10}
+            cache.close()
+
+    def test_unchanged_pages_are_found_by_fingerprint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = MarkdownCache(
+                path=os.path.join(directory, "cache.sqlite3"), max_bytes=1024 * 1024
+            )
+            cache.put("old", "converter", {0: "a", 1: "b"}, {0: "page a", 1: "page b"})
+            # page 1 of the new version was inserted in front of page b
+            pages = cache.get(
+                "new", "converter", [0, 1, 2], {0: "page a", 1: "new", 2: "page b"}
+            )
+            assert pages == {0: "a", 2: "b"}
+            assert cache.get("new", "other converter", [0], {0: "page a"}) == {}
+            cache.close()
+
+
+class TestAsyncConversion(unittest.IsolatedAsyncioTestCase):
+    async def test_wrappers_await_the_fallback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fallback = AsyncRecordingPDFConverter()
+            cache = MarkdownCache(
+                path=os.path.join(directory, "cache.sqlite3"), max_bytes=1024 * 1024
+            )
+            converter = CachedPDFConverter(
+                converter=TieredPDFConverter(
+                    fallback=fallback, config=TieredPDFConverterConfig(min_chars=100)
+                ),
+                cache=cache,
+            )
+            pages = await converter.transform_file_to_markdown_async(dummy_pdf)
+            assert pages == [f"converted {page}" for page in range(4)]
+            # the second time all pages come from the cache
+            assert await converter.transform_file_to_markdown_async(dummy_pdf) == pages
+            assert fallback.converted_pages == [0, 1, 2, 3]
+            converter.close()
+
+
+class TestPageFingerprints(unittest.TestCase):
+    def test_fingerprints_are_stable(self):
+        fingerprints = page_fingerprints(dummy_pdf)
+        assert len(fingerprints) == 4
+        assert page_fingerprints(dummy_pdf) == fingerprints
+
+    def test_fingerprints_include_fonts(self):
+        writer = PyPDF2.PdfWriter()
+        for page in PyPDF2.PdfReader(dummy_pdf).pages:
+            writer.add_page(page)
+        # the same content stream of the last page with another font
+        font = DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Courier"),
+            }
+        )
+        writer.pages[3][NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "other_font.pdf")
+            with open(file, "wb") as output:
+                writer.write(output)
+            fingerprints = page_fingerprints(file)
+        assert changed_pages(page_fingerprints(dummy_pdf), fingerprints) == [3]
+
+    def test_changed_pages(self):
+        assert changed_pages(["a", "b", "c"], ["a", "b", "c"]) == []
+        assert changed_pages(["a", "b", "c"], ["a", "x", "c", "d"]) == [1, 3]
+        assert changed_pages(["a", "b", "c"], ["a"]) == [1, 2]
@@ -0,0 +1,185 @@
+"""
+Recall and latency of the dense search with quantized and on-disk vectors.
+Needs a Qdrant server (a local in-memory Qdrant always searches exactly).
+Run from the root of the repository:
+QDRANT_HOST=localhost python tests/quantization_benchmark.py
+
+Every variant gets its own collection, created by the QdrantCollectionManager,
+and is searched like the store does it (with the QuantizedSearchClient).
+The vectors are clustered like embeddings of chunks of a few topics,
+the recall@10 is measured against an exact search.
+"""
+
+import os
+import sys
+import time
+from typing import List, Set, Tuple
+
+import numpy as np
+
+sys.path.insert(0, "src")
+
+from llama_index.vector_stores.qdrant.base import DENSE_VECTOR_NAME  # noqa: E402
+from qdrant_client import QdrantClient, models  # noqa: E402
+
+from vector_database.vectore_store import (  # noqa: E402
+    QdrantCollectionConfig,
+    QdrantCollectionManager,
+    QdrantQuantization,
+    QuantizedSearchClient,
+)
+
+COLLECTION = "quantization_benchmark"
+POINTS = 20000
+TOPICS = 50
+VECTOR_SIZE = 768
+QUERIES = 100
+TOP_K = 10
+
+VARIANTS: List[Tuple[str, QdrantCollectionConfig]] = [
+    ("none", QdrantCollectionConfig(vector_size=VECTOR_SIZE)),
+    (
+        "scalar",
+        QdrantCollectionConfig(
+            vector_size=VECTOR_SIZE,
+            quantization=QdrantQuantization.scalar,
+            oversampling=1.0,
+            rescore=False,
+        ),
+    ),
+    (
+        "scalar x2 rescore",
+        QdrantCollectionConfig(
+            vector_size=VECTOR_SIZE, quantization=QdrantQuantization.scalar
+        ),
+    ),
+    (
+        "binary",
+        QdrantCollectionConfig(
+            vector_size=VECTOR_SIZE,
+            quantization=QdrantQuantization.binary,
+            oversampling=1.0,
+            rescore=False,
+        ),
+    ),
+    (
+        "binary x2 rescore",
+        QdrantCollectionConfig(
+            vector_size=VECTOR_SIZE, quantization=QdrantQuantization.binary
+        ),
+    ),
+    (
+        "binary x4 rescore",
+        QdrantCollectionConfig(
+            vector_size=VECTOR_SIZE,
+            quantization=QdrantQuantization.binary,
+            oversampling=4.0,
+        ),
+    ),
+    (
+        "binary x2 on disk",
+        QdrantCollectionConfig(
+            vector_size=VECTOR_SIZE,
+            quantization=QdrantQuantization.binary,
+            on_disk=True,
+            on_disk_payload=True,
+        ),
+    ),
+]
+
+
+def clustered_vectors(count: int, rng: np.random.Generator) -> np.ndarray:
+    topics = rng.normal(size=(TOPICS, VECTOR_SIZE))
+    vectors = topics[rng.integers(0, TOPICS, size=count)] + rng.normal(
+        scale=0.8, size=(count, VECTOR_SIZE)
+    )
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fill_collection(
+    client: QdrantClient,
+    name: str,
+    config: QdrantCollectionConfig,
+    vectors: np.ndarray,
+):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    manager = QdrantCollectionManager(client=client, collection=name, config=config)
+    manager.ensure_collection()
+    for start in range(0, len(vectors), 1000):
+        client.upsert(
+            collection_name=name,
+            points=[
+                models.PointStruct(
+                    id=start + i, vector={DENSE_VECTOR_NAME: vector.tolist()}
+                )
+                for i, vector in enumerate(vectors[start : start + 1000])
+            ],
+        )
+    # wait until the HNSW graph and the quantized vectors are built
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(1)
+
+
+def search(
+    client, name: str, query: np.ndarray, params: models.SearchParams | None
+) -> Set[int]:
+    (points,) = client.search_batch(
+        collection_name=name,
+        requests=[
+            models.SearchRequest(
+                vector=models.NamedVector(
+                    name=DENSE_VECTOR_NAME, vector=query.tolist()
+                ),
+                limit=TOP_K,
+                params=params,
+            )
+        ],
+    )
+    return {int(point.id) for point in points}
+
+
+def main():
+    client = QdrantClient(
+        host=os.environ.get("QDRANT_HOST", "localhost"),
+        port=int(os.environ.get("QDRANT_PORT", "6333")),
+    )
+    rng = np.random.default_rng(42)
+    vectors = clustered_vectors(POINTS, rng)
+    queries = clustered_vectors(QUERIES, rng)
+
+    print(f"{POINTS} points, {VECTOR_SIZE} dimensions, {QUERIES} queries")
+    print(f"{'variant':>18} {'recall@10':>10} {'ms/query':>9}")
+    exact: List[Set[int]] = []
+    for variant, config in VARIANTS:
+        name = f"{COLLECTION}_{variant.replace(' ', '_')}"
+        fill_collection(client, name, config, vectors)
+        if len(exact) == 0:
+            exact = [
+                search(client, name, query, models.SearchParams(exact=True))
+                for query in queries
+            ]
+
+        search_params = QdrantCollectionManager(
+            client=client, collection=name, config=config
+        ).search_params()
+        search_client = (
+            client
+            if search_params is None
+            else QuantizedSearchClient(client, search_params)
+        )
+        found = []
+        start = time.perf_counter()
+        for query in queries:
+            found.append(search(search_client, name, query, None))
+        latency = (time.perf_counter() - start) / QUERIES
+
+        recall = sum(
+            len(result & expected) for result, expected in zip(found, exact)
+        ) / (TOP_K * QUERIES)
+        print(f"{variant:>18} {recall:>10.3f} {latency * 1000:>9.2f}")
+        client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
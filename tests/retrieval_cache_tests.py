@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from typing import List, Optional
+import unittest
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.types import FilterOperator
+
+from usecases.llm.filters import to_metadata_filters
+from usecases.llm.retrieval_cache import (
+    CachedRetriever,
+    RetrievalCache,
+    RetrievalCacheConfig,
+)
+
+
+class CountingRetriever(BaseRetriever):
+    def __init__(self) -> None:
+        super().__init__()
+        self.queries: List[str] = []
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        self.queries.append(query_bundle.query_str)
+        return [NodeWithScore(node=TextNode(text=query_bundle.query_str), score=1.0)]
+
+
+class ThreadRecordingPostprocessor(BaseNodePostprocessor):
+    threads: List[str] = []
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        self.threads.append(threading.current_thread().name)
+        return nodes
+
+
+class TestRetrievalCache(unittest.TestCase):
+    def test_writes_invalidate_questions_about_the_file(self):
+        cache = RetrievalCache(config=RetrievalCacheConfig(ttl=600.0, max_entries=8))
+        retriever = CountingRetriever()
+
+        def ask(query: str, file_ids: List[str]) -> List[NodeWithScore]:
+            return CachedRetriever(
+                retriever=retriever,
+                node_postprocessors=[],
+                cache=cache,
+                filters={"file_id": file_ids},
+            ).retrieve(query)
+
+        ask("Was ist RAG?", ["a", "b"])
+        ask("Was ist  RAG?", ["b", "a"])
+        assert retriever.queries == ["Was ist RAG?"]
+
+        # a question about other files is retrieved again
+        ask("Was ist RAG?", ["c"])
+        assert len(retriever.queries) == 2
+
+        cache.invalidate(file_id="b")
+        ask("Was ist RAG?", ["a", "b"])
+        ask("Was ist RAG?", ["c"])
+        assert len(retriever.queries) == 3
+
+    def test_entries_expire(self):
+        cache = RetrievalCache(config=RetrievalCacheConfig(ttl=0.0, max_entries=8))
+        retriever = CountingRetriever()
+        for _ in range(2):
+            CachedRetriever(
+                retriever=retriever, node_postprocessors=[], cache=cache, filters={}
+            ).retrieve("Was ist RAG?")
+        assert len(retriever.queries) == 2
+
+    def test_async_retrieval_reranks_in_worker_thread(self):
+        cache = RetrievalCache(config=RetrievalCacheConfig(ttl=600.0, max_entries=8))
+        retriever = CountingRetriever()
+        postprocessor = ThreadRecordingPostprocessor()
+        cached = CachedRetriever(
+            retriever=retriever,
+            node_postprocessors=[postprocessor],
+            cache=cache,
+            filters={"file_id": ["a"]},
+        )
+
+        async def ask():
+            return await asyncio.gather(
+                cached.aretrieve("Was ist RAG?"), cached.aretrieve("Was ist ein LLM?")
+            )
+
+        results = asyncio.run(ask())
+        assert [result[0].node.get_content() for result in results] == [
+            "Was ist RAG?",
+            "Was ist ein LLM?",
+        ]
+        assert len(postprocessor.threads) == 2
+        assert threading.main_thread().name not in postprocessor.threads
+
+        asyncio.run(cached.aretrieve("Was ist RAG?"))
+        assert len(retriever.queries) == 2
+
+
+class TestMetadataFilters(unittest.TestCase):
+    def test_one_condition_per_key(self):
+        metadata_filters = to_metadata_filters(
+            {"file_id": ["a", "b", "c"], "course_id": []}
+        )
+        assert len(metadata_filters.filters) == 1
+        condition = metadata_filters.filters[0]
+        assert condition.key == "file_id"  # type: ignore
+        assert condition.operator == FilterOperator.IN  # type: ignore
+        assert condition.value == ["a", "b", "c"]  # type: ignore
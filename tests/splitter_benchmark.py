@@ -0,0 +1,74 @@
+"""
+Benchmark of the NodeSplitter on llama2_paper.md.
+Run from the root of the repository: python tests/splitter_benchmark.py
+
+The paper is repeated to show how the time grows with the document size.
+The previous implementation (string concatenation and a regex scan of every node)
+is measured for the merge and the page tracking only.
+"""
+
+import re
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, "src")
+
+from usecases.model.dto import Document  # noqa: E402
+from vector_database.vectore_store import NodeSplitter, NodeSplitterConfig  # noqa: E402
+
+REPEATS = [1, 2, 4, 8]
+
+
+def legacy_merge(pages: List[str]) -> str:
+    content = ""
+    for i in range(len(pages)):
+        content = f"""{content}\n\n{pages[i]}\n\n---- Ende Seite {i + 1} ----\n\n"""
+    return content
+
+
+def legacy_page_tracking(chunks: List[str]) -> int:
+    page_number = 1
+    for chunk in chunks:
+        matches = re.findall(NodeSplitter.PageSplitPattern, chunk)
+        if len(matches) > 0:
+            page_number = int(matches[len(matches) - 1]) + 1
+    return page_number
+
+
+def measure(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    splitter = NodeSplitter(config=NodeSplitterConfig(chunk_size=128, chunk_overlap=20))
+    with open("llama2_paper.md", "r") as file:
+        pages = splitter._split_pages(content=file.read())
+
+    print(
+        f"{'pages':>6} {'split [s]':>10} {'ms/page':>8} {'merge [s]':>10} "
+        f"{'legacy merge [s]':>17} {'legacy pages [s]':>17}"
+    )
+    for repeat in REPEATS:
+        document_pages = pages * repeat
+        doc = Document(id="benchmark", content=document_pages, metadata={})
+        split = measure(splitter.split_documents, doc)
+        merge = measure(splitter._merge_doc, document_pages)
+
+        legacy_content = legacy_merge(document_pages)
+        legacy_chunks = [
+            legacy_content[start : start + 600]
+            for start in range(0, len(legacy_content), 500)
+        ]
+        print(
+            f"{len(document_pages):>6} {split:>10.3f} "
+            f"{split / len(document_pages) * 1000:>8.2f} {merge:>10.4f} "
+            f"{measure(legacy_merge, document_pages):>17.4f} "
+            f"{measure(legacy_page_tracking, legacy_chunks):>17.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,17 +10,28 @@ from testcontainers.qdrant import QdrantContainer
 from core.settings import init_logging
 from usecases.ask_llm import AskLLMUsecase
 from usecases.convert_pdf_to_markdown import PdfConverterUsecase
-from usecases.llm.init_index import LLamaIndexHolder, LlamaIndexRAGConfig
+from usecases.llm.init_index import (
+    LLamaIndexHolder,
+    LlamaIndexRAGConfig,
+    create_embedding,
+    embedding_dimension,
+)
 from usecases.llm.llama_index_rag_llm import LLamaIndexRAGLLM
+from usecases.llm.neighbor_expansion import stitch_texts
 from usecases.model.dto import Document
 from usecases.storage import PDFConverter
 from usecases.vector_db import VectorDBUsecases
+from qdrant_client import QdrantClient, models
 from vector_database.vectore_store import (
     LlamaIndexVectorStore,
     LlamaIndexVectorStoreConfig,
     LlamaIndexVectorStoreSession,
     NodeSplitter,
     NodeSplitterConfig,
+    QdrantCollectionConfig,
+    QdrantCollectionManager,
+    QdrantQuantization,
+    QuantizedSearchClient,
 )
 
 USER_DUMMY_ID = "dummy_id"
@@ -52,11 +63,16 @@ collection = "qdrant_collection"
 embedding_mode = "nomic-ai/nomic-embed-text-v2-moe"
 chunk_size = 128
 chunk_overlap = 32
+parent_chunk_size = 0
+auto_merge_ratio = 0.5
+neighbor_window = 0
 
 top_n_count_dens = 5
 top_n_count_sparse = 5
 top_n_count_reranker = 5
 device = "mps"
+embedding_batch_size = 32
+embedding_max_latency = 0.01
 ollama_url = "http://127.0.0.1:11434"
 llm_model = "llama3.2"
 timeout = 60.0
@@ -71,10 +87,17 @@ def create_usecases(
     """
     Setup usecase with correct config
     """
-    LlamaIndexVectorStoreSession.init_database(config=config_v_db)
+    embedding = create_embedding(config_llm)
+    LlamaIndexVectorStoreSession.init_database(
+        config=config_v_db,
+        collection_config=QdrantCollectionConfig(
+            vector_size=embedding_dimension(embedding)
+        ),
+    )
     LLamaIndexHolder.create(
         vector_store=LlamaIndexVectorStoreSession.get_instance().get_database(),
         config=config_llm,
+        embedding=embedding,
     )
     VectorDBUsecases.create(
         vector_db=LlamaIndexVectorStore(
@@ -111,6 +134,7 @@ def run_test_with_qdrant(handle_msg: Callable):
             top_n_count_reranker=top_n_count_reranker,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
+                parent_chunk_size=parent_chunk_size,
             device=device,
         )
 
@@ -119,6 +143,10 @@ def run_test_with_qdrant(handle_msg: Callable):
             top_n_count_dens=top_n_count_dens,
             top_n_count_sparse=top_n_count_sparse,
             top_n_count_reranker=top_n_count_reranker,
+            auto_merge_ratio=auto_merge_ratio,
+            neighbor_window=neighbor_window,
+            embedding_batch_size=embedding_batch_size,
+            embedding_max_latency=embedding_max_latency,
             ollama_url=ollama_url,
             llm_model=llm_model,
             timeout=timeout,
@@ -204,3 +232,206 @@ class TestVectorDB(unittest.TestCase):
             assert result.is_error()
 
         run_test_with_qdrant(run)
+
+    def test_attach_and_delete_shared_document(self):
+        def ask(file_id: str):
+            return AskLLMUsecase.Instance().run(
+                messages=[
+                    Message(
+                        role="user",
+                        content="What information do you have access to?",
+                        timestamp=get_posix_timestamp(),
+                    )
+                ],
+                model=llm_model,
+                filters={"file_id": [file_id]},
+            )
+
+        def run():
+            doc = Document(
+                id="file_a",
+                content=doc_content,
+                metadata={"file_id": "file_a", "course_id": "course_a"},
+            )
+            result = VectorDBUsecases.Instance().store_doc(doc)
+            assert result.is_ok()
+
+            # the copy only references the nodes of the first file
+            result = VectorDBUsecases.Instance().attach_doc(
+                file_id="file_a", new_file_id="file_b", course_id="course_b"
+            )
+            assert result.is_ok()
+            assert ask("file_b").is_ok()
+
+            # shared nodes stay for the copy
+            result = VectorDBUsecases.Instance().delete_doc(file_id="file_a")
+            assert result.is_ok()
+            assert ask("file_a").is_error()
+            assert ask("file_b").is_ok()
+
+            result = VectorDBUsecases.Instance().delete_doc(file_id="file_b")
+            assert result.is_ok()
+            assert ask("file_b").is_error()
+
+            result = VectorDBUsecases.Instance().attach_doc(
+                file_id="file_b", new_file_id="file_c", course_id=None
+            )
+            assert result.is_error()
+
+        run_test_with_qdrant(run)
+
+    def test_replace_document_without_duplicates(self):
+        def count_points() -> int:
+            client = LlamaIndexVectorStoreSession.get_instance().get_qdrant_client()
+            return client.count(collection_name=collection).count
+
+        def run():
+            doc = Document(
+                id="file_a",
+                content=[],
+                metadata={"file_id": "file_a", "course_id": "course_a"},
+            )
+            pages = ["mein Toller Text " * 20, "noch mehr Text " * 20]
+            result = VectorDBUsecases.Instance().replace_doc(doc, batches=[pages])
+            assert result.is_ok()
+            stored = count_points()
+
+            # storing the same file again overwrites its points
+            result = VectorDBUsecases.Instance().replace_doc(doc, batches=[pages])
+            assert result.is_ok()
+            assert count_points() == stored
+
+            # nodes of the removed page are deleted
+            result = VectorDBUsecases.Instance().replace_doc(doc, batches=[pages[:1]])
+            assert result.is_ok()
+            assert count_points() < stored
+
+        run_test_with_qdrant(run)
+
+
+class TestCollectionManager(unittest.TestCase):
+    def test_payload_indexes_and_parameters(self):
+        with QdrantContainer(image="qdrant/qdrant:v1.12.6") as qdrant_container:
+            client = QdrantClient(
+                host=qdrant_container.get_container_host_ip(),
+                port=int(qdrant_container.get_exposed_port(6333)),
+            )
+            QdrantCollectionManager(
+                client=client,
+                collection=collection,
+                config=QdrantCollectionConfig(vector_size=8),
+            ).ensure_collection()
+            info = client.get_collection(collection)
+            for key in ["file_id", "course_id", "content_hash"]:
+                assert key in info.payload_schema
+            assert info.config.hnsw_config.m == 16
+
+            # an existing collection gets the changed parameters
+            QdrantCollectionManager(
+                client=client,
+                collection=collection,
+                config=QdrantCollectionConfig(vector_size=8, hnsw_m=32),
+            ).ensure_collection()
+            assert client.get_collection(collection).config.hnsw_config.m == 32
+
+    def test_quantization_and_on_disk_storage(self):
+        with QdrantContainer(image="qdrant/qdrant:v1.12.6") as qdrant_container:
+            client = QdrantClient(
+                host=qdrant_container.get_container_host_ip(),
+                port=int(qdrant_container.get_exposed_port(6333)),
+            )
+            QdrantCollectionManager(
+                client=client,
+                collection=collection,
+                config=QdrantCollectionConfig(
+                    vector_size=8,
+                    quantization=QdrantQuantization.scalar,
+                    on_disk=True,
+                    on_disk_payload=True,
+                ),
+            ).ensure_collection()
+            info = client.get_collection(collection)
+            quantization = info.config.quantization_config
+            assert isinstance(quantization, models.ScalarQuantization)
+            assert info.config.params.vectors["text-dense"].on_disk  # type: ignore
+            assert info.config.params.on_disk_payload
+
+            # an existing collection gets the changed quantization
+            QdrantCollectionManager(
+                client=client,
+                collection=collection,
+                config=QdrantCollectionConfig(
+                    vector_size=8, quantization=QdrantQuantization.binary
+                ),
+            ).ensure_collection()
+            info = client.get_collection(collection)
+            quantization = info.config.quantization_config
+            assert isinstance(quantization, models.BinaryQuantization)
+            assert not info.config.params.on_disk_payload
+
+    def test_vector_size_of_another_model(self):
+        with QdrantContainer(image="qdrant/qdrant:v1.12.6") as qdrant_container:
+            client = QdrantClient(
+                host=qdrant_container.get_container_host_ip(),
+                port=int(qdrant_container.get_exposed_port(6333)),
+            )
+            QdrantCollectionManager(
+                client=client,
+                collection=collection,
+                config=QdrantCollectionConfig(vector_size=8),
+            ).ensure_collection()
+
+            with self.assertRaises(RuntimeError):
+                QdrantCollectionManager(
+                    client=client,
+                    collection=collection,
+                    config=QdrantCollectionConfig(vector_size=16),
+                ).ensure_collection()
+            vectors = client.get_collection(collection).config.params.vectors
+            assert vectors["text-dense"].size == 8  # type: ignore
+
+    def test_search_params_are_added_to_dense_searches(self):
+        class RecordingClient:
+            def search_batch(self, collection_name, requests):
+                return requests
+
+        search_params = QdrantCollectionManager(
+            client=None,  # type: ignore
+            collection=collection,
+            config=QdrantCollectionConfig(
+                vector_size=8, quantization=QdrantQuantization.binary, oversampling=3.0
+            ),
+        ).search_params()
+        assert search_params is not None
+        dense, sparse = QuantizedSearchClient(
+            RecordingClient(), search_params
+        ).search_batch(
+            collection_name=collection,
+            requests=[
+                models.SearchRequest(
+                    vector=models.NamedVector(name="text-dense", vector=[1.0]),
+                    limit=10,
+                ),
+                models.SearchRequest(
+                    vector=models.NamedSparseVector(
+                        name="text-sparse-new",
+                        vector=models.SparseVector(indices=[1], values=[1.0]),
+                    ),
+                    limit=10,
+                ),
+            ],
+        )
+        assert dense.params.quantization.oversampling == 3.0
+        assert sparse.params is None
+
+
+class TestNeighborExpansion(unittest.TestCase):
+    def test_stitch_overlapping_chunks(self):
+        first = "Der erste Teil endet mit einer Überlappung von einigen Wörtern"
+        second = "Überlappung von einigen Wörtern und geht dann weiter."
+        assert stitch_texts(first, second) == (
+            "Der erste Teil endet mit einer Überlappung von einigen Wörtern"
+            " und geht dann weiter."
+        )
+        # chunks without overlap are joined
+        assert stitch_texts("erster Teil", "zweiter Teil") == "erster Teil\nzweiter Teil"